@@ -37,10 +37,12 @@
 #     readonly_fields = ['effective_date', 'updated_at']
 
 from django.contrib import admin
+from django.db.models import Subquery
+from django.utils import timezone
 from django.utils.html import format_html
 from unfold.admin import ModelAdmin
 from unfold.decorators import display
-from .models import Banner, ProductCategory, Product, Price
+from .models import Banner, ProductCategory, Product, Price, Job
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 from django.contrib.auth.admin import GroupAdmin as BaseGroupAdmin
 from django.contrib.auth.models import User, Group
@@ -134,8 +136,8 @@ class BannerAdmin(ModelAdmin):
     """Beautiful admin for Banner with image preview"""
     
     # List view configuration
-    list_display = ['name', 'image_preview', 'active_badge', 'created_at', 'updated_at']
-    list_filter = ['active', 'created_at']
+    list_display = ['name', 'image_preview', 'active_badge', 'starts_at', 'ends_at', 'created_at', 'updated_at']
+    list_filter = ['active', 'starts_at', 'ends_at', 'created_at']
     search_fields = ['name']
     list_editable = []
     readonly_fields = ['created_at', 'updated_at', 'image_preview_large']
@@ -150,6 +152,10 @@ class BannerAdmin(ModelAdmin):
             'fields': ('image', 'image_preview_large'),
             'description': 'Upload banner image (recommended size: 1920x1080px)'
         }),
+        ('Schedule', {
+            'fields': ('starts_at', 'ends_at'),
+            'description': 'Optional campaign window; active banners outside it are not shown'
+        }),
         ('Timestamps', {
             'fields': ('created_at', 'updated_at'),
             'classes': ('collapse',),  # Collapsible section
@@ -177,24 +183,33 @@ class BannerAdmin(ModelAdmin):
             )
         return format_html('<span style="color: #999;">No image uploaded</span>')
     
-    @display(description="Status", label={"active": "success", "inactive": "danger"})
+    @display(description="Status", label={"active": "success", "scheduled": "info", "ended": "warning", "inactive": "danger"})
     def active_badge(self, obj):
         """Show active status with colored badge"""
-        return "active" if obj.active else "inactive"
+        now = timezone.now()
+        if not obj.active:
+            return "inactive"
+        if obj.starts_at and obj.starts_at > now:
+            return "scheduled"
+        if obj.ends_at and obj.ends_at <= now:
+            return "ended"
+        return "active"
 
 
 @admin.register(ProductCategory)
 class ProductCategoryAdmin(ModelAdmin):
     """Beautiful admin for Product Categories"""
     
-    list_display = ['category', 'slug', 'product_count', 'created_at']
+    list_display = ['category', 'slug', 'parent', 'product_count', 'created_at']
     search_fields = ['category', 'slug']
     readonly_fields = ['slug', 'created_at', 'updated_at']
+    autocomplete_fields = ['parent']
+    list_select_related = ['parent']
     
     # Form layout
     fieldsets = (
         ('Category Information', {
-            'fields': ('category', 'slug'),
+            'fields': ('category', 'slug', 'parent'),
             'description': 'Slug is auto-generated from category name'
         }),
         ('Timestamps', {
@@ -203,13 +218,12 @@ class ProductCategoryAdmin(ModelAdmin):
         }),
     )
     
-    @display(description="Products")
+    @display(description="Products", ordering='product_count')
     def product_count(self, obj):
         """Show count of products in this category"""
-        count = obj.products.count()
         return format_html(
             '<span style="background: #f3f4f6; padding: 4px 12px; border-radius: 12px; font-weight: 500;">{} products</span>',
-            count
+            obj.product_count
         )
 
 
@@ -319,17 +333,47 @@ class PriceAdmin(ModelAdmin):
             f'{silver_price_formatted:,.2f}'
         )
     
+    def get_queryset(self, request):
+        # Look up the latest entry once in the changelist query instead of once per row
+        latest = Price.objects.order_by('-effective_date').values('id')[:1]
+        return super().get_queryset(request).annotate(latest_id=Subquery(latest))
+
     @display(description="Status", label={"current": "success", "old": "secondary"}, boolean=True)
     def is_current(self, obj):
         """Check if this is the latest price entry"""
-        latest = Price.objects.order_by('-effective_date').first()
-        return obj.id == latest.id if latest else False
+        return obj.id == obj.latest_id
     
     class Meta:
         verbose_name = "Price Entry"
         verbose_name_plural = "Gold & Silver Prices"
 
 
+@admin.register(Job)
+class JobAdmin(ModelAdmin):
+    """Read-only view of the background job queue"""
+
+    list_display = ['task', 'status_badge', 'priority', 'attempts', 'run_after', 'finished_at']
+    list_filter = ['status', 'task']
+    search_fields = ['task']
+    # Newest first by primary key: the finished history is only listed here, so the
+    # queue table does not carry an index over all rows just for this page
+    ordering = ['-id']
+    readonly_fields = [
+        'task', 'payload', 'priority', 'status', 'attempts', 'max_attempts', 'run_after',
+        'locked_until', 'last_error', 'created_at', 'started_at', 'finished_at',
+    ]
+
+    @display(description="Status", label={
+        "queued": "info", "running": "warning", "done": "success", "failed": "danger",
+    })
+    def status_badge(self, obj):
+        """Show job status with colored badge"""
+        return obj.status
+
+    def has_add_permission(self, request):
+        return False
+
+
 # Optional: Customize admin site header
 admin.site.site_header = "Siva Jewellery Administration"
 admin.site.site_title = "Siva Jewellery Admin"
@@ -0,0 +1,95 @@
+"""
+Live banners, cached in memory until the next schedule boundary.
+
+A banner is live while `active` is set and the current time falls inside its
+optional [starts_at, ends_at) window. One query over the active banners that
+have not ended yet (served by banner_schedule_idx) yields both the live set
+and the next moment it changes: the earliest future starts_at or ends_at.
+Requests read the cached set until that moment, so banners switch exactly on
+time without a query per homepage hit.
+
+Saves and deletes bump a version key in the Django cache once they commit,
+and every read compares it with the version its set was built from. With a
+shared cache backend (Redis, Memcached) all processes switch immediately;
+with the default per-process local-memory cache, changes made by other
+processes are picked up after at most BANNER_CACHE_MAX_AGE seconds.
+"""
+import threading
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Banner
+
+
+def compute(now=None):
+    """Return (live banners newest first, next schedule boundary or None)"""
+    now = now or timezone.now()
+    candidates = (
+        Banner.objects.filter(active=True)
+        .filter(Q(ends_at__isnull=True) | Q(ends_at__gt=now))
+        .order_by()  # Meta.ordering would add a sort the partial index cannot serve
+    )
+    live, boundaries = [], []
+    for banner in candidates:
+        if banner.starts_at and banner.starts_at > now:
+            boundaries.append(banner.starts_at)
+            continue
+        live.append(banner)
+        if banner.ends_at:
+            boundaries.append(banner.ends_at)
+    # The set is small; sorting here keeps the query on the partial index
+    live.sort(key=lambda banner: (banner.created_at, banner.pk), reverse=True)
+    return live, min(boundaries, default=None)
+
+
+class ActiveBannerSet:
+    """Per-process cache of the live banners, invalidated through a shared version key"""
+
+    version_key = 'adminapp.banners.version'
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._cached = None  # (banners, valid_until, version)
+        self._generation = 0
+
+    @property
+    def _cache(self):
+        return caches[getattr(settings, 'BANNER_CACHE', 'default')]
+
+    def get(self):
+        now = timezone.now()
+        version = self._cache.get(self.version_key)
+        cached = self._cached
+        if cached is not None and now < cached[1] and version == cached[2]:
+            return cached[0]
+
+        generation = self._generation
+        banners, boundary = compute(now)
+        valid_until = now + timedelta(seconds=getattr(settings, 'BANNER_CACHE_MAX_AGE', 60))
+        if boundary is not None:
+            valid_until = min(valid_until, boundary)
+        with self._lock:
+            # A save that committed while we were reading makes this result stale
+            if generation == self._generation:
+                self._cached = (banners, valid_until, version)
+        return banners
+
+    def invalidate(self):
+        # A fresh token rather than incr(): it works on every backend, and an
+        # evicted key reads as None, which only costs one extra query
+        self._cache.set(self.version_key, uuid.uuid4().hex, None)
+        with self._lock:
+            self._generation += 1
+            self._cached = None
+
+    def invalidate_on_commit(self):
+        transaction.on_commit(self.invalidate)
+
+
+active_banners = ActiveBannerSet()
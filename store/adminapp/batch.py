@@ -0,0 +1,320 @@
+"""
+Transactional batch writes for products and categories.
+
+Each batch is validated as a whole: field validation runs per item without
+touching the database, then uniqueness and foreign keys are checked with one
+query per rule for the whole batch. If any item fails, nothing is written and
+the errors are returned per item index. Valid batches are applied with
+bulk_create, bulk_update or one queryset delete inside a single transaction,
+so a batch of up to BATCH_MAX_SIZE items costs a handful of queries instead
+of one request and transaction per item. The in-memory typeahead and
+similarity indexes are patched once per batch after the commit, so their
+cost never holds the transaction open.
+"""
+from collections import Counter
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import ProtectedError, Q
+from django.db.models.signals import post_save
+from django.utils import timezone
+from django.utils.text import slugify
+
+from . import counters, similarity, suggest, sync
+from .models import Product, ProductCategory
+from .serializers import ProductBatchItemSerializer, ProductCategoryBatchItemSerializer
+
+
+class BatchError(Exception):
+    """Raised with per-item errors when a batch is rejected"""
+
+    def __init__(self, errors):
+        super().__init__(errors)
+        self.errors = errors
+
+
+class _Errors:
+    """Per-item error collector keyed by the item's index in the batch"""
+
+    def __init__(self):
+        self.by_index = {}
+
+    def add(self, index, field, message):
+        self.by_index.setdefault(index, {}).setdefault(field, []).append(message)
+
+    def raise_if_any(self):
+        if self.by_index:
+            raise BatchError([
+                {'index': index, 'errors': errors} for index, errors in sorted(self.by_index.items())
+            ])
+
+
+def _validate_items(items, serializer_class, partial, errors):
+    """Run field validation on every item and return (index, validated_data) pairs"""
+    if not isinstance(items, list):
+        raise BatchError([{'index': None, 'errors': {'non_field_errors': ["Expected a list of items."]}}])
+    max_size = getattr(settings, 'BATCH_MAX_SIZE', 500)
+    if len(items) > max_size:
+        raise BatchError([{'index': None, 'errors': {
+            'non_field_errors': [f"A batch may contain at most {max_size} items."]
+        }}])
+
+    valid = []
+    for index, item in enumerate(items):
+        serializer = serializer_class(data=item, partial=partial)
+        if not serializer.is_valid():
+            errors.by_index[index] = serializer.errors
+            continue
+        if partial and 'id' not in serializer.validated_data:
+            errors.add(index, 'id', "This field is required.")
+            continue
+        valid.append((index, serializer.validated_data))
+    return valid
+
+
+def _check_duplicates(valid, field, errors):
+    seen = {}
+    for index, data in valid:
+        value = data.get(field)
+        if value is None:
+            continue
+        if value in seen:
+            errors.add(index, field, f"Duplicate {field} in batch (also at index {seen[value]}).")
+        else:
+            seen[value] = index
+
+
+def _load_targets(model, valid, errors, queryset=None):
+    """Fetch the rows an update or delete batch refers to with one query"""
+    _check_duplicates(valid, 'id', errors)
+    if queryset is None:
+        queryset = model.objects.all()
+    existing = queryset.in_bulk([data['id'] for _, data in valid])
+    for index, data in valid:
+        if data['id'] not in existing:
+            errors.add(index, 'id', f"No {model._meta.verbose_name} with id {data['id']}.")
+    return existing
+
+
+def _check_categories(valid, errors):
+    """Resolve category ids for every item with one query"""
+    category_ids = {data['category'] for _, data in valid if 'category' in data}
+    categories = ProductCategory.objects.in_bulk(category_ids)
+    for index, data in valid:
+        if 'category' in data and data['category'] not in categories:
+            errors.add(index, 'category', f"Invalid pk \"{data['category']}\" - object does not exist.")
+    return categories
+
+
+def _send_post_save(model, objs, created):
+    """
+    bulk_create/bulk_update skip signals; send them so caches and indexes stay in sync.
+    _apply runs writes inside _collect_index_changes(), so the receivers' index
+    updates are buffered and applied once per batch after the commit
+    """
+    for obj in objs:
+        post_save.send(sender=model, instance=obj, created=created, update_fields=None, raw=False, using=obj._state.db)
+
+
+@contextmanager
+def _collect_index_changes():
+    with suggest.collect(), similarity.collect():
+        yield
+
+
+def _apply(write):
+    """Run the write in a transaction and turn constraint races into batch errors"""
+    try:
+        with transaction.atomic(), _collect_index_changes():
+            return write()
+    except ProtectedError as exc:  # A subclass of IntegrityError, so it is caught first
+        protected = sorted({str(obj) for obj in exc.protected_objects})[:10]
+        raise BatchError([{'index': None, 'errors': {
+            'non_field_errors': ["Some rows are still referenced: " + ', '.join(protected)]
+        }}])
+    except IntegrityError as exc:
+        raise BatchError([{'index': None, 'errors': {'non_field_errors': [str(exc)]}}])
+
+
+def create_products(items):
+    errors = _Errors()
+    valid = _validate_items(items, ProductBatchItemSerializer, False, errors)
+    _check_duplicates(valid, 'product_id', errors)
+    categories = _check_categories(valid, errors)
+    taken = set(Product.objects.filter(
+        product_id__in=[data['product_id'] for _, data in valid]
+    ).values_list('product_id', flat=True))
+    for index, data in valid:
+        if data['product_id'] in taken:
+            errors.add(index, 'product_id', "A product with this product_id already exists.")
+    errors.raise_if_any()
+
+    products = []
+    for _, data in valid:
+        data.pop('id', None)
+        data['category'] = categories[data['category']]
+        products.append(Product(**data))
+
+    def write():
+        Product.objects.bulk_create(products)
+        counters.adjust(Counter(product.category_id for product in products))
+        _send_post_save(Product, products, True)
+        return products
+    return _apply(write)
+
+
+def update_products(items):
+    errors = _Errors()
+    valid = _validate_items(items, ProductBatchItemSerializer, True, errors)
+    existing = _load_targets(Product, valid, errors, Product.objects.select_related('category'))
+    categories = _check_categories(valid, errors)
+
+    # product_id must stay unique across the batch and the rows outside it
+    final_ids = [(index, data.get('product_id', getattr(existing.get(data['id']), 'product_id', None)))
+                 for index, data in valid]
+    _check_duplicates([(index, {'product_id': value}) for index, value in final_ids], 'product_id', errors)
+    taken = set(Product.objects.filter(
+        product_id__in=[value for _, value in final_ids if value]
+    ).exclude(pk__in=list(existing)).values_list('product_id', flat=True))
+    for index, value in final_ids:
+        if value in taken:
+            errors.add(index, 'product_id', "A product with this product_id already exists.")
+    errors.raise_if_any()
+
+    now = timezone.now()
+    fields = {'updated_at'}
+    products = []
+    for _, data in valid:
+        product = existing[data.pop('id')]
+        if 'category' in data:
+            data['category'] = categories[data['category']]
+        for field, value in data.items():
+            setattr(product, field, value)
+        product.updated_at = now
+        fields.update(data)
+        products.append(product)
+
+    def write():
+        # Count moves against the stored categories, locked so concurrent moves wait
+        stored = dict(Product.objects.select_for_update().filter(pk__in=[product.pk for product in products])
+                      .values_list('pk', 'category_id'))
+        moves = Counter()
+        for product in products:
+            previous = stored.get(product.pk)
+            product._loaded_category_id = previous
+            if previous is not None and product.category_id != previous:
+                moves[product.category_id] += 1
+                moves[previous] -= 1
+        Product.objects.bulk_update(products, sorted(fields))
+        counters.adjust(moves)
+        _send_post_save(Product, products, False)
+        for product in products:
+            product._loaded_category_id = product.category_id
+        return products
+    return _apply(write)
+
+
+def delete_rows(model, items):
+    """Delete rows given as a list of ids or {"id": ...} objects"""
+    errors = _Errors()
+    if isinstance(items, list):
+        items = [item if isinstance(item, dict) else {'id': item} for item in items]
+    serializer_class = ProductBatchItemSerializer if model is Product else ProductCategoryBatchItemSerializer
+    valid = _validate_items(items, serializer_class, True, errors)
+    existing = _load_targets(model, valid, errors)
+    errors.raise_if_any()
+
+    def write():
+        with sync.collect_tombstones(), counters.collect():
+            model.objects.filter(pk__in=list(existing)).delete()
+        return len(existing)
+    return _apply(write)
+
+
+def _check_category_names(valid, errors):
+    for _, data in valid:
+        data['slug'] = slugify(data['category'])
+    _check_duplicates(valid, 'category', errors)
+    _check_duplicates(valid, 'slug', errors)
+    names = [data['category'] for _, data in valid]
+    slugs = [data['slug'] for _, data in valid]
+    clashes = ProductCategory.objects.filter(Q(category__in=names) | Q(slug__in=slugs))
+    taken_names, taken_slugs = set(), set()
+    for name, slug in clashes.values_list('category', 'slug'):
+        taken_names.add(name)
+        taken_slugs.add(slug)
+    for index, data in valid:
+        if data.get('category') in taken_names:
+            errors.add(index, 'category', "Product Category with this category already exists.")
+        elif data.get('slug') in taken_slugs:
+            errors.add(index, 'category', f"Product Category with slug '{data['slug']}' already exists.")
+
+
+def _check_parents(valid, errors):
+    """Resolve parent ids for every item with one query; parents must already exist"""
+    parent_ids = {data['parent'] for _, data in valid if data.get('parent') is not None}
+    parents = ProductCategory.objects.in_bulk(parent_ids)
+    for index, data in valid:
+        if data.get('parent') is not None and data['parent'] not in parents:
+            errors.add(index, 'parent', f"Invalid pk \"{data['parent']}\" - object does not exist.")
+    return parents
+
+
+def create_categories(items):
+    errors = _Errors()
+    valid = _validate_items(items, ProductCategoryBatchItemSerializer, False, errors)
+    _check_category_names(valid, errors)
+    parents = _check_parents(valid, errors)
+    errors.raise_if_any()
+
+    categories = [
+        ProductCategory(category=data['category'], slug=data['slug'], parent=parents.get(data.get('parent')))
+        for _, data in valid
+    ]
+
+    def write():
+        ProductCategory.objects.bulk_create(categories)
+        # Paths include the new primary keys, so they are filled in with a second statement
+        for category in categories:
+            category.path = f"{category.parent.path if category.parent else ''}{category.pk}/"
+            category._loaded_parent_id = category.parent_id
+        ProductCategory.objects.bulk_update(categories, ['path'])
+        _send_post_save(ProductCategory, categories, True)
+        return categories
+    return _apply(write)
+
+
+def update_categories(items):
+    errors = _Errors()
+    valid = _validate_items(items, ProductCategoryBatchItemSerializer, True, errors)
+    existing = _load_targets(ProductCategory, valid, errors)
+    names = [(index, {'category': data['category']}) for index, data in valid if 'category' in data]
+    _check_duplicates(names, 'category', errors)
+    clashes = set(ProductCategory.objects.filter(
+        category__in=[data['category'] for _, data in names]
+    ).exclude(pk__in=list(existing)).values_list('category', flat=True))
+    for index, data in names:
+        if data['category'] in clashes:
+            errors.add(index, 'category', "Product Category with this category already exists.")
+    for index, data in valid:
+        if 'parent' in data:
+            # Moves rewrite whole subtrees; they go through the single-category endpoint
+            errors.add(index, 'parent', "Categories cannot be moved in a batch; update them one at a time.")
+    errors.raise_if_any()
+
+    now = timezone.now()
+    categories = []
+    for _, data in valid:
+        category = existing[data['id']]
+        if 'category' in data:
+            # Renaming keeps the existing slug, like ProductCategory.save()
+            category.category = data['category']
+        category.updated_at = now
+        categories.append(category)
+
+    def write():
+        ProductCategory.objects.bulk_update(categories, ['category', 'updated_at'])
+        _send_post_save(ProductCategory, categories, False)
+        return categories
+    return _apply(write)
@@ -0,0 +1,68 @@
+"""
+Denormalized product counts on categories.
+
+ProductCategory.product_count is kept in step with the products table by
+relative F() updates in the same transaction as the product write, so
+concurrent writers never overwrite each other's changes. Product.save and
+the Product post_delete signal report their changes here; bulk writes in
+adminapp.batch report whole batches. Inside collect(), changes are summed
+and applied at the end of the block with one UPDATE per distinct delta.
+`recount` rebuilds the column from the products table if it ever drifts.
+"""
+import threading
+from collections import Counter
+from contextlib import contextmanager
+
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Now
+
+from .models import Product, ProductCategory
+
+_buffer = threading.local()
+
+
+def _apply(deltas):
+    by_delta = {}
+    for category_id, delta in deltas.items():
+        if delta and category_id is not None:
+            by_delta.setdefault(delta, []).append(category_id)
+    for delta, category_ids in by_delta.items():
+        # Bump updated_at so the sync feed hands out the new counts
+        ProductCategory.objects.filter(pk__in=category_ids).update(
+            product_count=F('product_count') + delta, updated_at=Now()
+        )
+
+
+def adjust(deltas):
+    """Apply {category_id: change in product count}, or buffer it inside collect()"""
+    pending = getattr(_buffer, 'pending', None)
+    if pending is not None:
+        pending.update(deltas)
+    else:
+        _apply(deltas)
+
+
+@contextmanager
+def collect():
+    """Sum the count changes made inside the block and apply them together"""
+    _buffer.pending = Counter()
+    try:
+        yield
+        _apply(_buffer.pending)
+    finally:
+        _buffer.pending = None
+
+
+def drifted():
+    """Categories whose stored count does not match their products"""
+    return ProductCategory.objects.annotate(actual=Count('products')).exclude(product_count=F('actual'))
+
+
+def recount(category_ids=None):
+    """Recompute product_count from the products table in one UPDATE; returns rows updated"""
+    counts = (Product.objects.filter(category=OuterRef('pk')).order_by()
+              .values('category').annotate(count=Count('pk')).values('count'))
+    categories = ProductCategory.objects.all()
+    if category_ids is not None:
+        categories = categories.filter(pk__in=category_ids)
+    return categories.update(product_count=Coalesce(Subquery(counts), 0), updated_at=Now())
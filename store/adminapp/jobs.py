@@ -0,0 +1,166 @@
+"""
+Database-backed background job queue.
+
+Jobs are rows in the `Job` table. Workers claim them with
+`SELECT ... FOR UPDATE SKIP LOCKED` so several `runjobs` processes can share
+the table without a separate broker. A claimed job stays invisible to other
+workers until its visibility timeout expires, after which it is picked up
+again and counted as a new attempt, unless it has used up its attempts: then
+the worker most likely died running it, and it is marked failed. Results are only recorded by the worker
+holding the latest claim, and finished jobs are pruned after JOB_RETENTION
+seconds.
+"""
+import importlib
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import Job
+
+_registry = {}
+
+
+def task(func):
+    """Register a function so it can be run by the job worker"""
+    _registry[f"{func.__module__}.{func.__name__}"] = func
+    return func
+
+
+def get_task(name):
+    """Resolve a task name to its registered function"""
+    if name not in _registry:
+        # Importing the module runs its @task decorators
+        importlib.import_module(name.rsplit('.', 1)[0])
+    try:
+        return _registry[name]
+    except KeyError:
+        raise LookupError(f"Task '{name}' is not registered.") from None
+
+
+def enqueue(task_name, payload=None, priority=0, delay=None, max_attempts=3, run_after=None):
+    """Add a job to the queue and return it; it runs after `delay` seconds or at `run_after`"""
+    if callable(task_name):
+        task_name = f"{task_name.__module__}.{task_name.__name__}"
+    if run_after is None:
+        run_after = timezone.now()
+        if delay:
+            run_after += timedelta(seconds=delay)
+    return Job.objects.create(
+        task=task_name,
+        payload=payload or {},
+        priority=priority,
+        run_after=run_after,
+        max_attempts=max_attempts,
+    )
+
+
+def claim(limit, visibility_timeout):
+    """Lock up to `limit` runnable jobs for this worker and mark them running"""
+    now = timezone.now()
+    expired = Q(status=Job.STATUS_RUNNING, locked_until__lt=now)
+    runnable = (
+        Q(status=Job.STATUS_QUEUED, run_after__lte=now)
+        | expired & Q(attempts__lt=F('max_attempts'))
+    )
+    with transaction.atomic():
+        Job.objects.filter(expired, attempts__gte=F('max_attempts')).update(
+            status=Job.STATUS_FAILED, finished_at=now, locked_until=None,
+            last_error="The last attempt did not finish within its visibility timeout.",
+        )
+        jobs = list(
+            Job.objects.select_for_update(skip_locked=True)
+            .filter(runnable)
+            .order_by('-priority', 'run_after', 'id')[:limit]
+        )
+        for job in jobs:
+            job.status = Job.STATUS_RUNNING
+            job.attempts += 1
+            job.started_at = now
+            job.locked_until = now + timedelta(seconds=visibility_timeout)
+        Job.objects.bulk_update(jobs, ['status', 'attempts', 'started_at', 'locked_until'])
+    return jobs
+
+
+def run(task_name, payload):
+    """Execute a task in the current process and return its result"""
+    return get_task(task_name)(**payload)
+
+
+def _record(job, **fields):
+    """
+    Save a run's outcome only if `job` is still this worker's claim. A job that
+    outlived its visibility timeout may have been claimed again, and the newer
+    run owns the row; returns False when the result was discarded
+    """
+    updated = Job.objects.filter(pk=job.pk, status=Job.STATUS_RUNNING, attempts=job.attempts).update(**fields)
+    if updated:
+        for field, value in fields.items():
+            setattr(job, field, value)
+    return bool(updated)
+
+
+def release(claimed):
+    """Put claimed jobs that were never started back in the queue without using up an attempt"""
+    for job in claimed:
+        _record(job, status=Job.STATUS_QUEUED, attempts=job.attempts - 1, locked_until=None)
+
+
+def mark_done(job):
+    """Record a successful run"""
+    return _record(job, status=Job.STATUS_DONE, finished_at=timezone.now(), locked_until=None, last_error='')
+
+
+def mark_failed(job, error):
+    """Record a failed run and schedule a retry with exponential backoff"""
+    now = timezone.now()
+    if job.attempts < job.max_attempts:
+        return _record(job, status=Job.STATUS_QUEUED, run_after=now + timedelta(seconds=2 ** job.attempts),
+                       locked_until=None, last_error=error)
+    return _record(job, status=Job.STATUS_FAILED, finished_at=now, locked_until=None, last_error=error)
+
+
+def prune(now=None):
+    """Delete done and failed jobs that finished more than JOB_RETENTION seconds ago"""
+    cutoff = (now or timezone.now()) - timedelta(seconds=getattr(settings, 'JOB_RETENTION', 7 * 86400))
+    deleted, _ = Job.objects.filter(
+        status__in=[Job.STATUS_DONE, Job.STATUS_FAILED], finished_at__lt=cutoff
+    ).delete()
+    return deleted
+
+
+class LatencyStats:
+    """Collects queue wait and run time samples for reporting"""
+
+    def __init__(self):
+        self.wait = []
+        self.run = []
+        self.done = 0
+        self.failed = 0
+
+    def record(self, job, ok, run_seconds):
+        self.wait.append((job.started_at - job.run_after).total_seconds())
+        self.run.append(run_seconds)
+        if ok:
+            self.done += 1
+        else:
+            self.failed += 1
+
+    @staticmethod
+    def _percentile(samples, pct):
+        ordered = sorted(samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+    def summary(self):
+        if not self.run:
+            return "no jobs processed"
+        parts = [f"done={self.done}", f"failed={self.failed}"]
+        for label, samples in (('wait', self.wait), ('run', self.run)):
+            parts.append(
+                f"{label} p50={self._percentile(samples, 50) * 1000:.1f}ms "
+                f"p95={self._percentile(samples, 95) * 1000:.1f}ms "
+                f"max={max(samples) * 1000:.1f}ms"
+            )
+        return ' | '.join(parts)
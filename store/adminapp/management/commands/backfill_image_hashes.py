@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+
+from adminapp import similarity
+from adminapp.models import Product
+
+
+class Command(BaseCommand):
+    help = "Compute perceptual hashes for product images that do not have one yet"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true',
+                            help="Recompute every hash, not only missing ones")
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        products = Product.objects.order_by('pk')
+        if not options['all']:
+            products = products.filter(image1_hash__isnull=True).exclude(image1='') | \
+                products.filter(image2_hash__isnull=True, image2__isnull=False).exclude(image2='')
+
+        batch, updated = [], 0
+        for product in products.iterator(chunk_size=options['batch_size']):
+            product._hashed_images = ('', '')  # Force hashing of every image
+            similarity.hash_product(product)
+            batch.append(product)
+            if len(batch) >= options['batch_size']:
+                updated += Product.objects.bulk_update(batch, list(similarity.HASH_FIELDS.values()))
+                batch = []
+        if batch:
+            updated += Product.objects.bulk_update(batch, list(similarity.HASH_FIELDS.values()))
+        self.stdout.write(self.style.SUCCESS(f"Hashed images of {updated} products"))
@@ -0,0 +1,76 @@
+import logging
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+
+# The single flat stack every request went through before PathScopedMiddleware
+# plus the access log, which runs outermost in both stacks
+FLAT_MIDDLEWARE = [
+    'store.middleware.AccessLogMiddleware',
+    'corsheaders.middleware.CorsMiddleware',
+    'django.middleware.security.SecurityMiddleware',
+    'django.contrib.sessions.middleware.SessionMiddleware',
+    'django.middleware.common.CommonMiddleware',
+    'django.middleware.csrf.CsrfViewMiddleware',
+    'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'django.contrib.messages.middleware.MessageMiddleware',
+    'django.middleware.clickjacking.XFrameOptionsMiddleware',
+]
+
+
+class Command(BaseCommand):
+    help = "Compare per-request cost of the flat middleware stack with the path-scoped one"
+
+    def add_arguments(self, parser):
+        parser.add_argument('paths', nargs='*', default=['/api/', '/api/categories/'],
+                            help="Request paths to benchmark")
+        parser.add_argument('--requests', type=int, default=2000,
+                            help="Requests per path and stack")
+        parser.add_argument('--session-cookie', action='store_true',
+                            help="Send a session cookie, as browsers that visited the admin do")
+
+    def handle(self, *args, **options):
+        stacks = [('flat', FLAT_MIDDLEWARE), ('scoped', settings.MIDDLEWARE)]
+        host = next((h for h in settings.ALLOWED_HOSTS if h[0] not in '*.'), 'localhost')
+        extra = {}
+        if options['session_cookie']:
+            # Sent on every request; the session middleware would otherwise expire it after one
+            extra['HTTP_COOKIE'] = f"{settings.SESSION_COOKIE_NAME}={'x' * 32}"
+
+        # Both stacks still time and count queries for every request; the thousands of
+        # access records that would follow on stdout are not emitted
+        access_logger = logging.getLogger('store.access')
+        access_logger.disabled, was_disabled = True, access_logger.disabled
+        try:
+            self.run(options, stacks, host, extra)
+        finally:
+            access_logger.disabled = was_disabled
+
+    def run(self, options, stacks, host, extra):
+        for path in options['paths']:
+            results = {}
+            for label, middleware in stacks:
+                # Thousands of requests from one client would otherwise be throttled
+                unthrottled = {**settings.REST_FRAMEWORK, 'DEFAULT_THROTTLE_RATES': {}}
+                with override_settings(MIDDLEWARE=middleware, REST_FRAMEWORK=unthrottled):
+                    client = Client(SERVER_NAME=host)
+                    client.get(path, **extra)  # Load the middleware chain and warm caches
+                    with CaptureQueriesContext(connection) as queries:
+                        started = time.perf_counter()
+                        for _ in range(options['requests']):
+                            client.get(path, **extra)
+                        elapsed = time.perf_counter() - started
+                results[label] = (elapsed / options['requests'], len(queries) / options['requests'])
+
+            flat, scoped = results['flat'], results['scoped']
+            self.stdout.write(self.style.MIGRATE_HEADING(path))
+            for label, (per_request, query_count) in results.items():
+                self.stdout.write(f"  {label:<7} {per_request * 1e6:9.1f}us/request  {query_count:.2f} queries/request")
+            self.stdout.write(self.style.SUCCESS(
+                f"  saved   {(flat[0] - scoped[0]) * 1e6:9.1f}us/request "
+                f"({(1 - scoped[0] / flat[0]) * 100:.1f}%)"
+            ))
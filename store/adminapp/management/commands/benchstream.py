@@ -0,0 +1,91 @@
+import hashlib
+import tracemalloc
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.core.signals import request_started
+from django.db import transaction
+from django.test import Client, override_settings
+
+from adminapp.models import Product, ProductCategory
+
+
+class Rollback(Exception):
+    pass
+
+
+def _rss_kb(field):
+    try:
+        with open('/proc/self/status') as fh:
+            for line in fh:
+                if line.startswith(field + ':'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def _reset_peak_rss():
+    """Reset VmHWM so it tracks the peak of the next request only (Linux)"""
+    try:
+        with open('/proc/self/clear_refs', 'w') as fh:
+            fh.write('5')
+        return True
+    except OSError:
+        return False
+
+
+class Command(BaseCommand):
+    help = "Compare peak memory of the regular and the streamed product list as the row count grows"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, nargs='+', default=[1000, 5000, 20000],
+                            help="Product counts to measure (seeded and rolled back afterwards)")
+
+    def handle(self, *args, **options):
+        # The typeahead index would read the uncommitted seed data from another thread
+        request_started.disconnect(dispatch_uid='adminapp.warm_suggest_index')
+        unthrottled = {**settings.REST_FRAMEWORK, 'DEFAULT_THROTTLE_RATES': {}}
+        host = next((h for h in settings.ALLOWED_HOSTS if h[0] not in '*.'), 'localhost')
+        client = Client(SERVER_NAME=host)
+
+        try:
+            with transaction.atomic(), override_settings(REST_FRAMEWORK=unthrottled):
+                category = ProductCategory.objects.create(category="Stream benchmark", slug='stream-benchmark')
+                path = f'/api/products/?category={category.pk}'
+                seeded = 0
+                self.stdout.write(f"{'rows':>8} {'mode':<8} {'heap peak':>12} {'RSS growth':>12} {'bytes':>12}")
+                for rows in sorted(options['rows']):
+                    Product.objects.bulk_create(
+                        (Product(product_id=f"STREAM{i:08d}", product_name=f"Stream product {i}",
+                                 category=category, size='M', image1='products/stream.jpg')
+                         for i in range(seeded, rows)),
+                        batch_size=2000,
+                    )
+                    seeded = rows
+                    results = {}
+                    for mode, url in (('stream', path + '&stream=1'), ('regular', path)):
+                        results[mode] = self.measure(client, url)
+                        body_size, heap, rss = results[mode][1:]
+                        rss_text = f"{rss / 1024:.1f}MB" if rss is not None else 'n/a'
+                        self.stdout.write(f"{rows:>8} {mode:<8} {heap / 1048576:>10.1f}MB {rss_text:>12} {body_size:>12}")
+                    if results['stream'][0] != results['regular'][0]:
+                        self.stderr.write(f"  streamed output differs from the regular list at {rows} rows")
+                raise Rollback
+        except Rollback:
+            pass
+
+    def measure(self, client, url):
+        """Run one request, consuming a streamed body piece by piece; return (digest, size, heap peak, RSS growth)"""
+        tracked_rss = _reset_peak_rss()
+        baseline = _rss_kb('VmRSS')
+        tracemalloc.start()
+        response = client.get(url)
+        digest, size = hashlib.sha256(), 0
+        for piece in (response.streaming_content if response.streaming else [response.content]):
+            digest.update(piece)
+            size += len(piece)
+        _, heap_peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        rss_growth = _rss_kb('VmHWM') - baseline if tracked_rss and baseline is not None else None
+        return digest.hexdigest(), size, heap_peak, rss_growth
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from adminapp import uploads
+
+
+class Command(BaseCommand):
+    help = "Delete chunked uploads older than CHUNKED_UPLOAD_EXPIRY and orphaned partial files"
+
+    def handle(self, *args, **options):
+        deleted, removed = uploads.expire()
+        self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} expired uploads and {removed} partial files"))
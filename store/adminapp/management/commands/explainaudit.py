@@ -0,0 +1,191 @@
+import re
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.core.signals import request_started
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+
+from adminapp.models import Banner, Price, Product, ProductCategory
+from adminapp.suggest import index as suggest_index
+
+# (path, tables that must be read through an index) for every API route and admin
+# changelist. Paths are formatted with a seeded category and one of its products.
+# Full lists, contains-searches and the in-memory indexes' loads read whole tables
+# by design, so they list no tables; their queries are still checked for sorts.
+ROUTES = [
+    ('/api/', []),
+    ('/api/categories/', []),
+    ('/api/categories/?search=audit', []),
+    ('/api/categories/tree/', []),
+    ('/api/categories/{slug}/', ['adminapp_productcategory']),
+    ('/api/products/', []),
+    ('/api/products/?search=audit', []),
+    ('/api/products/?ordering=product_name&category={id}', ['adminapp_product']),
+    ('/api/products/{product}/', ['adminapp_product']),
+    ('/api/products/{product}/similar/', []),
+    ('/api/products/latest_featured/', ['adminapp_product']),
+    ('/api/products/by-category/{slug}/', ['adminapp_product', 'adminapp_productcategory']),
+    ('/api/products/by-category/{slug}/?descendants=1', ['adminapp_product', 'adminapp_productcategory']),
+    ('/api/products/?category={id}', ['adminapp_product']),
+    ('/api/products/?size=S7', ['adminapp_product']),
+    ('/api/banners/', []),
+    ('/api/banners/active_banners/', ['adminapp_banner']),
+    ('/api/banners/?active=true', ['adminapp_banner']),
+    ('/api/prices/', []),
+    ('/api/prices/latest/', ['adminapp_price']),
+    ('/api/suggestions/?q=audit', []),
+    ('/api/sync/?limit=100', ['adminapp_productcategory', 'adminapp_product', 'adminapp_price',
+                              'adminapp_banner', 'adminapp_tombstone']),
+    ('/admin/adminapp/banner/', ['adminapp_banner']),
+    ('/admin/adminapp/productcategory/', ['adminapp_productcategory']),
+    ('/admin/adminapp/product/', ['adminapp_product']),
+    ('/admin/adminapp/product/?category__id__exact={id}', ['adminapp_product']),
+    ('/admin/adminapp/price/', ['adminapp_price']),
+    # Walks the primary key backwards, which SQLite reports as a plain SCAN
+    ('/admin/adminapp/job/', []),
+    ('/admin/auth/user/', []),
+    ('/admin/auth/group/', []),
+]
+
+# Whole-table aggregates (changelist counts, filter choices) scan by design
+AGGREGATE = re.compile(r'^SELECT (COUNT\(|DISTINCT )', re.IGNORECASE)
+
+PROBLEMS = {
+    'postgresql': [
+        (re.compile(r'Seq Scan on (\w+)'), "sequential scan on {}"),
+        (re.compile(r'^\s*(?:->\s*)?Sort\b', re.MULTILINE), "sort"),
+    ],
+    'sqlite': [
+        (re.compile(r'SCAN (\w+)$', re.MULTILINE), "full scan of {}"),
+        (re.compile(r'USE TEMP B-TREE FOR (?:RIGHT PART OF )?ORDER BY'), "sort"),
+    ],
+}
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = "EXPLAIN the queries of every API route and admin changelist and fail on scans or sorts that should use an index"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=50000,
+                            help="Products to seed (rolled back afterwards)")
+        parser.add_argument('--no-seed', action='store_true',
+                            help="Audit the existing data instead of seeding")
+        parser.add_argument('--verbose-plans', action='store_true',
+                            help="Print every plan, not only failing ones")
+
+    def handle(self, *args, **options):
+        if connection.vendor not in PROBLEMS:
+            raise CommandError(f"EXPLAIN checks are not implemented for {connection.vendor}.")
+        # The typeahead index would read the uncommitted seed data from another thread
+        request_started.disconnect(dispatch_uid='adminapp.warm_suggest_index')
+
+        failures = []
+        try:
+            with transaction.atomic():
+                if options['no_seed']:
+                    category = ProductCategory.objects.filter(products__isnull=False).first()
+                else:
+                    category = self.seed(options['products'])
+                failures = self.audit(category, options['verbose_plans'])
+                raise Rollback
+        except Rollback:
+            pass
+
+        if failures:
+            raise CommandError(f"{len(failures)} queries do not use the expected index:\n" + '\n'.join(failures))
+        self.stdout.write(self.style.SUCCESS("All audited queries use indexes."))
+
+    def seed(self, count):
+        self.stdout.write(f"Seeding {count} products...")
+        categories = ProductCategory.objects.bulk_create(
+            ProductCategory(category=f"Audit category {i}", slug=f"audit-category-{i}") for i in range(50)
+        )
+        # Nest the rest under the first category so subtree queries have something to find
+        for category in categories:
+            parent = categories[0] if category is not categories[0] else None
+            category.parent = parent
+            category.path = f"{parent.path if parent else ''}{category.pk}/"
+        ProductCategory.objects.bulk_update(categories, ['parent', 'path'])
+        Product.objects.bulk_create(
+            (Product(
+                product_id=f"AUDIT{i:07d}",
+                product_name=f"Audit product {i}",
+                category=categories[i % len(categories)],
+                size=f"S{i % 50}",
+                image1='products/audit.jpg',
+            ) for i in range(count)),
+            batch_size=2000,
+        )
+        # Old campaigns pile up; only a few banners are active at a time
+        Banner.objects.bulk_create(
+            Banner(name=f"Audit banner {i}", image='banners/audit.jpg', active=i % 50 == 0)
+            for i in range(max(count // 10, 1000))
+        )
+        Price.objects.bulk_create(
+            (Price(gold_price=6000 + i % 100, silver_price=75) for i in range(max(count // 5, 1000))),
+            batch_size=2000,
+        )
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+        return categories[0]
+
+    def audit(self, category, verbose):
+        user = get_user_model().objects.create_superuser('explain-audit', 'audit@example.com', None)
+        host = next((h for h in settings.ALLOWED_HOSTS if h[0] not in '*.'), 'localhost')
+        client = Client(SERVER_NAME=host)
+        client.force_login(user)
+
+        # Load the typeahead index here rather than from a background thread on the first request
+        with CaptureQueriesContext(connection) as queries:
+            suggest_index.rebuild()
+        failures = self.check_queries('typeahead index load', queries, [], verbose)
+
+        product = Product.objects.filter(category=category).first() if category else None
+        for route, tables in ROUTES:
+            path = route.format(slug=getattr(category, 'slug', ''), id=getattr(category, 'pk', 0),
+                                product=getattr(product, 'pk', 0))
+            with CaptureQueriesContext(connection) as queries:
+                response = client.get(path)
+            if response.status_code >= 500:
+                failures.append(f"{path}: HTTP {response.status_code}")
+                continue
+            failures += self.check_queries(path, queries, tables, verbose)
+        return failures
+
+    def check_queries(self, label, queries, tables, verbose):
+        """EXPLAIN every row-returning query; sorts always fail, scans only on `tables`"""
+        self.stdout.write(self.style.MIGRATE_HEADING(f"{label} ({len(queries)} queries)"))
+        failures = []
+        for query in queries:
+            sql = query['sql']
+            if not sql.startswith('SELECT') or AGGREGATE.match(sql):
+                continue
+            plan = self.explain(sql)
+            problems = self.problems(plan, tables)
+            if verbose or problems:
+                self.stdout.write(f"  {sql[:200]}\n    " + plan.replace('\n', '\n    '))
+            for problem in problems:
+                failures.append(f"{label}: {problem} in {sql[:200]}")
+        return failures
+
+    def explain(self, sql):
+        prefix = 'EXPLAIN QUERY PLAN ' if connection.vendor == 'sqlite' else 'EXPLAIN '
+        with connection.cursor() as cursor:
+            cursor.execute(prefix + sql)
+            return '\n'.join(str(row[-1]) for row in cursor.fetchall())
+
+    def problems(self, plan, tables):
+        found = []
+        for pattern, message in PROBLEMS[connection.vendor]:
+            for match in pattern.finditer(plan):
+                table = match.group(1) if match.groups() else None
+                if table is None or table in tables:
+                    found.append(message.format(table))
+        return found
@@ -0,0 +1,75 @@
+import os
+import subprocess
+import sys
+from collections import defaultdict
+
+from django.core.management.base import BaseCommand, CommandError
+
+# Boots Django the way a worker does: settings, app registry, WSGI handler and URLconf
+BOOT_SCRIPT = """
+import resource, time
+started = time.perf_counter()
+from django.core.wsgi import get_wsgi_application
+from django.urls import get_resolver
+application = get_wsgi_application()
+get_resolver().url_patterns
+elapsed = time.perf_counter() - started
+try:
+    # Peak RSS of this image. ru_maxrss survives exec(), so it would report
+    # this command's own footprint when that is larger than the worker's.
+    with open('/proc/self/status') as status:
+        rss_kb = next(int(line.split()[1]) for line in status if line.startswith('VmHWM:'))
+except OSError:
+    rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(f"{elapsed:.6f} {rss_kb}")
+"""
+
+
+class Command(BaseCommand):
+    help = "Report per-module import cost, startup time and memory of a worker boot"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--settings-module', action='append', dest='settings_modules',
+                            help="Settings module to boot (repeat to compare; default: current)")
+        parser.add_argument('--top', type=int, default=15,
+                            help="Number of most expensive packages to list")
+        parser.add_argument('--max-ms', type=float,
+                            help="Fail if any profile takes longer than this to boot")
+
+    def handle(self, *args, **options):
+        modules = options['settings_modules'] or [os.environ['DJANGO_SETTINGS_MODULE']]
+        failures = []
+        for module in modules:
+            elapsed, rss_kb, packages = self.profile(module)
+            self.stdout.write(self.style.MIGRATE_HEADING(
+                f"{module}: boot {elapsed * 1000:.1f}ms, max RSS {rss_kb / 1024:.1f}MiB"
+            ))
+            ranked = sorted(packages.items(), key=lambda item: item[1], reverse=True)
+            for package, self_us in ranked[:options['top']]:
+                self.stdout.write(f"  {self_us / 1000:8.1f}ms  {package}")
+            if options['max_ms'] is not None and elapsed * 1000 > options['max_ms']:
+                failures.append(f"{module} booted in {elapsed * 1000:.1f}ms")
+
+        if failures:
+            raise CommandError(f"Startup budget of {options['max_ms']}ms exceeded: " + '; '.join(failures))
+
+    def profile(self, settings_module):
+        """Boot a fresh interpreter and aggregate its self import time per top-level package"""
+        env = {**os.environ, 'DJANGO_SETTINGS_MODULE': settings_module}
+        result = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', BOOT_SCRIPT],
+            env=env, capture_output=True, text=True,
+        )
+        if result.returncode != 0:
+            raise CommandError(f"Booting {settings_module} failed:\n{result.stderr[-2000:]}")
+
+        packages = defaultdict(int)
+        for line in result.stderr.splitlines():
+            # Format: "import time: <self us> | <cumulative us> | <indented module>"
+            if not line.startswith('import time:') or 'self [us]' in line:
+                continue
+            self_us, _, name = line[len('import time:'):].split('|')
+            packages[name.strip().split('.')[0]] += int(self_us)
+
+        elapsed, rss_kb = result.stdout.split()[-2:]
+        return float(elapsed), int(rss_kb), packages
@@ -0,0 +1,115 @@
+import json
+import queue
+import signal
+import threading
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DatabaseError
+from django.utils import timezone
+
+from adminapp import rates
+
+_END = object()
+
+
+class Command(BaseCommand):
+    help = "Ingest gold/silver rate ticks from a feed, writing coalesced batches of Price rows"
+
+    def add_arguments(self, parser):
+        parser.add_argument('source',
+                            help="Feed to read: a file or named pipe, '-' for stdin, tcp://host:port or unix:///path")
+        parser.add_argument('--interval', type=float, default=1.0,
+                            help="Seconds between batched writes")
+        parser.add_argument('--latest-only', action='store_true',
+                            help="Write only the last rate of each interval instead of every change")
+        parser.add_argument('--stats-interval', type=float, default=60.0,
+                            help="Seconds between lag reports")
+        parser.add_argument('--replay', action='store_true',
+                            help="Treat the source as a recorded feed: keep its pacing, stamp ticks with the current time")
+        parser.add_argument('--speed', type=float, default=1.0,
+                            help="Replay speed multiplier; 0 replays as fast as possible")
+        parser.add_argument('--record', metavar='PATH',
+                            help="Append every valid tick to PATH as JSON lines, for later replay")
+
+    def handle(self, *args, **options):
+        try:
+            lines = rates.open_source(options['source'])
+        except OSError as exc:
+            raise CommandError(f"Cannot open {options['source']}: {exc}")
+
+        self.stopping = False
+        signal.signal(signal.SIGTERM, self._stop)
+        signal.signal(signal.SIGINT, self._stop)
+
+        stats = rates.LagStats()
+        coalescer = rates.Coalescer(stats, latest_only=options['latest_only'])
+        record = open(options['record'], 'a', encoding='utf-8') if options['record'] else None
+        ticks = queue.Queue()
+        reader = threading.Thread(target=self._read, args=(lines, options, ticks, stats), daemon=True)
+        reader.start()
+
+        interval = options['interval']
+        next_flush = time.monotonic() + interval
+        last_report = time.monotonic()
+        finished = False
+        try:
+            while not finished and not self.stopping:
+                # Take ticks until the flush is due; the reader never waits on the database
+                try:
+                    item = ticks.get(timeout=max(0.0, next_flush - time.monotonic()))
+                except queue.Empty:
+                    item = None
+                if item is _END:
+                    finished = True
+                elif item is not None:
+                    coalescer.add(item)
+                    if record:
+                        record.write(json.dumps({'ts': item.ts.isoformat(), 'gold': str(item.gold),
+                                                 'silver': str(item.silver)}) + '\n')
+                if finished or time.monotonic() >= next_flush:
+                    try:
+                        coalescer.flush()
+                    except DatabaseError as exc:
+                        # The ticks stay buffered and go out with the next flush
+                        self.stderr.write(f"Write failed, retrying next interval: {exc}")
+                    next_flush = time.monotonic() + interval
+                if time.monotonic() - last_report >= options['stats_interval']:
+                    self.stdout.write(stats.summary())
+                    stats.reset_lag()
+                    last_report = time.monotonic()
+        finally:
+            coalescer.flush()
+            if record:
+                record.close()
+        self.stdout.write(self.style.SUCCESS(stats.summary()))
+
+    def _read(self, lines, options, ticks, stats):
+        """Reader thread: parse lines as they arrive and queue the ticks"""
+        def invalid(line, exc):
+            stats.invalid += 1
+            self.stderr.write(f"Skipping tick: {exc}")
+
+        try:
+            if options['replay']:
+                source = rates.replay(lines, options['speed'], on_invalid=invalid)
+            else:
+                source = (self._parse(line, invalid) for line in lines if line.strip())
+            for tick in source:
+                if tick is not None:
+                    ticks.put(tick)
+                if self.stopping:
+                    break
+        finally:
+            ticks.put(_END)
+
+    def _parse(self, line, invalid):
+        try:
+            return rates.parse_tick(line, timezone.now())
+        except ValueError as exc:
+            invalid(line, exc)
+            return None
+
+    def _stop(self, signum, frame):
+        self.stdout.write("Writing buffered ticks before exit...")
+        self.stopping = True
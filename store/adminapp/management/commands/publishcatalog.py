@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from adminapp import snapshots
+
+
+class Command(BaseCommand):
+    help = "Regenerate every static JSON snapshot of the public catalog"
+
+    def handle(self, *args, **options):
+        if not snapshots.enabled():
+            raise CommandError("Set CATALOG_SNAPSHOT_ROOT to enable catalog snapshots.")
+        count = snapshots.publish_all()
+        self.stdout.write(self.style.SUCCESS(
+            f"Published catalog snapshots for {count} categories to {snapshots.root()}"
+        ))
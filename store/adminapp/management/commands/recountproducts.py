@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from adminapp import counters
+
+
+class Command(BaseCommand):
+    help = "Recompute ProductCategory.product_count from the products table"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true',
+                            help="Only report categories whose stored count is wrong")
+        parser.add_argument('--all', action='store_true',
+                            help="Recount every category, not only the ones that drifted")
+
+    def handle(self, *args, **options):
+        drifted = list(counters.drifted().values_list('pk', 'category', 'product_count', 'actual'))
+        for _, name, stored, actual in drifted:
+            self.stdout.write(f"{name}: stored {stored}, actual {actual}")
+        if options['dry_run']:
+            self.stdout.write(f"{len(drifted)} categories have a wrong product count")
+            return
+        updated = counters.recount(None if options['all'] else [pk for pk, *_ in drifted])
+        self.stdout.write(self.style.SUCCESS(f"Recounted products of {updated} categories"))
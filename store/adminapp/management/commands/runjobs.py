@@ -0,0 +1,136 @@
+import multiprocessing
+import signal
+import time
+import traceback
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+import django
+from django.core.management.base import BaseCommand
+
+PRUNE_INTERVAL = 3600  # Seconds between deletions of old finished jobs and sync tombstones
+
+
+def _init_worker():
+    """Set up Django in a freshly spawned pool process"""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    django.setup()
+
+
+def _execute(task_name, payload):
+    """Run one job inside a pool process and return (error, run time)"""
+    # Imported here because pool processes unpickle this function before django.setup()
+    from adminapp import jobs
+
+    started = time.perf_counter()
+    try:
+        jobs.run(task_name, payload)
+        error = None
+    except Exception:
+        error = traceback.format_exc()
+    return error, time.perf_counter() - started
+
+
+class Command(BaseCommand):
+    help = "Run queued background jobs in a process pool"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=multiprocessing.cpu_count(),
+                            help="Number of pool processes (default: CPU count)")
+        parser.add_argument('--visibility-timeout', type=int, default=300,
+                            help="Seconds before a claimed job is handed to another worker")
+        parser.add_argument('--poll-interval', type=float, default=1.0,
+                            help="Seconds to wait when the queue is empty")
+        parser.add_argument('--stats-interval', type=float, default=60.0,
+                            help="Seconds between latency reports")
+        parser.add_argument('--once', action='store_true',
+                            help="Exit once the queue is drained")
+
+    def handle(self, *args, **options):
+        from adminapp import jobs, sync
+
+        self.stopping = False
+        signal.signal(signal.SIGTERM, self._stop)
+        signal.signal(signal.SIGINT, self._stop)
+
+        processes = options['processes']
+        stats = jobs.LatencyStats()
+        inflight = {}
+        last_report = time.monotonic()
+        next_prune = time.monotonic()
+
+        pool = self._new_pool(processes)
+        broken = False
+        try:
+            while not (self.stopping and not inflight):
+                if broken:
+                    # A broken executor refuses new work and fails everything still in it
+                    self.stderr.write("A pool process died; restarting the pool")
+                    for future in wait(inflight).done:
+                        self._finish(jobs, stats, future, inflight.pop(future))
+                    pool.shutdown(wait=False)
+                    pool, broken = self._new_pool(processes), False
+
+                # Keep a small backlog per process so no process idles between polls
+                free = processes * 2 - len(inflight)
+                if free > 0 and not self.stopping:
+                    claimed = jobs.claim(free, options['visibility_timeout'])
+                    for index, job in enumerate(claimed):
+                        try:
+                            inflight[pool.submit(_execute, job.task, job.payload)] = job
+                        except BrokenProcessPool:
+                            # The rest go back to the queue without using up an attempt
+                            jobs.release(claimed[index:])
+                            broken = True
+                            break
+
+                if not inflight:
+                    if broken:
+                        continue
+                    if options['once']:
+                        break
+                    time.sleep(options['poll_interval'])
+                    continue
+
+                done, _ = wait(inflight, timeout=options['poll_interval'], return_when=FIRST_COMPLETED)
+                for future in done:
+                    broken |= self._finish(jobs, stats, future, inflight.pop(future))
+
+                if time.monotonic() - last_report >= options['stats_interval']:
+                    self.stdout.write(stats.summary())
+                    last_report = time.monotonic()
+                if time.monotonic() >= next_prune:
+                    jobs.prune()
+                    sync.prune_tombstones()
+                    next_prune = time.monotonic() + PRUNE_INTERVAL
+        finally:
+            pool.shutdown()
+
+        self.stdout.write(self.style.SUCCESS(stats.summary()))
+
+    @staticmethod
+    def _new_pool(processes):
+        context = multiprocessing.get_context('spawn')
+        return ProcessPoolExecutor(processes, mp_context=context, initializer=_init_worker)
+
+    def _finish(self, jobs, stats, future, job):
+        """Record the outcome of a finished future; returns True if its pool process died"""
+        exception = future.exception()
+        if exception is not None:
+            # The pool process died. Every job still in the pool fails with it and may be
+            # retried; the one that killed it stops at max_attempts
+            error, run_seconds = repr(exception), 0.0
+        else:
+            error, run_seconds = future.result()
+        stats.record(job, error is None, run_seconds)  # Before a retry moves run_after
+        recorded = jobs.mark_done(job) if error is None else jobs.mark_failed(job, error)
+        if not recorded:
+            self.stderr.write(f"{job} outlived its visibility timeout and was claimed again; "
+                              f"result of attempt {job.attempts} discarded")
+        elif error is not None:
+            self.stderr.write(f"{job} failed:\n{error}")
+        return isinstance(exception, BrokenProcessPool)
+
+    def _stop(self, signum, frame):
+        self.stdout.write("Finishing running jobs before exit...")
+        self.stopping = True
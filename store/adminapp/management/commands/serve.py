@@ -0,0 +1,353 @@
+import gc
+import mmap
+import os
+import random
+import signal
+import socket
+import struct
+import sys
+import time
+from wsgiref.simple_server import WSGIRequestHandler, WSGIServer
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.urls import get_resolver
+from django.utils.module_loading import import_string
+
+from store import logs
+
+# Per-worker slot in the shared stats page: pid, requests served, start time
+SLOT = struct.Struct('qqd')
+LISTEN_FD_ENV = 'SERVE_LISTEN_FD'
+OLD_WORKERS_ENV = 'SERVE_OLD_WORKERS'
+
+
+class WorkerStats:
+    """Request counters in an anonymous shared mapping, written by workers and read by the master"""
+
+    def __init__(self, slots):
+        self.slots = slots
+        self.mem = mmap.mmap(-1, SLOT.size * slots)
+
+    def claim(self, index, pid):
+        SLOT.pack_into(self.mem, index * SLOT.size, pid, 0, time.time())
+
+    def increment(self, index):
+        # Only the worker owning the slot writes its counter, so no lock is needed
+        offset = index * SLOT.size
+        pid, requests, started = SLOT.unpack_from(self.mem, offset)
+        SLOT.pack_into(self.mem, offset, pid, requests + 1, started)
+        return requests + 1
+
+    def read(self, index):
+        return SLOT.unpack_from(self.mem, index * SLOT.size)
+
+
+def memory(pid):
+    """Return (RSS, PSS) of a process in bytes; PSS splits shared pages between their users"""
+    values = {}
+    try:
+        with open(f'/proc/{pid}/smaps_rollup') as fh:
+            for line in fh:
+                key, _, rest = line.partition(':')
+                if key in ('Rss', 'Pss'):
+                    values[key] = int(rest.split()[0]) * 1024
+    except OSError:
+        return 0, 0
+    return values.get('Rss', 0), values.get('Pss', 0)
+
+
+class _QuietHandler(WSGIRequestHandler):
+    def log_message(self, format, *args):
+        pass  # Requests are logged by store.middleware.AccessLogMiddleware
+
+
+class _WorkerServer(WSGIServer):
+    """
+    wsgiref server that handles one connection at a time. Accepted sockets get a
+    read/write timeout, so an idle or stalled client is dropped instead of
+    blocking the worker indefinitely. wsgiref speaks HTTP/1.0 without keep-alive
+    and is not hardened against hostile clients: it is meant for development and
+    for running behind a buffering reverse proxy, never for direct exposure.
+    """
+    connection_timeout = 30.0
+
+    def get_request(self):
+        conn, addr = super().get_request()
+        conn.settimeout(self.connection_timeout)
+        return conn, addr
+
+    def handle_error(self, request, client_address):
+        if isinstance(sys.exc_info()[1], (TimeoutError, ConnectionError)):
+            return  # Client went quiet or away; the connection is closed after this
+        super().handle_error(request, client_address)
+
+
+class Command(BaseCommand):
+    help = (
+        "Serve the site with a preloading master process and forked WSGI or ASGI workers. "
+        "WSGI mode runs the standard library's wsgiref server: HTTP/1.0, one connection per worker "
+        "and no protection against slow or hostile clients. Use it for development or behind a "
+        "buffering proxy (e.g. nginx) only; use --mode asgi (uvicorn) anywhere clients connect directly."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--bind', default='127.0.0.1:8000', help="host:port to listen on")
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+        parser.add_argument('--mode', choices=['wsgi', 'asgi'], default='wsgi',
+                            help="ASGI mode runs each worker under uvicorn, which must be installed")
+        parser.add_argument('--max-requests', type=int, default=0,
+                            help="Restart a worker after this many requests (0 disables)")
+        parser.add_argument('--max-requests-jitter', type=int, default=0,
+                            help="Add up to this many requests at random so workers do not restart together")
+        parser.add_argument('--max-memory', type=int, default=0,
+                            help="Restart a worker whose RSS exceeds this many MB (0 disables)")
+        parser.add_argument('--timeout', type=float, default=30.0,
+                            help="Seconds a WSGI worker waits on a silent client connection before dropping it")
+        parser.add_argument('--graceful-timeout', type=float, default=30.0,
+                            help="Seconds a stopping worker may spend finishing its request")
+        parser.add_argument('--stats-interval', type=float, default=60.0,
+                            help="Seconds between worker memory and request reports (0 disables)")
+        parser.add_argument('--backlog', type=int, default=2048)
+
+    def handle(self, *args, **options):
+        self.options = options
+        if options['mode'] == 'asgi':
+            try:
+                import uvicorn  # noqa: F401
+            except ImportError:
+                raise CommandError("ASGI mode needs uvicorn: pip install uvicorn")
+
+        self.sock = self._listen(options['bind'], options['backlog'])
+        self.app = self._preload(options['mode'])
+        self.stats = WorkerStats(options['workers'])
+        self.workers = {}  # pid -> slot
+        self.signals = []
+        for signum in (signal.SIGTERM, signal.SIGINT, signal.SIGHUP, signal.SIGUSR1):
+            signal.signal(signum, self._queue_signal)
+
+        for slot in range(options['workers']):
+            self._spawn(slot)
+        self._retire_previous_master_workers()
+        self.stdout.write(f"Serving {options['mode'].upper()} on {options['bind']} with {options['workers']} workers "
+                          f"(master pid {os.getpid()})")
+        if options['mode'] == 'wsgi':
+            self.stderr.write(self.style.WARNING(
+                "WSGI mode uses wsgiref (HTTP/1.0, one connection per worker): run it only for development "
+                "or behind a buffering proxy; use --mode asgi to serve clients directly."
+            ))
+        self._run_master()
+
+    def _listen(self, bind, backlog):
+        inherited = os.environ.pop(LISTEN_FD_ENV, None)
+        if inherited:
+            # Handed over by the master this process replaced on SIGHUP
+            sock = socket.socket(fileno=int(inherited))
+        else:
+            host, _, port = bind.rpartition(':')
+            try:
+                sock = socket.create_server((host or '0.0.0.0', int(port)), backlog=backlog, reuse_port=False)
+            except OSError as exc:
+                raise CommandError(f"Cannot listen on {bind}: {exc}")
+        # Workers race to accept; losers must not block inside accept()
+        sock.setblocking(False)
+        return sock
+
+    def _preload(self, mode):
+        """Import everything a request needs before forking, so workers share those pages"""
+        if mode == 'asgi':
+            app = import_string(getattr(settings, 'ASGI_APPLICATION', None) or 'store.asgi.application')
+        else:
+            app = import_string(settings.WSGI_APPLICATION)
+        resolver = get_resolver()
+        resolver.url_patterns  # Imports the URLconfs, views and serializers
+        resolver.reverse_dict  # Builds the reverse() lookup tables
+        connections.close_all()  # Children must not share the master's sockets
+        # Move everything allocated so far out of the collector's reach; otherwise the
+        # first collection in each worker writes to (and un-shares) every object page
+        gc.collect()
+        gc.freeze()
+        return app
+
+    def _spawn(self, slot):
+        pid = os.fork()
+        if pid:
+            self.workers[pid] = slot
+            return
+        # Worker process
+        try:
+            for signum in (signal.SIGHUP, signal.SIGUSR1):
+                signal.signal(signum, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.SIG_IGN)  # Ctrl-C reaches the master, which stops workers
+            random.seed()
+            self.stats.claim(slot, os.getpid())
+            limit = self.options['max_requests']
+            if limit:
+                limit += random.randint(0, self.options['max_requests_jitter'])
+            if self.options['mode'] == 'asgi':
+                self._serve_asgi(slot, limit)
+            else:
+                self._serve_wsgi(slot, limit)
+        except Exception:
+            import traceback
+            traceback.print_exc()
+            self._exit_worker(1)
+        self._exit_worker(0)
+
+    def _exit_worker(self, code):
+        # os._exit skips atexit hooks, so write out the queued log records first
+        logs.flush()
+        sys.stdout.flush()
+        os._exit(code)
+
+    def _serve_wsgi(self, slot, limit):
+        stopping = False
+
+        def stop(signum, frame):
+            nonlocal stopping
+            stopping = True
+        signal.signal(signal.SIGTERM, stop)
+
+        app, stats = self.app, self.stats
+
+        def counted(environ, start_response):
+            stats.increment(slot)
+            return app(environ, start_response)
+
+        server = _WorkerServer(self.sock.getsockname()[:2], _QuietHandler, bind_and_activate=False)
+        server.connection_timeout = self.options['timeout']
+        server.socket.close()
+        server.socket = self.sock
+        server.server_name, server.server_port = socket.getfqdn(), self.sock.getsockname()[1]
+        server.setup_environ()
+        server.set_app(counted)
+        server.timeout = 1.0  # Wake up regularly to notice SIGTERM
+        while not stopping:
+            server.handle_request()
+            if limit and stats.read(slot)[1] >= limit:
+                break
+
+    def _serve_asgi(self, slot, limit):
+        import uvicorn
+
+        app, stats = self.app, self.stats
+
+        async def counted(scope, receive, send):
+            if scope['type'] == 'http':
+                stats.increment(slot)
+            await app(scope, receive, send)
+
+        config = uvicorn.Config(
+            counted, lifespan='off', access_log=False, log_config=None,
+            limit_max_requests=limit or None,
+            timeout_graceful_shutdown=self.options['graceful_timeout'],
+        )
+        # uvicorn installs its own SIGTERM handler for a graceful shutdown
+        uvicorn.Server(config).run(sockets=[self.sock])
+
+    def _queue_signal(self, signum, frame):
+        self.signals.append(signum)
+
+    def _run_master(self):
+        interval = self.options['stats_interval']
+        next_report = time.monotonic() + interval if interval else None
+        while True:
+            time.sleep(1.0)
+            while self.signals:
+                signum = self.signals.pop(0)
+                if signum in (signal.SIGTERM, signal.SIGINT):
+                    self._shutdown()
+                    return
+                if signum == signal.SIGHUP:
+                    self._reexec()
+                if signum == signal.SIGUSR1:
+                    self._report()
+            self._reap()
+            self._check_memory()
+            if next_report and time.monotonic() >= next_report:
+                self._report()
+                next_report = time.monotonic() + interval
+
+    def _reap(self):
+        """Collect exited workers and start replacements in their slots"""
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if not pid:
+                return
+            slot = self.workers.pop(pid, None)
+            if slot is None:
+                continue  # A worker of the previous master, already replaced
+            requests = self.stats.read(slot)[1]
+            code = os.waitstatus_to_exitcode(status)
+            self.stdout.write(f"Worker {pid} exited ({code}) after {requests} requests; restarting")
+            self._spawn(slot)
+
+    def _check_memory(self):
+        limit = self.options['max_memory'] * 1024 * 1024
+        if not limit:
+            return
+        for pid in list(self.workers):
+            rss, _ = memory(pid)
+            if rss > limit:
+                self.stdout.write(f"Worker {pid} uses {rss / 1048576:.0f}MB RSS; recycling")
+                self._signal(pid, signal.SIGTERM)
+
+    def _report(self):
+        now = time.time()
+        total_pss = memory(os.getpid())[1]
+        lines = []
+        for pid, slot in sorted(self.workers.items(), key=lambda item: item[1]):
+            _, requests, started = self.stats.read(slot)
+            rss, pss = memory(pid)
+            total_pss += pss
+            lines.append(f"  worker {slot} pid={pid} requests={requests} rss={rss / 1048576:.1f}MB "
+                         f"pss={pss / 1048576:.1f}MB uptime={now - started:.0f}s")
+        self.stdout.write('\n'.join(
+            [f"{len(self.workers)} workers, total PSS {total_pss / 1048576:.1f}MB (including master)"] + lines
+        ))
+
+    def _signal(self, pid, signum):
+        try:
+            os.kill(pid, signum)
+        except ProcessLookupError:
+            pass
+
+    def _shutdown(self):
+        self.stdout.write("Stopping workers...")
+        for pid in self.workers:
+            self._signal(pid, signal.SIGTERM)
+        deadline = time.monotonic() + self.options['graceful_timeout']
+        while self.workers and time.monotonic() < deadline:
+            try:
+                pid, _ = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                break
+            if pid:
+                self.workers.pop(pid, None)
+            else:
+                time.sleep(0.1)
+        for pid in self.workers:
+            self._signal(pid, signal.SIGKILL)
+        self.sock.close()
+
+    def _reexec(self):
+        """
+        Reload code by replacing the master with a fresh copy of itself. The
+        listening socket and the current workers are handed over: the new master
+        starts its own workers, then stops the old ones, so no request is refused.
+        """
+        self.stdout.write("Reloading: starting a new master")
+        self.sock.set_inheritable(True)
+        os.environ[LISTEN_FD_ENV] = str(self.sock.fileno())
+        os.environ[OLD_WORKERS_ENV] = ','.join(str(pid) for pid in self.workers)
+        sys.stdout.flush()
+        os.execv(sys.executable, [sys.executable] + sys.argv)
+
+    def _retire_previous_master_workers(self):
+        old = os.environ.pop(OLD_WORKERS_ENV, '')
+        for pid in filter(None, old.split(',')):
+            self._signal(int(pid), signal.SIGTERM)  # Reaped by _reap as unknown children
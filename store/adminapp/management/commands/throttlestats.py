@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from adminapp import throttling
+
+
+class Command(BaseCommand):
+    help = "Show rejected request counts and bucket usage of the shared API throttle"
+
+    def handle(self, *args, **options):
+        table = throttling.table()
+        rejections = table.rejections()
+        for scope, count in sorted(rejections.items()):
+            self.stdout.write(f"{scope:<16} {count} rejected")
+        if not rejections:
+            self.stdout.write("No requests have been throttled")
+        used = sum(
+            1 for index in range(table.slots)
+            if throttling.SLOT.unpack_from(table.mem, throttling.HEADER_SIZE + index * throttling.SLOT.size)[0]
+        )
+        self.stdout.write(f"{used} of {table.slots} buckets in use")
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.8 on 2026-10-19 11:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('adminapp', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Job',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('task', models.CharField(help_text='Dotted path of the registered task to run', max_length=200)),
+                ('payload', models.JSONField(blank=True, default=dict, help_text='Keyword arguments passed to the task')),
+                ('priority', models.SmallIntegerField(default=0, help_text='Higher priority jobs run first')),
+                ('status', models.CharField(choices=[('queued', 'Queued'), ('running', 'Running'), ('done', 'Done'), ('failed', 'Failed')], default='queued', max_length=10)),
+                ('attempts', models.PositiveSmallIntegerField(default=0)),
+                ('max_attempts', models.PositiveSmallIntegerField(default=3)),
+                ('run_after', models.DateTimeField(help_text='Job is not picked up before this time')),
+                ('locked_until', models.DateTimeField(blank=True, help_text='Visibility timeout of a running job', null=True)),
+                ('last_error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'verbose_name': 'Job',
+                'verbose_name_plural': 'Jobs',
+                'ordering': ['-priority', 'run_after', 'id'],
+                'indexes': [models.Index(fields=['status', '-priority', 'run_after'], name='adminapp_jo_status_1833b1_idx'), models.Index(fields=['status', 'locked_until'], name='adminapp_jo_status_e457e0_idx')],
+            },
+        ),
+    ]
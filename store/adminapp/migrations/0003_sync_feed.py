@@ -0,0 +1,47 @@
+# Generated by Django 5.2.8 on 2026-10-19 11:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('adminapp', '0002_job'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Tombstone',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('model', models.CharField(help_text="Sync feed of the deleted row, e.g. 'products'", max_length=50)),
+                ('object_id', models.BigIntegerField(help_text='Primary key of the deleted row')),
+                ('deleted_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'Tombstone',
+                'verbose_name_plural': 'Tombstones',
+                'ordering': ['deleted_at', 'id'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='banner',
+            index=models.Index(fields=['updated_at', 'id'], name='adminapp_ba_updated_2bab7d_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='price',
+            index=models.Index(fields=['updated_at', 'id'], name='adminapp_pr_updated_949d5c_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['updated_at', 'id'], name='adminapp_pr_updated_ad20f5_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='productcategory',
+            index=models.Index(fields=['updated_at', 'id'], name='adminapp_pr_updated_9537d4_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tombstone',
+            index=models.Index(fields=['deleted_at', 'id'], name='adminapp_to_deleted_a05a76_idx'),
+        ),
+    ]
@@ -0,0 +1,60 @@
+# Generated by Django 5.2.8 on 2026-10-19 11:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('adminapp', '0003_sync_feed'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='banner',
+            name='adminapp_ba_active_9524af_idx',
+        ),
+        # The job indexes from 0002 led with status and so covered every finished job as
+        # well. Claims only read queued and expired running rows, which the partial
+        # job_queued_idx and job_running_idx below hold; the history is pruned separately.
+        migrations.RemoveIndex(
+            model_name='job',
+            name='adminapp_jo_status_1833b1_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='job',
+            name='adminapp_jo_status_e457e0_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='product',
+            name='adminapp_pr_product_e460be_idx',
+        ),
+        migrations.AddIndex(
+            model_name='banner',
+            index=models.Index(condition=models.Q(('active', True)), fields=['-created_at'], name='banner_active_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='job',
+            index=models.Index(condition=models.Q(('status', 'queued')), fields=['-priority', 'run_after', 'id'], name='job_queued_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='job',
+            index=models.Index(condition=models.Q(('status', 'running')), fields=['locked_until'], name='job_running_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='price',
+            index=models.Index(fields=['-effective_date', '-id'], name='price_effective_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['-created_at', '-id'], name='product_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['category', '-created_at', '-id'], name='product_category_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['size', '-created_at', '-id'], name='product_size_created_idx'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.8 on 2026-10-19 11:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('adminapp', '0005_upload'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='image1_hash',
+            field=models.BigIntegerField(blank=True, editable=False, help_text='Perceptual hash of image 1', null=True),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='image2_hash',
+            field=models.BigIntegerField(blank=True, editable=False, help_text='Perceptual hash of image 2', null=True),
+        ),
+    ]
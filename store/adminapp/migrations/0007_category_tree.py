@@ -0,0 +1,34 @@
+# Generated by Django 5.2.8 on 2026-10-19 11:15
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def fill_paths(apps, schema_editor):
+    # Existing categories become top-level ones
+    ProductCategory = apps.get_model('adminapp', 'ProductCategory')
+    categories = list(ProductCategory.objects.only('pk'))
+    for category in categories:
+        category.path = f"{category.pk}/"
+    ProductCategory.objects.bulk_update(categories, ['path'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('adminapp', '0006_image_hashes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='productcategory',
+            name='parent',
+            field=models.ForeignKey(blank=True, help_text='Parent category; leave empty for a top-level category', null=True, on_delete=django.db.models.deletion.PROTECT, related_name='children', to='adminapp.productcategory'),
+        ),
+        migrations.AddField(
+            model_name='productcategory',
+            name='path',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=255),
+        ),
+        migrations.RunPython(fill_paths, migrations.RunPython.noop),
+    ]
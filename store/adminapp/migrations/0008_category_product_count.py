@@ -0,0 +1,29 @@
+# Generated by Django 5.2.8 on 2026-10-19 11:18
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_products(apps, schema_editor):
+    ProductCategory = apps.get_model('adminapp', 'ProductCategory')
+    Product = apps.get_model('adminapp', 'Product')
+    counts = (Product.objects.filter(category=OuterRef('pk')).order_by()
+              .values('category').annotate(count=Count('pk')).values('count'))
+    ProductCategory.objects.update(product_count=Coalesce(Subquery(counts), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('adminapp', '0007_category_tree'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='productcategory',
+            name='product_count',
+            field=models.PositiveIntegerField(default=0, editable=False, help_text='Products directly in this category, maintained by adminapp.counters'),
+        ),
+        migrations.RunPython(count_products, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.8 on 2026-10-19 11:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('adminapp', '0008_category_product_count'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='banner',
+            name='ends_at',
+            field=models.DateTimeField(blank=True, help_text='Stop showing at this time; leave empty to show until deactivated', null=True),
+        ),
+        migrations.AddField(
+            model_name='banner',
+            name='starts_at',
+            field=models.DateTimeField(blank=True, help_text='Show from this time on; leave empty to show right away', null=True),
+        ),
+        migrations.AddIndex(
+            model_name='banner',
+            index=models.Index(condition=models.Q(('active', True)), fields=['ends_at', 'starts_at'], name='banner_schedule_idx'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.8 on 2026-10-19 11:51
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('adminapp', '0009_banner_schedule'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='product',
+            name='category',
+            field=models.ForeignKey(db_index=False, help_text='Product category', on_delete=django.db.models.deletion.PROTECT, related_name='products', to='adminapp.productcategory'),
+        ),
+    ]
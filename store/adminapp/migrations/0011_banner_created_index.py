@@ -0,0 +1,17 @@
+# Generated by Django 5.2.8 on 2026-10-19 12:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('adminapp', '0010_product_category_fk_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='banner',
+            index=models.Index(fields=['-created_at', '-id'], name='banner_created_idx'),
+        ),
+    ]
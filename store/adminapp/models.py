@@ -1,4 +1,8 @@
-from django.db import models
+import uuid
+
+from django.core.exceptions import ValidationError
+from django.db import models, transaction
+from django.db.models.functions import Concat, Substr
 from django.utils.text import slugify
 
 
@@ -7,6 +11,8 @@ class Banner(models.Model):
     name = models.CharField(max_length=200, help_text="Banner name for identification")
     image = models.ImageField(upload_to='banners/', help_text="Banner image")
     active = models.BooleanField(default=True, help_text="Whether this banner is currently active")
+    starts_at = models.DateTimeField(blank=True, null=True, help_text="Show from this time on; leave empty to show right away")
+    ends_at = models.DateTimeField(blank=True, null=True, help_text="Stop showing at this time; leave empty to show until deactivated")
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -15,9 +21,20 @@ class Banner(models.Model):
         verbose_name_plural = "Banners"
         ordering = ['-created_at']
         indexes = [
-            models.Index(fields=['active']),
+            # Default ordering; the admin changelist adds -pk as a tiebreaker
+            models.Index(fields=['-created_at', '-id'], name='banner_created_idx'),
+            # Only a few banners are active at a time; serves ?active=true
+            models.Index(fields=['-created_at'], condition=models.Q(active=True), name='banner_active_idx'),
+            # Active banners that have not ended yet; serves the live set in adminapp.banners
+            models.Index(fields=['ends_at', 'starts_at'], condition=models.Q(active=True), name='banner_schedule_idx'),
+            models.Index(fields=['updated_at', 'id']),
         ]
 
+    def clean(self):
+        super().clean()
+        if self.starts_at and self.ends_at and self.ends_at <= self.starts_at:
+            raise ValidationError({'ends_at': "End time must be after the start time."})
+
     def __str__(self):
         return self.name
 
@@ -26,6 +43,23 @@ class ProductCategory(models.Model):
     """Model for product categories with auto-generated slugs"""
     category = models.CharField(max_length=200, unique=True, help_text="Category name")
     slug = models.SlugField(max_length=200, unique=True, blank=True, help_text="URL-friendly version of category name")
+    parent = models.ForeignKey(
+        'self',
+        on_delete=models.PROTECT,
+        related_name='children',
+        blank=True,
+        null=True,
+        help_text="Parent category; leave empty for a top-level category"
+    )
+    # Materialized path of primary keys from the root, e.g. "3/17/42/". A subtree is
+    # every row whose path starts with its root's path, which one indexed LIKE finds
+    # (on Postgres the pattern must be a literal to use the varchar_pattern_ops index).
+    path = models.CharField(max_length=255, db_index=True, editable=False, blank=True)
+    product_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        help_text="Products directly in this category, maintained by adminapp.counters"
+    )
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -33,11 +67,63 @@ class ProductCategory(models.Model):
         verbose_name = "Product Category"
         verbose_name_plural = "Product Categories"
         ordering = ['category']
+        indexes = [
+            models.Index(fields=['updated_at', 'id']),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_parent_id = instance.__dict__.get('parent_id')
+        return instance
+
+    @staticmethod
+    def descendants_of(path):
+        """Categories in the subtree at `path`, its root included"""
+        return ProductCategory.objects.filter(path__startswith=path)
+
+    def _parent_path(self, lock=False):
+        """Path of the current parent; refuses parents inside this category's own subtree"""
+        if self.parent_id is None:
+            return ''
+        categories = ProductCategory.objects.select_for_update() if lock else ProductCategory.objects
+        parent_path = categories.values_list('path', flat=True).get(pk=self.parent_id)
+        if self.pk is not None and f"/{self.pk}/" in f"/{parent_path}":
+            raise ValidationError({'parent': "A category cannot be moved under itself or one of its subcategories."})
+        return parent_path
+
+    def clean(self):
+        super().clean()
+        self._parent_path()
 
     def save(self, *args, **kwargs):
         if not self.slug:
             self.slug = slugify(self.category)
-        super().save(*args, **kwargs)
+        moved = not self.path or self.parent_id != getattr(self, '_loaded_parent_id', None)
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            # The count and the path are changed by relative UPDATEs; never write back stale copies
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in ('product_count', 'path')
+            ]
+        if not moved:
+            super().save(*args, **kwargs)
+            return
+        with transaction.atomic(using=kwargs.get('using')):
+            # Locking the parent serializes concurrent moves that involve it: a move that
+            # would close a cycle waits, then sees the other move's new path (or deadlocks
+            # and is rolled back) instead of both passing the check
+            parent_path = self._parent_path(lock=True)
+            super().save(*args, **kwargs)
+            old_path, self.path = self.path, f"{parent_path}{self.pk}/"
+            if old_path:
+                # Re-root the whole subtree in one statement
+                ProductCategory.descendants_of(old_path).update(
+                    path=Concat(models.Value(self.path), Substr('path', len(old_path) + 1))
+                )
+            else:
+                ProductCategory.objects.filter(pk=self.pk).update(path=self.path)
+        self._loaded_parent_id = self.parent_id
 
     def __str__(self):
         return self.category
@@ -51,11 +137,14 @@ class Product(models.Model):
         ProductCategory, 
         on_delete=models.PROTECT, 
         related_name='products',
+        db_index=False,  # Covered by the (category, ...) indexes in Meta
         help_text="Product category"
     )
     size = models.CharField(max_length=100, blank=True, null=True, help_text="Product size (e.g., S, M, L, XL)")
     image1 = models.ImageField(upload_to='products/', help_text="Primary product image")
     image2 = models.ImageField(upload_to='products/', blank=True, null=True, help_text="Secondary product image")
+    image1_hash = models.BigIntegerField(blank=True, null=True, editable=False, help_text="Perceptual hash of image 1")
+    image2_hash = models.BigIntegerField(blank=True, null=True, editable=False, help_text="Perceptual hash of image 2")
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -63,11 +152,55 @@ class Product(models.Model):
         verbose_name = "Product"
         verbose_name_plural = "Products"
         ordering = ['-created_at']
+        # product_id is already indexed by its unique constraint
         indexes = [
-            models.Index(fields=['product_id']),
+            # Default ordering; the admin changelist adds -pk as a tiebreaker
+            models.Index(fields=['-created_at', '-id'], name='product_created_idx'),
+            models.Index(fields=['category', '-created_at', '-id'], name='product_category_created_idx'),
             models.Index(fields=['category', 'product_name']),
+            models.Index(fields=['size', '-created_at', '-id'], name='product_size_created_idx'),
+            models.Index(fields=['updated_at', 'id']),
         ]
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the stored category so saves can tell when a product moves,
+        # and the stored images so only new uploads get re-hashed
+        instance._loaded_category_id = instance.__dict__.get('category_id')
+        instance._hashed_images = (instance.__dict__.get('image1') or '', instance.__dict__.get('image2') or '')
+        return instance
+
+    def refresh_from_db(self, *args, **kwargs):
+        super().refresh_from_db(*args, **kwargs)
+        self._loaded_category_id = self.category_id
+
+    def save(self, *args, **kwargs):
+        from .counters import adjust
+
+        update_fields = kwargs.get('update_fields')
+        if not self._state.adding and update_fields is None:
+            # The image hashes are written by the hash_images job; never write back stale copies
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in ('image1_hash', 'image2_hash')
+            ]
+        if update_fields is not None and not {'category', 'category_id'} & set(update_fields):
+            super().save(*args, **kwargs)
+            return
+        with transaction.atomic(using=kwargs.get('using')):
+            previous = None
+            if not self._state.adding:
+                # The stored category, not the one this instance was loaded with: another
+                # writer may have moved the row since. The lock holds off concurrent moves.
+                previous = (Product.objects.select_for_update().filter(pk=self.pk)
+                            .values_list('category_id', flat=True).first())
+            self._loaded_category_id = previous  # Read by the snapshot receiver
+            super().save(*args, **kwargs)
+            if previous != self.category_id:
+                adjust({self.category_id: 1, previous: -1})
+        self._loaded_category_id = self.category_id
+
     def __str__(self):
         return f"{self.product_name} ({self.product_id})"
 
@@ -91,6 +224,95 @@ class Price(models.Model):
         verbose_name = "Price"
         verbose_name_plural = "Prices"
         ordering = ['-effective_date']
+        indexes = [
+            # Serves latest() and the admin changelist (-effective_date, -pk)
+            models.Index(fields=['-effective_date', '-id'], name='price_effective_idx'),
+            models.Index(fields=['updated_at', 'id']),
+        ]
 
     def __str__(self):
         return f"Gold: {self.gold_price} | Silver: {self.silver_price} (as of {self.effective_date.strftime('%Y-%m-%d')})"
+
+
+class Tombstone(models.Model):
+    """Record of a deleted catalog row so sync clients can remove their copy"""
+    model = models.CharField(max_length=50, help_text="Sync feed of the deleted row, e.g. 'products'")
+    object_id = models.BigIntegerField(help_text="Primary key of the deleted row")
+    deleted_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = "Tombstone"
+        verbose_name_plural = "Tombstones"
+        ordering = ['deleted_at', 'id']
+        indexes = [
+            models.Index(fields=['deleted_at', 'id']),
+        ]
+
+    def __str__(self):
+        return f"{self.model} #{self.object_id} deleted {self.deleted_at:%Y-%m-%d %H:%M}"
+
+
+class Job(models.Model):
+    """Model for background jobs processed by the `runjobs` worker command"""
+    STATUS_QUEUED = 'queued'
+    STATUS_RUNNING = 'running'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_QUEUED, 'Queued'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_DONE, 'Done'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+
+    task = models.CharField(max_length=200, help_text="Dotted path of the registered task to run")
+    payload = models.JSONField(default=dict, blank=True, help_text="Keyword arguments passed to the task")
+    priority = models.SmallIntegerField(default=0, help_text="Higher priority jobs run first")
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_QUEUED)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=3)
+    run_after = models.DateTimeField(help_text="Job is not picked up before this time")
+    locked_until = models.DateTimeField(blank=True, null=True, help_text="Visibility timeout of a running job")
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(blank=True, null=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        verbose_name = "Job"
+        verbose_name_plural = "Jobs"
+        ordering = ['-priority', 'run_after', 'id']
+        indexes = [
+            # Partial indexes keep only the rows a worker can claim, not the done/failed history
+            models.Index(
+                fields=['-priority', 'run_after', 'id'],
+                condition=models.Q(status='queued'),
+                name='job_queued_idx',
+            ),
+            models.Index(
+                fields=['locked_until'],
+                condition=models.Q(status='running'),
+                name='job_running_idx',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.task} #{self.pk} ({self.status})"
+
+
+class Upload(models.Model):
+    """Model for resumable chunked image uploads; received bytes live in a partial file on disk"""
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    filename = models.CharField(max_length=255, help_text="Original file name")
+    size = models.PositiveBigIntegerField(help_text="Total size of the file in bytes")
+    completed = models.BooleanField(default=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Upload"
+        verbose_name_plural = "Uploads"
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"{self.filename} ({self.size} bytes)"
@@ -0,0 +1,186 @@
+"""
+Ingestion of gold and silver rate ticks from a market feed.
+
+A feed is a stream of lines, one tick per line, either JSON
+({"gold": "6123.50", "silver": "75.20", "ts": "2026-10-19T10:00:00.250Z"})
+or CSV ("ts,gold,silver" or "gold,silver"). `ts` may be ISO 8601 or epoch
+seconds; ticks without one are stamped on arrival.
+
+The ingestrates command reads ticks on a background thread and hands them to
+a Coalescer, which drops ticks that do not change the rate and writes what is
+left with one bulk insert per flush interval. Readers only ever see the
+latest committed row, and snapshots are re-published once per flush instead
+of once per tick.
+"""
+import json
+import socket
+import sys
+import time
+from collections import namedtuple
+from datetime import datetime, timezone as dt_timezone
+from decimal import Decimal, InvalidOperation
+
+from django.db import transaction
+from django.utils import timezone
+
+from . import snapshots
+from .models import Price
+
+CENT = Decimal('0.01')
+MAX_RATE = Decimal('99999999.99')  # Price.*_price is max_digits=10, decimal_places=2
+
+Tick = namedtuple('Tick', ['gold', 'silver', 'ts', 'received'])
+
+
+def _parse_rate(value):
+    try:
+        rate = Decimal(str(value).strip()).quantize(CENT)
+    except (InvalidOperation, ValueError):
+        raise ValueError(f"Not a rate: {value!r}")
+    if not 0 < rate <= MAX_RATE:
+        raise ValueError(f"Rate out of range: {rate}")
+    return rate
+
+
+def _parse_ts(value):
+    if value in (None, ''):
+        return None
+    if isinstance(value, (int, float)) or str(value).replace('.', '', 1).isdigit():
+        return datetime.fromtimestamp(float(value), dt_timezone.utc)
+    ts = datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+    return ts if timezone.is_aware(ts) else timezone.make_aware(ts, dt_timezone.utc)
+
+
+def parse_tick(line, received=None):
+    """Parse one feed line into a Tick; raises ValueError for malformed lines"""
+    received = received or timezone.now()
+    line = line.strip()
+    if line.startswith('{'):
+        try:
+            data = json.loads(line)
+        except json.JSONDecodeError as exc:
+            raise ValueError(str(exc))
+        gold, silver, ts = data.get('gold'), data.get('silver'), data.get('ts')
+    else:
+        fields = [field.strip() for field in line.split(',')]
+        if len(fields) == 2:
+            (gold, silver), ts = fields, None
+        elif len(fields) == 3:
+            ts, gold, silver = fields
+        else:
+            raise ValueError(f"Expected 'gold,silver' or 'ts,gold,silver', got {line!r}")
+    return Tick(_parse_rate(gold), _parse_rate(silver), _parse_ts(ts) or received, received)
+
+
+def open_source(spec):
+    """
+    Return a line iterator for a feed: '-' for stdin, tcp://host:port or
+    unix:///path for a socket, anything else is a file or named pipe.
+    """
+    if spec == '-':
+        return sys.stdin
+    if spec.startswith('tcp://'):
+        host, _, port = spec[len('tcp://'):].rpartition(':')
+        return socket.create_connection((host, int(port))).makefile('r', encoding='utf-8')
+    if spec.startswith('unix://'):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.connect(spec[len('unix://'):])
+        return sock.makefile('r', encoding='utf-8')
+    return open(spec, encoding='utf-8')
+
+
+def replay(lines, speed=1.0, on_invalid=None):
+    """
+    Yield recorded ticks re-stamped with the current time, keeping the recorded
+    gaps between them divided by `speed` (0 replays as fast as possible).
+    Malformed lines are skipped and passed to `on_invalid` with their ValueError
+    """
+    first_ts = started = None
+    for line in lines:
+        if not line.strip():
+            continue
+        try:
+            tick = parse_tick(line)
+        except ValueError as exc:
+            if on_invalid:
+                on_invalid(line, exc)
+            continue
+        if speed and first_ts is not None:
+            delay = (tick.ts - first_ts).total_seconds() / speed - (time.monotonic() - started)
+            if delay > 0:
+                time.sleep(delay)
+        elif first_ts is None:
+            first_ts, started = tick.ts, time.monotonic()
+        now = timezone.now()
+        yield tick._replace(ts=now, received=now)
+
+
+class LagStats:
+    """Ingestion counters and lag from tick time to commit"""
+
+    def __init__(self):
+        self.received = 0
+        self.unchanged = 0
+        self.invalid = 0
+        self.written = 0
+        self.flushes = 0
+        self.lag = []
+
+    def summary(self):
+        parts = [
+            f"received={self.received}", f"unchanged={self.unchanged}",
+            f"invalid={self.invalid}", f"written={self.written}", f"flushes={self.flushes}",
+        ]
+        if self.lag:
+            ordered = sorted(self.lag)
+            p95 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+            parts.append(f"lag p50={ordered[len(ordered) // 2] * 1000:.0f}ms "
+                         f"p95={p95 * 1000:.0f}ms max={ordered[-1] * 1000:.0f}ms")
+        return ' | '.join(parts)
+
+    def reset_lag(self):
+        self.lag = []
+
+
+class Coalescer:
+    """Buffers rate changes between flushes and writes them in one batch"""
+
+    def __init__(self, stats, latest_only=False):
+        self.stats = stats
+        self.latest_only = latest_only
+        self.pending = []
+        latest = Price.objects.values_list('gold_price', 'silver_price').first()
+        self.last_rate = tuple(latest) if latest else None
+
+    def add(self, tick):
+        """Buffer a tick; returns False if it repeats the latest written or buffered rate"""
+        self.stats.received += 1
+        rate = (tick.gold, tick.silver)
+        if rate == self.last_rate:
+            self.stats.unchanged += 1
+            return False
+        self.last_rate = rate
+        self.pending.append(tick)
+        return True
+
+    def flush(self):
+        """Insert the buffered ticks with one bulk insert and return the rows"""
+        if not self.pending:
+            return []
+        ticks = self.pending[-1:] if self.latest_only else self.pending
+        prices = [Price(gold_price=tick.gold, silver_price=tick.silver) for tick in ticks]
+        with transaction.atomic():
+            Price.objects.bulk_create(prices)
+            # effective_date is auto_now_add, so the tick times are set afterwards
+            for price, tick in zip(prices, ticks):
+                price.effective_date = tick.ts
+            Price.objects.bulk_update(prices, ['effective_date'])
+            snapshots.schedule(snapshots.PRICES)
+        # Only dropped once written: if the insert fails they are retried on the next flush,
+        # and last_rate still describes a rate that will be written
+        self.pending = []
+        committed = timezone.now()
+        self.stats.written += len(prices)
+        self.stats.flushes += 1
+        self.stats.lag.extend((committed - tick.ts).total_seconds() for tick in ticks)
+        return prices
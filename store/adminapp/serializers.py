@@ -1,21 +1,40 @@
+import posixpath
+
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.core.files.storage import default_storage
 from rest_framework import serializers
-from .models import Banner, ProductCategory, Product, Price
+from .models import Banner, ProductCategory, Product, Price, Upload
 
 
 class BannerSerializer(serializers.ModelSerializer):
     """Serializer for Banner model"""
     class Meta:
         model = Banner
-        fields = ['id', 'name', 'image', 'active', 'created_at', 'updated_at']
+        fields = ['id', 'name', 'image', 'active', 'starts_at', 'ends_at', 'created_at', 'updated_at']
         read_only_fields = ['created_at', 'updated_at']
 
+    def validate(self, data):
+        """Ensure the schedule window ends after it starts"""
+        starts_at = data.get('starts_at', getattr(self.instance, 'starts_at', None))
+        ends_at = data.get('ends_at', getattr(self.instance, 'ends_at', None))
+        if starts_at and ends_at and ends_at <= starts_at:
+            raise serializers.ValidationError({"ends_at": "End time must be after the start time."})
+        return data
+
 
 class ProductCategorySerializer(serializers.ModelSerializer):
     """Serializer for ProductCategory model"""
     class Meta:
         model = ProductCategory
-        fields = ['id', 'category', 'slug', 'created_at', 'updated_at']
-        read_only_fields = ['slug', 'created_at', 'updated_at']
+        fields = ['id', 'category', 'slug', 'parent', 'product_count', 'created_at', 'updated_at']
+        read_only_fields = ['slug', 'product_count', 'created_at', 'updated_at']
+
+    def save(self, **kwargs):
+        """Report the model's cycle check, made under the parent's row lock, as a 400"""
+        try:
+            return super().save(**kwargs)
+        except DjangoValidationError as exc:
+            raise serializers.ValidationError(serializers.as_serializer_error(exc))
 
 
 class ProductSerializer(serializers.ModelSerializer):
@@ -61,3 +80,64 @@ class PriceSerializer(serializers.ModelSerializer):
         if data.get('silver_price') and data['silver_price'] <= 0:
             raise serializers.ValidationError({"silver_price": "Silver price must be greater than zero."})
         return data
+
+
+class ProductBatchItemSerializer(serializers.Serializer):
+    """
+    Field validation for one item of a product batch
+    Uniqueness and category checks are done set-based by adminapp.batch
+    """
+    id = serializers.IntegerField(required=False)
+    product_id = serializers.CharField(max_length=50)
+    product_name = serializers.CharField(max_length=300)
+    category = serializers.IntegerField()
+    size = serializers.CharField(max_length=100, required=False, allow_blank=True, allow_null=True)
+    image1 = serializers.CharField(max_length=100, help_text="Storage path of an already uploaded image")
+    image2 = serializers.CharField(max_length=100, required=False, allow_blank=True, allow_null=True)
+
+    def validate_image1(self, value):
+        return self._stored_image(value)
+
+    def validate_image2(self, value):
+        return self._stored_image(value) if value else value
+
+    def _stored_image(self, name):
+        """Images are referenced by name and must already be in storage under products/"""
+        name = posixpath.normpath(name)
+        if not name.startswith('products/') or not default_storage.exists(name):
+            raise serializers.ValidationError(f"No uploaded product image named '{name}'.")
+        return name
+
+
+class ProductCategoryBatchItemSerializer(serializers.Serializer):
+    """Field validation for one item of a category batch"""
+    id = serializers.IntegerField(required=False)
+    category = serializers.CharField(max_length=200)
+    parent = serializers.IntegerField(required=False, allow_null=True)
+
+
+class UploadSerializer(serializers.ModelSerializer):
+    """Serializer for starting a chunked upload and reporting its progress"""
+    offset = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Upload
+        fields = ['id', 'filename', 'size', 'offset', 'completed', 'created_at']
+        read_only_fields = ['completed', 'created_at']
+
+    def get_offset(self, obj):
+        from .uploads import offset
+        return offset(obj)
+
+    def validate_size(self, value):
+        from .uploads import max_upload_size
+        if value <= 0 or value > max_upload_size():
+            raise serializers.ValidationError(f"Size must be between 1 and {max_upload_size()} bytes.")
+        return value
+
+
+class UploadFinalizeSerializer(serializers.Serializer):
+    """Where to attach a completed upload"""
+    target = serializers.ChoiceField(choices=['banner', 'product'])
+    object_id = serializers.IntegerField()
+    field = serializers.CharField()
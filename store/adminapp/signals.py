@@ -0,0 +1,90 @@
+from django.core.signals import request_started
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import counters, similarity, snapshots, sync
+from .banners import active_banners
+from .models import Banner, Price, Product, ProductCategory
+from .suggest import index as suggest_index
+
+
+@receiver(request_started, dispatch_uid='adminapp.warm_suggest_index')
+def warm_suggest_index(sender, **kwargs):
+    """Build the typeahead index in the background on a worker's first request"""
+    suggest_index.ensure_fresh()
+    request_started.disconnect(dispatch_uid='adminapp.warm_suggest_index')
+
+
+@receiver(post_save, sender=Product)
+def product_saved(sender, instance, **kwargs):
+    suggest_index.update_product(instance)
+    similarity.schedule_hashing(instance)
+    similarity.index.update(instance)
+
+
+@receiver(post_delete, sender=Product)
+def product_deleted(sender, instance, **kwargs):
+    counters.adjust({instance.category_id: -1})
+    suggest_index.remove('product', instance.pk)
+    similarity.index.remove(instance.pk)
+
+
+@receiver(post_save, sender=ProductCategory)
+def category_saved(sender, instance, **kwargs):
+    suggest_index.update_category(instance)
+
+
+@receiver(post_delete, sender=ProductCategory)
+def category_deleted(sender, instance, **kwargs):
+    suggest_index.remove('category', instance.pk)
+
+
+def record_tombstone(sender, instance, **kwargs):
+    """Leave a trace of deleted catalog rows for the sync feed"""
+    sync.record_deletion(sender, instance.pk)
+
+
+# Connected per model: a post_delete receiver for every sender would make Django
+# load and signal rows one by one even for bulk deletes of untracked models (jobs, sessions)
+for _model in sync.TRACKED_MODELS:
+    post_delete.connect(record_tombstone, sender=_model,
+                        dispatch_uid=f'adminapp.record_tombstone.{_model._meta.model_name}')
+
+
+@receiver(post_save, sender=Product, dispatch_uid='adminapp.snapshot_product')
+@receiver(post_delete, sender=Product, dispatch_uid='adminapp.snapshot_product_delete')
+def snapshot_product(sender, instance, **kwargs):
+    if not snapshots.enabled():
+        return
+    # The category list carries product counts. Categories are scheduled by id so a
+    # batch of products costs no queries here; slugs are resolved once when publishing
+    targets = [snapshots.CATEGORIES, snapshots.category_id(instance.category_id)]
+    previous = getattr(instance, '_loaded_category_id', None)
+    if previous and previous != instance.category_id:
+        targets.append(snapshots.category_id(previous))
+    snapshots.schedule(*targets)
+
+
+@receiver(post_save, sender=ProductCategory, dispatch_uid='adminapp.snapshot_category')
+@receiver(post_delete, sender=ProductCategory, dispatch_uid='adminapp.snapshot_category_delete')
+def snapshot_category(sender, instance, **kwargs):
+    # Products embed their category, so its product list is re-rendered too
+    snapshots.schedule(snapshots.CATEGORIES, snapshots.category(instance.slug))
+
+
+@receiver(post_save, sender=Banner, dispatch_uid='adminapp.banner_saved')
+@receiver(post_delete, sender=Banner, dispatch_uid='adminapp.banner_deleted')
+def banner_changed(sender, instance, **kwargs):
+    active_banners.invalidate_on_commit()
+
+
+@receiver(post_save, sender=Banner, dispatch_uid='adminapp.snapshot_banner')
+@receiver(post_delete, sender=Banner, dispatch_uid='adminapp.snapshot_banner_delete')
+def snapshot_banner(sender, instance, **kwargs):
+    snapshots.schedule(snapshots.BANNERS)
+
+
+@receiver(post_save, sender=Price, dispatch_uid='adminapp.snapshot_price')
+@receiver(post_delete, sender=Price, dispatch_uid='adminapp.snapshot_price_delete')
+def snapshot_price(sender, instance, **kwargs):
+    snapshots.schedule(snapshots.PRICES)
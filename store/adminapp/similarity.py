@@ -0,0 +1,233 @@
+"""
+"More like this" based on perceptual hashes of product photos.
+
+Each product image gets a 64-bit difference hash (dHash) after it is saved:
+saves only queue an adminapp.tasks.hash_images job, which reads the images and
+stores the hashes, so requests never decode image files. All
+hashes are kept in memory as a NumPy uint64 matrix with one row per product and
+one column per image, so a lookup is a vectorized XOR + popcount over every
+product followed by a partial sort, without touching the database. Like the
+typeahead index, each worker process holds its own copy: it is built on first
+use, patched from Product signals in the process that made the change (the
+job worker, for new hashes) and rebuilt every SIMILARITY_INDEX_MAX_AGE seconds. Inside collect(), changes are
+applied together once the transaction commits. NumPy and Pillow are imported
+on first use: this module is loaded at startup by the signal handlers, and most
+processes never build the index or hash an image.
+"""
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import transaction
+
+HASH_FIELDS = {'image1': 'image1_hash', 'image2': 'image2_hash'}
+NO_MATCH = 65  # Larger than any Hamming distance between 64-bit hashes
+
+_buffer = threading.local()
+
+
+def dhash(fh):
+    """Return the 64-bit difference hash of an image file"""
+    from PIL import Image
+
+    with Image.open(fh) as img:
+        img.draft('L', (64, 64))  # Let JPEG decode at reduced size
+        pixels = img.convert('L').resize((9, 8), Image.Resampling.LANCZOS).tobytes()
+    value = 0
+    for row in range(8):
+        for col in range(8):
+            value = value << 1 | (pixels[row * 9 + col] > pixels[row * 9 + col + 1])
+    return value
+
+
+def to_signed(value):
+    """Store unsigned 64-bit hashes in a signed BigIntegerField"""
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+
+def image_names(product):
+    return tuple(getattr(product, field).name or '' for field in HASH_FIELDS)
+
+
+def hash_product(product):
+    """Compute hashes for images that changed since they were last hashed; return True if any did"""
+    hashed = getattr(product, '_hashed_images', ('', ''))
+    current = image_names(product)
+    changed = False
+    for (field, hash_field), old_name, name in zip(HASH_FIELDS.items(), hashed, current):
+        if name == old_name:
+            continue
+        value = None
+        if name:
+            from PIL import Image
+
+            try:
+                with getattr(product, field).open('rb') as fh:
+                    value = to_signed(dhash(fh))
+            except (OSError, Image.DecompressionBombError):
+                pass  # Missing or unreadable file; the product just has no hash for it
+        setattr(product, hash_field, value)
+        changed = True
+    product._hashed_images = current
+    return changed
+
+
+def schedule_hashing(product):
+    """Queue a hash_images job once the save commits if the product's images changed"""
+    current = image_names(product)
+    if current == getattr(product, '_hashed_images', ('', '')):
+        return False
+    product._hashed_images = current
+    pending = getattr(_buffer, 'pending', None)
+    if pending is not None:
+        pending.append(('hash', product.pk))
+    else:
+        transaction.on_commit(lambda: _enqueue_hashing([product.pk]))
+    return True
+
+
+def _enqueue_hashing(pks):
+    from .jobs import enqueue
+
+    enqueue('adminapp.tasks.hash_images', {'pks': pks})
+
+
+class SimilarityIndex:
+    """In-memory matrix of product image hashes"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._data = None  # (ids, category_ids, hashes, valid, row_by_id)
+        self._built_at = None
+
+    def _ensure(self):
+        max_age = getattr(settings, 'SIMILARITY_INDEX_MAX_AGE', 300)
+        if self._built_at is None:
+            self.rebuild()  # The first lookup in a process has to wait for the data
+        elif time.monotonic() - self._built_at > max_age:
+            with self._lock:
+                self._built_at = time.monotonic()  # Let only one request start the rebuild
+            threading.Thread(target=self._rebuild_in_background, daemon=True).start()
+
+    def _rebuild_in_background(self):
+        from django.db import connection
+
+        try:
+            self.rebuild()
+        finally:
+            connection.close()
+
+    def rebuild(self):
+        import numpy as np
+
+        from .models import Product
+
+        rows = list(Product.objects.values_list('pk', 'category_id', 'image1_hash', 'image2_hash'))
+        ids = np.array([row[0] for row in rows], dtype=np.int64)
+        category_ids = np.array([row[1] for row in rows], dtype=np.int64)
+        raw = np.array([[row[2] or 0, row[3] or 0] for row in rows], dtype=np.int64).reshape(-1, 2)
+        valid = np.array([[row[2] is not None, row[3] is not None] for row in rows], dtype=bool).reshape(-1, 2)
+        data = (ids, category_ids, raw.view(np.uint64), valid, {pk: i for i, pk in enumerate(ids.tolist())})
+        with self._lock:
+            self._data = data
+            self._built_at = time.monotonic()
+
+    def update(self, product):
+        """Add or replace one product's row"""
+        self.update_products([product])
+
+    def update_products(self, products):
+        """Add or replace several products' rows, growing the arrays at most once"""
+        pending = getattr(_buffer, 'pending', None)
+        if pending is not None:
+            pending.extend(('update', product) for product in products)
+            return
+        with self._lock:
+            if self._data is None:
+                return
+            import numpy as np
+
+            ids, category_ids, hashes, valid, row_by_id = self._data
+            values = [[getattr(product, field) for field in HASH_FIELDS.values()] for product in products]
+            rows = np.array([[v or 0 for v in row] for row in values], dtype=np.int64).reshape(-1, 2).view(np.uint64)
+            rows_valid = np.array([[v is not None for v in row] for row in values], dtype=bool).reshape(-1, 2)
+            new = []
+            for n, product in enumerate(products):
+                i = row_by_id.get(product.pk)
+                if i is None:
+                    new.append(n)
+                else:
+                    category_ids[i], hashes[i], valid[i] = product.category_id, rows[n], rows_valid[n]
+            if new:
+                row_by_id = {**row_by_id, **{products[n].pk: len(ids) + k for k, n in enumerate(new)}}
+                self._data = (
+                    np.append(ids, [products[n].pk for n in new]),
+                    np.append(category_ids, [products[n].category_id for n in new]),
+                    np.vstack([hashes, rows[new]]),
+                    np.vstack([valid, rows_valid[new]]),
+                    row_by_id,
+                )
+
+    def remove(self, pk):
+        pending = getattr(_buffer, 'pending', None)
+        if pending is not None:
+            pending.append(('remove', pk))
+            return
+        with self._lock:
+            if self._data is None or pk not in self._data[4]:
+                return
+            self._data[3][self._data[4][pk]] = False
+
+    def similar(self, product, limit=12, same_category=False):
+        """Return [(product pk, distance)] closest to `product`, best first"""
+        import numpy as np
+
+        self._ensure()
+        ids, category_ids, hashes, valid, _ = self._data
+        query = [(np.uint64(v & ((1 << 64) - 1))) for v in
+                 (getattr(product, field) for field in HASH_FIELDS.values()) if v is not None]
+        if not query or not len(ids):
+            return []
+
+        # Best distance between any image of the query and any image of each product
+        distance = np.full(len(ids), NO_MATCH, dtype=np.uint8)
+        for value in query:
+            per_image = np.bitwise_count(hashes ^ value)
+            per_image[~valid] = NO_MATCH
+            np.minimum(distance, per_image.min(axis=1), out=distance)
+        distance[ids == product.pk] = NO_MATCH
+        if same_category:
+            distance[category_ids != product.category_id] = NO_MATCH
+
+        candidates = np.flatnonzero(distance < NO_MATCH)
+        if len(candidates) > limit:
+            candidates = candidates[np.argpartition(distance[candidates], limit)[:limit]]
+        candidates = candidates[np.argsort(distance[candidates], kind='stable')]
+        return [(int(ids[i]), int(distance[i])) for i in candidates]
+
+
+index = SimilarityIndex()
+
+
+def _apply(changes):
+    index.update_products([product for kind, product in changes if kind == 'update'])
+    for kind, pk in changes:
+        if kind == 'remove':
+            index.remove(pk)
+    to_hash = [pk for kind, pk in changes if kind == 'hash']
+    if to_hash:
+        _enqueue_hashing(to_hash)  # One job for the whole batch
+
+
+@contextmanager
+def collect():
+    """Buffer index changes and hashing made inside the block and apply them together after commit"""
+    _buffer.pending = []
+    try:
+        yield
+        changes = _buffer.pending
+    finally:
+        _buffer.pending = None
+    if changes:
+        transaction.on_commit(lambda: _apply(changes))
@@ -0,0 +1,199 @@
+"""
+Static JSON snapshots of the public catalog.
+
+When CATALOG_SNAPSHOT_ROOT is set, the read-only storefront endpoints are
+rendered to files under it, laid out like the API so the front proxy can serve
+them without reaching Django:
+
+  api/categories/index.json
+  api/products/by-category/<slug>/index.json     full list, as the API returns it
+  api/products/by-category/<slug>/page-<n>.json  CATALOG_SNAPSHOT_PAGE_SIZE items per page
+  api/banners/active_banners/index.json
+  api/prices/latest/index.json
+
+Files are written to a temporary name and renamed, so readers never see a
+partial file. Model signals mark only the affected targets dirty, and once the
+transaction commits they are re-rendered by the job worker (or on the
+committing request when CATALOG_SNAPSHOT_ASYNC is turned off); targets marked
+in a transaction that rolls back are forgotten. Scheduled banners are re-rendered by a job
+queued for their next start or end time, so runjobs must be running for the
+banner file to switch on time. Image URLs are relative to the site root
+because there is no request to build absolute ones from.
+"""
+import os
+import shutil
+import tempfile
+import threading
+
+from django.conf import settings
+from django.db import transaction
+from rest_framework.renderers import JSONRenderer
+
+from .jobs import task
+from . import banners
+from .models import Job, Price, Product, ProductCategory
+from .serializers import BannerSerializer, PriceSerializer, ProductCategorySerializer, ProductSerializer
+
+CATEGORIES = ('categories',)
+BANNERS = ('banners',)
+PRICES = ('prices',)
+
+_pending = threading.local()
+
+
+def root():
+    return getattr(settings, 'CATALOG_SNAPSHOT_ROOT', None)
+
+
+def enabled():
+    return bool(root())
+
+
+def category(slug):
+    return ('category', slug)
+
+
+def category_id(pk):
+    """Target for a category known only by id; its slug is looked up when publishing"""
+    return ('category-id', pk)
+
+
+def _path(*parts):
+    return os.path.join(root(), 'api', *parts)
+
+
+def _write(path, data):
+    """Render `data` and atomically replace the file at `path`"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp-')
+    try:
+        with os.fdopen(fd, 'wb') as fh:
+            fh.write(JSONRenderer().render(data))
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def _remove(path):
+    if os.path.isdir(path):
+        shutil.rmtree(path)
+    elif os.path.exists(path):
+        os.remove(path)
+
+
+def _publish_category(slug):
+    directory = _path('products', 'by-category', slug)
+    if not ProductCategory.objects.filter(slug=slug).exists():
+        _remove(directory)
+        return
+    products = list(Product.objects.select_related('category').filter(category__slug=slug))
+    data = ProductSerializer(products, many=True).data
+    _write(os.path.join(directory, 'index.json'), data)
+
+    page_size = getattr(settings, 'CATALOG_SNAPSHOT_PAGE_SIZE', 100)
+    pages = max(1, -(-len(data) // page_size))
+    for number in range(1, pages + 1):
+        _write(os.path.join(directory, f'page-{number}.json'), {
+            'count': len(data),
+            'next': f'page-{number + 1}.json' if number < pages else None,
+            'previous': f'page-{number - 1}.json' if number > 1 else None,
+            'results': data[(number - 1) * page_size:number * page_size],
+        })
+    # Drop pages left over from when the category had more products
+    for name in os.listdir(directory):
+        if name.startswith('page-') and name.endswith('.json'):
+            number = name[len('page-'):-len('.json')]
+            if number.isdigit() and int(number) > pages:
+                os.remove(os.path.join(directory, name))
+
+
+def publish(targets):
+    """Re-render the given targets"""
+    targets = set(targets)
+    by_id = {target for target in targets if target[0] == 'category-id'}
+    if by_id:
+        targets -= by_id
+        slugs = ProductCategory.objects.filter(pk__in=[target[1] for target in by_id]).values_list('slug', flat=True)
+        targets.update(category(slug) for slug in slugs)
+    for target in targets:
+        if target == CATEGORIES:
+            _write(_path('categories', 'index.json'),
+                   ProductCategorySerializer(ProductCategory.objects.all(), many=True).data)
+        elif target == BANNERS:
+            live, boundary = banners.compute()
+            _write(_path('banners', 'active_banners', 'index.json'), BannerSerializer(live, many=True).data)
+            _schedule_boundary(boundary)
+        elif target == PRICES:
+            latest = Price.objects.first()
+            if latest:
+                _write(_path('prices', 'latest', 'index.json'), PriceSerializer(latest).data)
+            else:
+                _remove(_path('prices', 'latest', 'index.json'))
+        else:
+            _publish_category(target[1])
+
+
+def publish_all():
+    """Re-render every target and remove snapshots of deleted categories"""
+    slugs = set(ProductCategory.objects.values_list('slug', flat=True))
+    publish([CATEGORIES, BANNERS, PRICES, *(category(slug) for slug in slugs)])
+    by_category = _path('products', 'by-category')
+    if os.path.isdir(by_category):
+        for name in set(os.listdir(by_category)) - slugs:
+            _remove(os.path.join(by_category, name))
+    return len(slugs)
+
+
+@task
+def publish_job(targets):
+    publish([tuple(target) for target in targets])
+
+
+def _schedule_boundary(boundary):
+    """Queue a re-publish of the banners for when the live set next changes"""
+    if boundary is None:
+        return
+    from .jobs import enqueue
+
+    task_name = f"{publish_job.__module__}.{publish_job.__name__}"
+    if Job.objects.filter(task=task_name, status=Job.STATUS_QUEUED, run_after=boundary).exists():
+        return
+    enqueue(publish_job, {'targets': [list(BANNERS)]}, priority=10, run_after=boundary)
+
+
+class _Batch:
+    """Targets marked dirty in the current transaction, published by its on_commit callback"""
+
+    def __init__(self):
+        self.targets = set()
+
+    def registered(self):
+        # Django drops on_commit callbacks when their transaction or savepoint rolls back
+        return any(entry[1] == self.flush for entry in transaction.get_connection().run_on_commit)
+
+    def flush(self):
+        if getattr(_pending, 'batch', None) is self:
+            _pending.batch = None
+        if not self.targets:
+            return
+        if getattr(settings, 'CATALOG_SNAPSHOT_ASYNC', True):
+            from .jobs import enqueue
+            enqueue(publish_job, {'targets': sorted(self.targets)}, priority=10)
+        else:
+            publish(self.targets)
+
+
+def schedule(*targets):
+    """Mark targets dirty; they are published once the current transaction commits"""
+    if not enabled():
+        return
+    batch = getattr(_pending, 'batch', None)
+    if batch is not None and batch.registered():
+        batch.targets.update(targets)
+        return
+    # First change in this transaction, or the previous one was rolled back
+    batch = _pending.batch = _Batch()
+    batch.targets.update(targets)
+    transaction.on_commit(batch.flush)
@@ -0,0 +1,219 @@
+"""
+In-memory prefix index for the search box typeahead.
+
+The index is a sorted list of lowercase keys (product name words, product_id
+and category name) with a parallel list of entries, searched with bisect.
+Readers take the current (keys, entries) snapshot without locking; writers
+build a modified copy and swap it in, so a rebuild or an update never blocks
+a request. Each worker process keeps its own copy: it is built in the
+background on the worker's first request, patched from Product and
+ProductCategory signals in the process that made the change once its
+transaction commits, and rebuilt every SUGGEST_INDEX_MAX_AGE seconds to pick
+up changes made elsewhere. Inside collect(), changes are buffered and applied
+together with one copy of the arrays, which is how batch writes use it.
+"""
+import threading
+import time
+from bisect import bisect_left, bisect_right
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import transaction
+
+_buffer = threading.local()
+
+
+def _product_keys(product_id, product_name):
+    words = product_name.lower().split()
+    return {product_id.lower(), product_name.lower(), *words}
+
+
+def _category_keys(category):
+    return {category.lower(), *category.lower().split()}
+
+
+def _order(pair):
+    # Categories sort ahead of products sharing the same key
+    key, entry = pair
+    return key, entry[0] == 'product'
+
+
+class PrefixIndex:
+    """Sorted-array prefix index over products and categories"""
+
+    def __init__(self):
+        self._snapshot = ([], [])
+        self._keys_by_object = {}
+        self._lock = threading.Lock()
+        self._pending = None
+        self._built_at = None
+
+    @property
+    def max_age(self):
+        return getattr(settings, 'SUGGEST_INDEX_MAX_AGE', 300)
+
+    def ensure_fresh(self):
+        """Start a background rebuild if the index was never built or is too old"""
+        built_at = self._built_at
+        if built_at is not None and time.monotonic() - built_at < self.max_age:
+            return
+        with self._lock:
+            if self._pending is not None:
+                return  # A rebuild is already running
+            self._pending = []
+        threading.Thread(target=self._rebuild_in_background, name='suggest-index', daemon=True).start()
+
+    def _rebuild_in_background(self):
+        from django.db import connection
+
+        try:
+            self.rebuild()
+        finally:
+            connection.close()  # Thread connections are not closed by request_finished
+
+    def rebuild(self):
+        """Load every product and category and swap in a fresh index"""
+        with self._lock:
+            if self._pending is None:
+                self._pending = []
+        try:
+            snapshot, keys_by_object = self._load()
+        except Exception:
+            with self._lock:
+                self._pending = None
+            raise
+
+        with self._lock:
+            self._snapshot = snapshot
+            self._keys_by_object = keys_by_object
+            # Replay changes that were saved while the rebuild was reading
+            if self._pending:
+                self._apply(self._pending)
+            self._pending = None
+            self._built_at = time.monotonic()
+
+    @staticmethod
+    def _load():
+        from .models import Product, ProductCategory
+
+        objects = {}
+        for pk, product_id, product_name in Product.objects.values_list(
+            'pk', 'product_id', 'product_name'
+        ).iterator(chunk_size=2000):
+            entry = ('product', pk, f"{product_name} ({product_id})", None)
+            objects[entry[:2]] = (entry, _product_keys(product_id, product_name))
+        for pk, category, slug in ProductCategory.objects.values_list('pk', 'category', 'slug'):
+            entry = ('category', pk, category, slug)
+            objects[entry[:2]] = (entry, _category_keys(category))
+
+        pairs = sorted(((key, entry) for entry, keys in objects.values() for key in keys), key=_order)
+        snapshot = ([key for key, _ in pairs], [entry for _, entry in pairs])
+        return snapshot, {obj: keys for obj, (_, keys) in objects.items()}
+
+    def _apply(self, changes):
+        """Replace the keys of the objects in [(entry, obj, keys)]; caller holds the lock"""
+        latest = {obj: (entry, keys) for entry, obj, keys in changes}
+        keys_list, entries = self._snapshot
+
+        # Find every position to drop or insert at in the current arrays, then build
+        # the new arrays with slice copies between them: one copy however many changes
+        removed = set()
+        for obj in latest:
+            for key in self._keys_by_object.get(obj, ()):
+                i, end = bisect_left(keys_list, key), bisect_right(keys_list, key)
+                while i < end and entries[i][:2] != obj:
+                    i += 1
+                if i < end:
+                    removed.add(i)
+                else:
+                    # The arrays disagree with _keys_by_object; patch what we
+                    # can and let the next ensure_fresh() rebuild from scratch
+                    self._built_at = time.monotonic() - self.max_age
+        inserts = sorted(
+            (
+                (bisect_left if obj[0] == 'category' else bisect_right)(keys_list, key),
+                _order((key, entry)), key, entry,
+            )
+            for obj, (entry, keys) in latest.items() for key in keys
+        )
+        new_keys, new_entries = [], []
+        start = n = 0
+        for position in sorted(removed.union(insert[0] for insert in inserts)):
+            new_keys += keys_list[start:position]
+            new_entries += entries[start:position]
+            while n < len(inserts) and inserts[n][0] == position:
+                new_keys.append(inserts[n][2])
+                new_entries.append(inserts[n][3])
+                n += 1
+            start = position + 1 if position in removed else position
+        new_keys += keys_list[start:]
+        new_entries += entries[start:]
+
+        for obj, (_, keys) in latest.items():
+            if keys:
+                self._keys_by_object[obj] = keys
+            else:
+                self._keys_by_object.pop(obj, None)
+        self._snapshot = (new_keys, new_entries)
+
+    def _update(self, changes):
+        pending = getattr(_buffer, 'pending', None)
+        if pending is not None:
+            pending.extend(changes)
+            return
+        # A rolled back save must not show up in the typeahead
+        transaction.on_commit(lambda: self._commit(changes))
+
+    def _commit(self, changes):
+        with self._lock:
+            if self._pending is not None:
+                self._pending.extend(changes)
+            if self._built_at is not None:
+                self._apply(changes)
+
+    @staticmethod
+    def _product_change(product):
+        entry = ('product', product.pk, str(product), None)
+        return entry, entry[:2], _product_keys(product.product_id, product.product_name)
+
+    def update_product(self, product):
+        self._update([self._product_change(product)])
+
+    def update_products(self, products):
+        """Add or replace several products with one copy of the index"""
+        self._update([self._product_change(product) for product in products])
+
+    def update_category(self, category):
+        entry = ('category', category.pk, category.category, category.slug)
+        self._update([(entry, entry[:2], _category_keys(category.category))])
+
+    def remove(self, kind, pk):
+        self._update([(None, (kind, pk), set())])
+
+    def search(self, query, limit=10):
+        """Return up to `limit` distinct entries with a key starting with `query`"""
+        query = query.lower()
+        keys, entries = self._snapshot
+        results = {}
+        i = bisect_left(keys, query)
+        while i < len(keys) and keys[i].startswith(query) and len(results) < limit:
+            entry = entries[i]
+            results.setdefault(entry[:2], entry)
+            i += 1
+        return list(results.values())
+
+
+index = PrefixIndex()
+
+
+@contextmanager
+def collect():
+    """Buffer index changes made inside the block and apply them together after commit"""
+    _buffer.pending = []
+    try:
+        yield
+        changes = _buffer.pending
+    finally:
+        _buffer.pending = None
+    if changes:
+        transaction.on_commit(lambda: index._commit(changes))
@@ -0,0 +1,155 @@
+"""
+Delta-sync feed for catalog mirrors and mobile clients.
+
+Every change is ordered by the tuple (timestamp, feed, id), where the
+timestamp is `updated_at` (or `deleted_at` for tombstones) and feed is the
+position in FEEDS. A sync token is that tuple for the last row a client has
+seen, so each page resumes exactly after it. Each feed is read with one
+indexed range query and the pages are merged in Python.
+
+Rows newer than SYNC_COMMIT_LAG seconds are held back for the next call. A
+transaction that commits late can carry an `updated_at` earlier than rows
+that were already served, and the lag keeps such rows from being skipped.
+
+Tombstones are deleted after SYNC_TOMBSTONE_RETENTION seconds (see
+prune_tombstones). Tokens therefore also carry the time up to which the
+client has received every deletion: the start of its first sync, then the
+last row served, or the horizon once it has caught up. When that time is
+older than the retention the client may have missed deletions, so the feed
+restarts from the beginning and the response says `"reset": true`; the client
+drops its copy and rebuilds it from the pages that follow.
+"""
+import base64
+import binascii
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Banner, Price, Product, ProductCategory, Tombstone
+from .serializers import BannerSerializer, PriceSerializer, ProductCategorySerializer, ProductSerializer
+
+# (feed name, queryset, serializer, timestamp field)
+FEEDS = [
+    ('categories', ProductCategory.objects.all(), ProductCategorySerializer, 'updated_at'),
+    ('products', Product.objects.select_related('category'), ProductSerializer, 'updated_at'),
+    ('banners', Banner.objects.all(), BannerSerializer, 'updated_at'),
+    ('prices', Price.objects.all(), PriceSerializer, 'updated_at'),
+    ('deleted', Tombstone.objects.all(), None, 'deleted_at'),
+]
+TRACKED_MODELS = {Product: 'products', ProductCategory: 'categories', Banner: 'banners', Price: 'prices'}
+
+
+_buffer = threading.local()
+
+
+class InvalidToken(ValueError):
+    pass
+
+
+def record_deletion(model, pk):
+    """Write a tombstone for a deleted row, or buffer it inside collect_tombstones()"""
+    feed = TRACKED_MODELS.get(model)
+    if feed is None:
+        return
+    tombstone = Tombstone(model=feed, object_id=pk)
+    pending = getattr(_buffer, 'pending', None)
+    if pending is not None:
+        pending.append(tombstone)
+    else:
+        tombstone.save()
+
+
+@contextmanager
+def collect_tombstones():
+    """Write the tombstones of every row deleted inside the block with one INSERT"""
+    _buffer.pending = []
+    try:
+        yield
+        Tombstone.objects.bulk_create(_buffer.pending)
+    finally:
+        _buffer.pending = None
+
+
+def tombstone_cutoff(now=None):
+    """Deletions before this time are no longer recorded"""
+    retention = getattr(settings, 'SYNC_TOMBSTONE_RETENTION', 30 * 86400)
+    return (now or timezone.now()) - timedelta(seconds=retention)
+
+
+def prune_tombstones(now=None):
+    """Delete tombstones older than SYNC_TOMBSTONE_RETENTION seconds; returns the number deleted"""
+    deleted, _ = Tombstone.objects.filter(deleted_at__lt=tombstone_cutoff(now)).delete()
+    return deleted
+
+
+def encode_token(timestamp, feed, pk, deletions_until):
+    raw = f"{timestamp.isoformat()}|{feed}|{pk}|{deletions_until.isoformat()}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_token(token):
+    """Return ((timestamp, feed, pk), deletions_until)"""
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)).decode()
+        timestamp, feed, pk, deletions_until = raw.split('|')
+        return (datetime.fromisoformat(timestamp), int(feed), int(pk)), datetime.fromisoformat(deletions_until)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise InvalidToken("Invalid sync token.") from None
+
+
+def _after(field, cursor, position):
+    """Filter for rows of the feed at `position` that sort after `cursor`"""
+    if cursor is None:
+        return Q()
+    timestamp, feed, pk = cursor
+    if position > feed:
+        return Q(**{f'{field}__gte': timestamp})
+    if position < feed:
+        return Q(**{f'{field}__gt': timestamp})
+    return Q(**{f'{field}__gt': timestamp}) | Q(**{field: timestamp, 'pk__gt': pk})
+
+
+def changes_since(token, limit, context):
+    """Return one page of changes after `token` in the sync response format"""
+    cursor, deletions_until = decode_token(token) if token else (None, None)
+    reset = deletions_until is not None and deletions_until < tombstone_cutoff()
+    horizon = timezone.now() - timedelta(seconds=getattr(settings, 'SYNC_COMMIT_LAG', 2))
+    if cursor is None or reset:
+        # A fresh copy cannot hold rows deleted before it was started
+        cursor, deletions_until = None, horizon
+
+    rows = []
+    for position, (name, queryset, serializer, field) in enumerate(FEEDS):
+        page = (
+            queryset.filter(_after(field, cursor, position), **{f'{field}__lte': horizon})
+            .order_by(field, 'pk')[:limit + 1]
+        )
+        rows.extend((getattr(obj, field), position, obj.pk, obj) for obj in page)
+    rows.sort(key=lambda row: row[:3])
+    page, has_more = rows[:limit], len(rows) > limit
+
+    changes = {name: [] for name, *_ in FEEDS[:-1]}
+    deleted = {name: [] for name, *_ in FEEDS[:-1]}
+    for _, position, _, obj in page:
+        name, _, serializer, _ = FEEDS[position]
+        if serializer is None:
+            deleted[obj.model].append(obj.object_id)
+        else:
+            changes[name].append(serializer(obj, context=context).data)
+
+    if page:
+        cursor = page[-1][:3]
+        deletions_until = max(deletions_until, cursor[0])
+    if not has_more:
+        deletions_until = max(deletions_until, horizon)
+    return {
+        'changes': changes,
+        'deleted': deleted,
+        'next_token': encode_token(*cursor, deletions_until) if cursor else None,
+        'has_more': has_more,
+        'reset': reset,
+    }
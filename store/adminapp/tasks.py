@@ -0,0 +1,38 @@
+import logging
+
+from django.apps import apps
+from PIL import Image
+
+from . import similarity
+from .jobs import task
+
+logger = logging.getLogger(__name__)
+
+
+@task
+def verify_image(model, pk, field):
+    """Fully decode an uploaded image and log it if the file is corrupt"""
+    instance = apps.get_model('adminapp', model).objects.filter(pk=pk).first()
+    image = getattr(instance, field, None)
+    if not image:
+        return
+    try:
+        with image.open('rb') as fh, Image.open(fh) as img:
+            img.verify()
+    except Exception:
+        logger.warning("Corrupt image %s on %s #%s", image.name, model, pk)
+        raise
+
+
+@task
+def hash_images(pks):
+    """Compute the perceptual hashes of the products' current images and store them"""
+    from .models import Product
+
+    for product in Product.objects.filter(pk__in=pks):
+        product._hashed_images = (None, None)  # Hash every image, and clear the hash of a removed one
+        similarity.hash_product(product)
+        Product.objects.filter(pk=product.pk).update(
+            image1_hash=product.image1_hash, image2_hash=product.image2_hash
+        )
+        similarity.index.update(product)
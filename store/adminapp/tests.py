@@ -1,3 +1,1206 @@
-from django.test import TestCase
+import io
+import json
+import multiprocessing
+import logging
+import queue
+import os
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.management import call_command
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.signals import request_started
+from django.db import DatabaseError, connection, transaction
+from django.db.models.deletion import Collector
+from django.test import Client, SimpleTestCase, TestCase, TransactionTestCase, override_settings, skipUnlessDBFeature
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.utils.log import AdminEmailHandler
+from PIL import Image
+from rest_framework.permissions import AllowAny
+from rest_framework.settings import api_settings
+from store import logs
+
+from . import banners, counters, jobs, rates, similarity, snapshots, suggest, sync, throttling, uploads
+from .management.commands import serve
+from .models import Banner, Job, Price, Product, ProductCategory, Tombstone, Upload
+
+QUIET_LOGGERS = ['store.access', 'django.request']
+
+
+_unthrottled = override_settings(REST_FRAMEWORK={**settings.REST_FRAMEWORK, 'DEFAULT_THROTTLE_RATES': {}})
+
+
+def setUpModule():
+    # The typeahead index would otherwise be rebuilt from another thread on the first request
+    request_started.disconnect(dispatch_uid='adminapp.warm_suggest_index')
+    # Access records and 4xx warnings would be interleaved with the runner's output
+    for name in QUIET_LOGGERS:
+        logging.getLogger(name).disabled = True
+    # Throttle buckets are shared by every process on the host; tests that need them set rates
+    _unthrottled.enable()
+
+
+def tearDownModule():
+    _unthrottled.disable()
+    for name in QUIET_LOGGERS:
+        logging.getLogger(name).disabled = False
+
+
+# A recorded feed as written by `ingestrates --record`, with the kinds of lines a live feed produces
+RECORDED_FEED = """\
+{"ts": "2026-10-19T10:00:00.000+00:00", "gold": "6120.00", "silver": "75.10"}
+{"ts": "2026-10-19T10:00:00.100+00:00", "gold": "6120.00", "silver": "75.10"}
+{"ts": "2026-10-19T10:00:00.200+00:00", "gold": "6121.50", "silver": "75.10"}
+2026-10-19T10:00:00.300+00:00,6121.50,75.10
+{"ts": "2026-10-19T10:00:00.400+00:00", "gold": "not a rate", "silver": "75.10"}
+
+{"ts": "2026-10-19T10:00:00.500+00:00", "gold": "6122.00", "silver": "75.25"}
+2026-10-19T10:00:00.600+00:00,6122.00
+{"ts": "2026-10-19T10:00:00.700+00:00", "gold": "6119.75", "silver": "75.25"}
+"""
+
+
+class RateReplayTests(TestCase):
+    """Replays a recorded feed through the Coalescer as ingestrates --replay does"""
+
+    def replay(self, coalescer, invalid):
+        for tick in rates.replay(RECORDED_FEED.splitlines(), speed=0, on_invalid=invalid):
+            coalescer.add(tick)
+
+    def test_replay_writes_changed_rates_and_counts_the_rest(self):
+        stats = rates.LagStats()
+        coalescer = rates.Coalescer(stats)
+        invalid = []
+        self.replay(coalescer, lambda line, exc: invalid.append(line))
+        coalescer.flush()
+
+        rows = list(Price.objects.order_by('pk').values_list('gold_price', 'silver_price'))
+        self.assertEqual(rows, [
+            (Decimal('6120.00'), Decimal('75.10')),
+            (Decimal('6121.50'), Decimal('75.10')),
+            (Decimal('6122.00'), Decimal('75.25')),
+            (Decimal('6119.75'), Decimal('75.25')),
+        ])
+        self.assertEqual(len(invalid), 2)
+        self.assertEqual((stats.received, stats.unchanged, stats.written, stats.flushes), (6, 2, 4, 1))
+        self.assertEqual(len(stats.lag), 4)
+        self.assertTrue(all(lag >= 0 for lag in stats.lag))
+
+    def test_latest_only_writes_one_row_per_flush(self):
+        stats = rates.LagStats()
+        coalescer = rates.Coalescer(stats, latest_only=True)
+        self.replay(coalescer, None)
+        coalescer.flush()
+
+        self.assertEqual(list(Price.objects.values_list('gold_price', flat=True)), [Decimal('6119.75')])
+        self.assertEqual((stats.written, stats.flushes), (1, 1))
+
+    def test_failed_flush_keeps_ticks_for_the_next_one(self):
+        stats = rates.LagStats()
+        coalescer = rates.Coalescer(stats)
+        self.replay(coalescer, None)
+        with mock.patch.object(Price.objects, 'bulk_create', side_effect=DatabaseError("connection lost")):
+            with self.assertRaises(DatabaseError):
+                coalescer.flush()
+        self.assertFalse(Price.objects.exists())
+
+        # A repeat of the buffered rate is still a duplicate: the buffered tick will be written
+        tick = rates.parse_tick('6119.75,75.25')
+        self.assertFalse(coalescer.add(tick))
+        coalescer.flush()
+        self.assertEqual(Price.objects.count(), 4)
+        self.assertEqual(Price.objects.latest('effective_date').gold_price, Decimal('6119.75'))
+
+
+@override_settings(SYNC_COMMIT_LAG=0)
+class SyncFeedTests(TestCase):
+    """Pages through /api/sync/ as a mirror does"""
+
+    def setUp(self):
+        self.category = ProductCategory.objects.create(category="Rings")
+        self.products = [
+            Product.objects.create(product_id=f"RING{i}", product_name=f"Ring {i}",
+                                   category=self.category, image1='products/ring.jpg')
+            for i in range(5)
+        ]
+        # Rows written by one transaction share a timestamp; pages must split them without loss
+        stamp = timezone.now() - timedelta(minutes=5)
+        ProductCategory.objects.update(updated_at=stamp)
+        Product.objects.update(updated_at=stamp)
+
+    def sync(self, since=None, limit=2):
+        params = {'limit': limit, **({'since': since} if since else {})}
+        response = self.client.get('/api/sync/', params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def sync_all(self, since=None, limit=2):
+        """Follow next_token until has_more is false; return (pages, token)"""
+        pages = []
+        while True:
+            data = self.sync(since, limit)
+            pages.append(data)
+            since = data['next_token']
+            if not data['has_more']:
+                return pages, since
+
+    def test_pages_split_rows_with_the_same_timestamp(self):
+        pages, token = self.sync_all()
+
+        self.assertEqual(len(pages), 3)
+        self.assertTrue(all(sum(map(len, page['changes'].values())) == 2 for page in pages))
+        product_ids = [product['id'] for page in pages for product in page['changes']['products']]
+        self.assertEqual(product_ids, [product.pk for product in self.products])
+        self.assertEqual([c['id'] for c in pages[0]['changes']['categories']], [self.category.pk])
+
+        caught_up = self.sync(token)
+        self.assertEqual(sync.decode_token(caught_up['next_token'])[0], sync.decode_token(token)[0])
+        self.assertFalse(any(caught_up['changes'].values()) or any(caught_up['deleted'].values()))
+
+    def test_deleted_rows_are_served_as_tombstones(self):
+        _, token = self.sync_all()
+        removed = self.products[1].pk
+        self.products[1].delete()
+
+        pages, _ = self.sync_all(token)
+        deleted = [pk for page in pages for pk in page['deleted']['products']]
+        self.assertEqual(deleted, [removed])
+        self.assertFalse(any(page['changes']['products'] for page in pages))
+        # The category's product count changed with the delete, so it is sent again
+        categories = [c for page in pages for c in page['changes']['categories']]
+        self.assertEqual([(c['id'], c['product_count']) for c in categories], [(self.category.pk, 4)])
+
+    def test_old_tokens_restart_from_the_beginning(self):
+        # Rows older than the retention do not make a client that keeps up resync
+        with self.settings(SYNC_TOMBSTONE_RETENTION=60):
+            pages, token = self.sync_all()
+            self.assertFalse(any(page['reset'] for page in pages))
+            self.assertFalse(self.sync(token)['reset'])
+
+        _, deletions_until = sync.decode_token(token)
+        stale = sync.encode_token(*sync.decode_token(token)[0], deletions_until - timedelta(days=31))
+        pages, _ = self.sync_all(stale)
+        self.assertEqual([page['reset'] for page in pages], [True, False, False])
+        self.assertEqual(sum(len(page['changes']['products']) for page in pages), 5)
+
+    def test_prune_tombstones_keeps_recent_ones(self):
+        self.products[0].delete()
+        self.products[1].delete()
+        old = Tombstone.objects.earliest('deleted_at')
+        Tombstone.objects.filter(pk=old.pk).update(deleted_at=timezone.now() - timedelta(days=31))
+
+        self.assertEqual(sync.prune_tombstones(), 1)
+        self.assertEqual(Tombstone.objects.count(), 1)
+
+    def test_only_catalog_deletes_are_signalled(self):
+        collector = Collector(using='default')
+        self.assertTrue(collector.can_fast_delete(Job.objects.all()))
+        self.assertTrue(collector.can_fast_delete(Tombstone.objects.all()))
+        self.assertFalse(collector.can_fast_delete(Product.objects.all()))
+
+    def test_invalid_token_is_rejected(self):
+        response = self.client.get('/api/sync/', {'since': 'not-a-token'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('since', response.json())
+
+
+class ProductBatchTests(TestCase):
+    """Batch create, update and delete through /api/products/batch/"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        media_root = cls.enterClassContext(tempfile.TemporaryDirectory())
+        cls.enterClassContext(override_settings(MEDIA_ROOT=media_root))
+        image = io.BytesIO()
+        Image.new('RGB', (16, 16), 'gold').save(image, 'PNG')
+        default_storage.save('products/ring.png', ContentFile(image.getvalue()))
+
+    def setUp(self):
+        self.rings = ProductCategory.objects.create(category="Rings")
+        self.chains = ProductCategory.objects.create(category="Chains")
+
+    def item(self, n, **fields):
+        return {'product_id': f"RING{n}", 'product_name': f"Ring {n}", 'category': self.rings.pk,
+                'image1': 'products/ring.png', **fields}
+
+    def batch(self, method, items):
+        return getattr(self.client, method)('/api/products/batch/', items, content_type='application/json')
+
+    def test_create_costs_the_same_queries_for_any_batch_size(self):
+        with CaptureQueriesContext(connection) as small:
+            self.assertEqual(self.batch('post', [self.item(n) for n in range(2)]).status_code, 201)
+        with self.captureOnCommitCallbacks(execute=True), self.assertNumQueries(len(small)):
+            response = self.batch('post', [self.item(n) for n in range(2, 50)])
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(response.json()), 48)
+        self.assertEqual(Product.objects.count(), 50)
+        self.rings.refresh_from_db()
+        self.assertEqual(self.rings.product_count, 50)
+
+        # Images are hashed by one job for the whole batch
+        [job] = Job.objects.filter(task='adminapp.tasks.hash_images')
+        self.assertEqual(len(job.payload['pks']), 48)
+        jobs.run(job.task, job.payload)
+        self.assertEqual(Product.objects.filter(image1_hash__isnull=False).count(), 48)
+
+    def test_invalid_items_reject_the_whole_batch(self):
+        Product.objects.create(**{**self.item(0), 'category': self.rings})
+        response = self.batch('post', [
+            self.item(1),
+            self.item(1),                                   # Duplicate within the batch
+            self.item(0),                                   # Already exists
+            self.item(2, category=0),                       # Unknown category
+            self.item(3, image1='products/missing.png'),    # Not in storage
+            self.item(4, image1='products/../settings.py'),
+            self.item(5, product_name=''),
+        ])
+
+        self.assertEqual(response.status_code, 400)
+        errors = {error['index']: set(error['errors']) for error in response.json()['errors']}
+        self.assertEqual(errors, {
+            1: {'product_id'}, 2: {'product_id'}, 3: {'category'},
+            4: {'image1'}, 5: {'image1'}, 6: {'product_name'},
+        })
+        self.assertEqual(Product.objects.count(), 1)
+
+    def test_update_and_delete(self):
+        created = self.batch('post', [self.item(n) for n in range(3)]).json()
+        ids = [product['id'] for product in created]
+
+        response = self.batch('patch', [
+            {'id': ids[0], 'category': self.chains.pk},
+            {'id': ids[1], 'product_name': "Signet ring"},
+        ])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Product.objects.get(pk=ids[1]).product_name, "Signet ring")
+        self.assertEqual(self.counts(), (2, 1))
+
+        response = self.batch('patch', [{'id': ids[2], 'product_id': 'RING0'}, {'id': 0, 'size': 'L'}])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual([error['index'] for error in response.json()['errors']], [0, 1])
+
+        response = self.batch('delete', [ids[0], {'id': ids[2]}])
+        self.assertEqual(response.json(), {'deleted': 2})
+        self.assertEqual(list(Product.objects.values_list('pk', flat=True)), [ids[1]])
+        self.assertEqual(self.counts(), (1, 0))
+
+    def test_deleting_categories_in_use_is_reported(self):
+        Product.objects.create(**{**self.item(0), 'category': self.rings})
+        response = self.client.delete('/api/categories/batch/', [self.rings.pk, self.chains.pk],
+                                      content_type='application/json')
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("still referenced", response.json()['errors'][0]['errors']['non_field_errors'][0])
+        self.assertEqual(ProductCategory.objects.count(), 2)
+
+    def counts(self):
+        return tuple(ProductCategory.objects.filter(pk__in=[self.rings.pk, self.chains.pk])
+                     .order_by('category').reverse().values_list('product_count', flat=True))
+
+
+class CategoryTreeTests(TestCase):
+    """Materialized paths under moves"""
+
+    def setUp(self):
+        self.jewellery = ProductCategory.objects.create(category="Jewellery")
+        self.rings = ProductCategory.objects.create(category="Rings", parent=self.jewellery)
+        self.gold_rings = ProductCategory.objects.create(category="Gold rings", parent=self.rings)
+        self.necklaces = ProductCategory.objects.create(category="Necklaces")
+        for category in (self.rings, self.gold_rings, self.necklaces):
+            Product.objects.create(product_id=f"P-{category.slug}", product_name=category.category,
+                                   category=category, image1='products/item.jpg')
+
+    def subtree(self, category):
+        category.refresh_from_db()
+        return set(ProductCategory.descendants_of(category.path).values_list('category', flat=True))
+
+    def test_paths_follow_the_hierarchy(self):
+        self.gold_rings.refresh_from_db()
+        self.assertEqual(self.gold_rings.path, f"{self.jewellery.pk}/{self.rings.pk}/{self.gold_rings.pk}/")
+        self.assertEqual(self.subtree(self.jewellery), {"Jewellery", "Rings", "Gold rings"})
+
+    def test_moving_a_category_moves_its_subtree(self):
+        self.rings.parent = self.necklaces
+        self.rings.save()
+
+        self.assertEqual(self.subtree(self.jewellery), {"Jewellery"})
+        self.assertEqual(self.subtree(self.necklaces), {"Necklaces", "Rings", "Gold rings"})
+        self.gold_rings.refresh_from_db()
+        self.assertEqual(self.gold_rings.path, f"{self.necklaces.pk}/{self.rings.pk}/{self.gold_rings.pk}/")
+
+        self.rings.parent = None
+        self.rings.save()
+        self.assertEqual(self.subtree(self.rings), {"Rings", "Gold rings"})
+        self.assertEqual(self.subtree(self.necklaces), {"Necklaces"})
+
+    def test_cycles_are_rejected(self):
+        for parent in (self.jewellery, self.gold_rings):
+            self.jewellery.parent = parent
+            with self.assertRaises(ValidationError):
+                self.jewellery.save()
+        self.jewellery.refresh_from_db()
+        self.assertIsNone(self.jewellery.parent_id)
+
+        response = self.client.patch(f'/api/categories/{self.rings.slug}/', {'parent': self.gold_rings.pk},
+                                     content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('parent', response.json())
+
+    def test_products_of_a_subtree_are_read_by_path_prefix(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(f'/api/products/by-category/{self.jewellery.slug}/', {'descendants': 1})
+        self.assertEqual({product['product_name'] for product in response.json()}, {"Rings", "Gold rings"})
+        # The root's path by slug, then the products with the path as a literal prefix
+        self.assertEqual(len(queries), 2)
+        self.assertIn(f"LIKE '{self.jewellery.pk}/%'", queries[1]['sql'])
+
+        response = self.client.get('/api/products/by-category/missing/', {'descendants': 1})
+        self.assertEqual(response.json(), [])
+
+        response = self.client.get(f'/api/products/by-category/{self.jewellery.slug}/')
+        self.assertEqual(response.json(), [])
+
+
+class ProductCountTests(TestCase):
+    """ProductCategory.product_count across single, bulk and batch writes"""
+
+    def setUp(self):
+        self.rings = ProductCategory.objects.create(category="Rings")
+        self.chains = ProductCategory.objects.create(category="Chains")
+
+    def create(self, n, category):
+        return Product.objects.create(product_id=f"P{n}", product_name=f"Product {n}",
+                                      category=category, image1='products/item.jpg')
+
+    def assertCounts(self, rings, chains):
+        self.rings.refresh_from_db()
+        self.chains.refresh_from_db()
+        self.assertEqual((self.rings.product_count, self.chains.product_count), (rings, chains))
+        self.assertFalse(counters.drifted().exists())
+
+    def test_single_writes(self):
+        products = [self.create(n, self.rings) for n in range(3)]
+        self.assertCounts(3, 0)
+
+        products[0].category = self.chains
+        products[0].save()
+        products[1].product_name = "Renamed"
+        products[1].save()
+        self.assertCounts(2, 1)
+
+        products[0].delete()
+        Product.objects.filter(pk=products[1].pk).delete()
+        self.assertCounts(1, 0)
+
+    def test_saving_after_refresh_does_not_count_a_move_twice(self):
+        product = self.create(0, self.rings)
+        other = Product.objects.get(pk=product.pk)
+        other.category = self.chains
+        other.save()
+
+        product.refresh_from_db()
+        product.product_name = "Renamed"
+        product.save()
+        self.assertCounts(0, 1)
+
+    def test_moves_from_stale_instances_count_against_the_stored_category(self):
+        product = self.create(0, self.rings)
+        first, second = Product.objects.get(pk=product.pk), Product.objects.get(pk=product.pk)
+        first.category = self.chains
+        first.save()
+
+        # Loaded in Rings, but the row is in Chains by now
+        second.category = self.chains
+        second.save()
+        self.assertCounts(0, 1)
+        second.category = self.rings
+        second.save()
+        self.assertCounts(1, 0)
+
+    def test_batch_writes(self):
+        self.enterContext(self.settings(MEDIA_ROOT=self.enterContext(tempfile.TemporaryDirectory())))
+        default_storage.save('products/item.png', ContentFile(b'not an image'))
+        items = [{'product_id': f"P{n}", 'product_name': f"Product {n}", 'category': self.rings.pk,
+                  'image1': 'products/item.png'} for n in range(4)]
+        response = self.client.post('/api/products/batch/', items, content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        ids = [product['id'] for product in response.json()]
+        self.assertCounts(4, 0)
+
+        response = self.client.patch('/api/products/batch/', [{'id': pk, 'category': self.chains.pk} for pk in ids[:3]],
+                                     content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertCounts(1, 3)
+
+        response = self.client.delete('/api/products/batch/', ids[1:], content_type='application/json')
+        self.assertEqual(response.json(), {'deleted': 3})
+        self.assertCounts(0, 1)
+
+    def test_recountproducts_repairs_drifted_counts(self):
+        for n in range(2):
+            self.create(n, self.rings)
+        ProductCategory.objects.filter(pk=self.rings.pk).update(product_count=7)
+        ProductCategory.objects.filter(pk=self.chains.pk).update(product_count=1)
+
+        out = io.StringIO()
+        call_command('recountproducts', '--dry-run', stdout=out)
+        self.assertIn("2 categories have a wrong product count", out.getvalue())
+        self.assertEqual(counters.drifted().count(), 2)
+
+        call_command('recountproducts', stdout=io.StringIO())
+        self.assertCounts(2, 0)
+
+
+class JobQueueTests(TestCase):
+    """Claiming, retrying and pruning jobs without a worker process"""
+
+    def claimed(self, limit=10):
+        return [job.pk for job in jobs.claim(limit, visibility_timeout=60)]
+
+    def expire(self, job):
+        Job.objects.filter(pk=job.pk).update(locked_until=timezone.now() - timedelta(seconds=1))
+
+    def test_claim_takes_runnable_jobs_by_priority(self):
+        low = jobs.enqueue('adminapp.tasks.low')
+        high = jobs.enqueue('adminapp.tasks.high', {'n': 1}, priority=5)
+        jobs.enqueue('adminapp.tasks.later', delay=60)
+
+        self.assertEqual(self.claimed(), [high.pk, low.pk])
+        high.refresh_from_db()
+        self.assertEqual((high.status, high.attempts, high.payload), (Job.STATUS_RUNNING, 1, {'n': 1}))
+        self.assertEqual(self.claimed(), [])
+
+    def test_expired_claims_are_taken_over(self):
+        jobs.enqueue('adminapp.tasks.slow')
+        [first] = jobs.claim(1, visibility_timeout=60)
+        self.expire(first)
+        [second] = jobs.claim(1, visibility_timeout=60)
+
+        self.assertEqual((second.pk, second.attempts), (first.pk, 2))
+        self.assertFalse(jobs.mark_done(first))
+        self.assertTrue(jobs.mark_done(second))
+        self.assertEqual(Job.objects.get().status, Job.STATUS_DONE)
+
+    def test_failures_retry_with_backoff_until_max_attempts(self):
+        jobs.enqueue('adminapp.tasks.flaky', max_attempts=2)
+        [job] = jobs.claim(1, visibility_timeout=60)
+        before = timezone.now()
+        self.assertTrue(jobs.mark_failed(job, "boom"))
+
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.last_error), (Job.STATUS_QUEUED, "boom"))
+        self.assertGreaterEqual(job.run_after, before + timedelta(seconds=2))
+        self.assertEqual(self.claimed(), [])
+
+        Job.objects.update(run_after=timezone.now())
+        [job] = jobs.claim(1, visibility_timeout=60)
+        jobs.mark_failed(job, "boom again")
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.STATUS_FAILED, 2))
+        self.assertIsNotNone(job.finished_at)
+
+    def test_jobs_whose_worker_died_on_the_last_attempt_fail(self):
+        jobs.enqueue('adminapp.tasks.fatal', max_attempts=1)
+        [job] = jobs.claim(1, visibility_timeout=60)
+        self.expire(job)
+
+        self.assertEqual(self.claimed(), [])
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.STATUS_FAILED)
+        self.assertIn("visibility timeout", job.last_error)
+
+    def test_released_jobs_keep_their_attempts(self):
+        jobs.enqueue('adminapp.tasks.unstarted', max_attempts=1)
+        jobs.release(jobs.claim(1, visibility_timeout=60))
+        job = Job.objects.get()
+        self.assertEqual((job.status, job.attempts), (Job.STATUS_QUEUED, 0))
+        self.assertEqual(len(self.claimed()), 1)
+
+    def test_prune_deletes_old_finished_jobs(self):
+        old, recent, failed, queued = (jobs.enqueue(f'adminapp.tasks.t{n}') for n in range(4))
+        now = timezone.now()
+        Job.objects.filter(pk__in=[old.pk, failed.pk]).update(finished_at=now - timedelta(days=8))
+        Job.objects.filter(pk__in=[old.pk, recent.pk]).update(status=Job.STATUS_DONE)
+        Job.objects.filter(pk=recent.pk).update(finished_at=now)
+        Job.objects.filter(pk=failed.pk).update(status=Job.STATUS_FAILED)
+
+        self.assertEqual(jobs.prune(), 2)
+        self.assertEqual(set(Job.objects.values_list('pk', flat=True)), {recent.pk, queued.pk})
+
+
+@skipUnlessDBFeature('has_select_for_update_skip_locked')
+class JobClaimLockingTests(TransactionTestCase):
+    """Row locks need a second connection, so this runs outside a test transaction"""
+
+    def test_claim_skips_jobs_locked_by_another_worker(self):
+        first, second = jobs.enqueue('adminapp.tasks.a'), jobs.enqueue('adminapp.tasks.b')
+        locked, release = threading.Event(), threading.Event()
+
+        def hold_lock():
+            try:
+                with transaction.atomic():
+                    Job.objects.select_for_update().get(pk=first.pk)
+                    locked.set()
+                    release.wait(10)
+            finally:
+                connection.close()
+
+        worker = threading.Thread(target=hold_lock)
+        worker.start()
+        try:
+            self.assertTrue(locked.wait(10))
+            self.assertEqual([job.pk for job in jobs.claim(10, visibility_timeout=60)], [second.pk])
+        finally:
+            release.set()
+            worker.join()
+
+
+def gradient_png(descending=False):
+    """A horizontal grey ramp; its dHash is all zeros, or all ones when it descends"""
+    image = Image.new('L', (90, 80))
+    image.putdata([(89 - x if descending else x) * 2 for y in range(80) for x in range(90)])
+    data = io.BytesIO()
+    image.save(data, 'PNG')
+    data.seek(0)
+    return data
+
+
+class SimilarityTests(TestCase):
+    """Perceptual hashes and the Hamming-distance ranking"""
+
+    def setUp(self):
+        self.rings = ProductCategory.objects.create(category="Rings")
+        self.chains = ProductCategory.objects.create(category="Chains")
+
+    def create(self, n, category, image1_hash=None, image2_hash=None):
+        product = Product.objects.create(product_id=f"S{n}", product_name=f"Item {n}",
+                                         category=category, image1='products/item.jpg')
+        Product.objects.filter(pk=product.pk).update(image1_hash=image1_hash, image2_hash=image2_hash)
+        return Product.objects.get(pk=product.pk)
+
+    def test_dhash(self):
+        self.assertEqual(similarity.dhash(gradient_png()), 0)
+        self.assertEqual(similarity.dhash(gradient_png(descending=True)), (1 << 64) - 1)
+        self.assertEqual(similarity.to_signed((1 << 64) - 1), -1)
+
+    def test_ranking_by_hamming_distance(self):
+        query = self.create(0, self.rings, 0b0000)
+        near = self.create(1, self.rings, 0b1111_0000, 0b0001)  # The closer image counts
+        far = self.create(2, self.rings, 0b0111)
+        other = self.create(3, self.chains, 0b0011)
+        opposite = self.create(4, self.rings, -1)  # All 64 bits differ
+        self.create(5, self.rings)  # Not hashed yet
+        index = similarity.SimilarityIndex()
+        index.rebuild()
+
+        self.assertEqual(index.similar(query), [(near.pk, 1), (other.pk, 2), (far.pk, 3), (opposite.pk, 64)])
+        self.assertEqual(index.similar(query, limit=2), [(near.pk, 1), (other.pk, 2)])
+        self.assertEqual(index.similar(query, same_category=True), [(near.pk, 1), (far.pk, 3), (opposite.pk, 64)])
+
+    def test_saves_queue_hashing_of_changed_images(self):
+        self.enterContext(self.settings(MEDIA_ROOT=self.enterContext(tempfile.TemporaryDirectory())))
+        default_storage.save('products/ramp.png', ContentFile(gradient_png(descending=True).getvalue()))
+        hash_jobs = Job.objects.filter(task='adminapp.tasks.hash_images')
+        product = self.create(0, self.rings)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            product.product_name = "Renamed"
+            product.save()
+        self.assertFalse(hash_jobs.exists())
+
+        with self.captureOnCommitCallbacks(execute=True):
+            product.image1 = 'products/ramp.png'
+            product.save()
+        [job] = hash_jobs
+        self.assertEqual(job.payload, {'pks': [product.pk]})
+        stale = Product.objects.get(pk=product.pk)
+        self.assertIsNone(stale.image1_hash)
+
+        jobs.run(job.task, job.payload)
+        stale.product_name = "Saved from a copy loaded before hashing"
+        stale.save()
+        product.refresh_from_db()
+        self.assertEqual(product.image1_hash, -1)
+
+
+def png_bytes(size=(32, 32)):
+    image = io.BytesIO()
+    Image.new('RGB', size, 'silver').save(image, 'PNG')
+    return image.getvalue()
+
+
+class ChunkedUploadTests(TestCase):
+    """The /api/uploads/ protocol from start to finalize"""
+
+    def setUp(self):
+        self.media_root = self.enterContext(tempfile.TemporaryDirectory())
+        self.partial_dir = self.enterContext(tempfile.TemporaryDirectory())
+        self.enterContext(self.settings(MEDIA_ROOT=self.media_root, CHUNKED_UPLOAD_DIR=self.partial_dir))
+        category = ProductCategory.objects.create(category="Bangles")
+        self.product = Product.objects.create(product_id="B1", product_name="Bangle", category=category,
+                                              image1='products/old.jpg')
+
+    def start(self, content, filename='bangle.png'):
+        response = self.client.post('/api/uploads/', {'filename': filename, 'size': len(content)},
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        return response.json()['id']
+
+    def put(self, upload_id, content, start, end=None):
+        end = start + len(content) - 1 if end is None else end
+        return self.client.put(f'/api/uploads/{upload_id}/', content, content_type='application/octet-stream',
+                               HTTP_CONTENT_RANGE=f'bytes {start}-{end}/{self.size}')
+
+    def finalize(self, upload_id, field='image1'):
+        return self.client.post(f'/api/uploads/{upload_id}/finalize/',
+                                {'target': 'product', 'object_id': self.product.pk, 'field': field},
+                                content_type='application/json')
+
+    def test_resumed_upload_is_attached_to_the_product(self):
+        content = png_bytes()
+        self.size = len(content)
+        upload_id = self.start(content)
+        middle = self.size // 2
+
+        self.assertEqual(self.put(upload_id, content[:middle], 0).json()['offset'], middle)
+        # A retried first chunk is refused with the offset to resume from
+        response = self.put(upload_id, content[:middle], 0)
+        self.assertEqual((response.status_code, response.json()['offset']), (409, middle))
+        self.assertEqual(self.client.get(f'/api/uploads/{upload_id}/').json()['offset'], middle)
+        self.assertEqual(self.finalize(upload_id).status_code, 409)
+
+        self.assertEqual(self.put(upload_id, content[middle:], middle).json()['offset'], self.size)
+        self.assertEqual(self.finalize(upload_id).status_code, 200)
+
+        self.product.refresh_from_db()
+        self.assertRegex(self.product.image1.name, r'^products/bangle[^/]*\.png$')
+        with self.product.image1.open('rb') as fh:
+            self.assertEqual(fh.read(), content)
+        self.assertFalse(os.listdir(self.partial_dir))
+        self.assertEqual(self.finalize(upload_id).status_code, 409)
+
+    def test_stored_name_follows_the_detected_format(self):
+        content = png_bytes() + b'<html><script>alert(1)</script></html>'
+        self.size = len(content)
+        upload_id = self.start(content, filename='../../evil.html')
+        self.put(upload_id, content, 0)
+
+        self.assertEqual(self.finalize(upload_id).status_code, 200)
+        self.product.refresh_from_db()
+        self.assertEqual(os.path.dirname(self.product.image1.name), 'products')
+        self.assertTrue(self.product.image1.name.endswith('.png'))
+
+    def test_bad_chunks_and_content_are_rejected(self):
+        content = b'not an image at all'
+        self.size = len(content)
+        upload_id = self.start(content, filename='notes.png')
+
+        self.assertEqual(self.put(upload_id, content, 0, end=self.size).status_code, 400)
+        self.assertEqual(self.put(upload_id, content[5:], 5).status_code, 409)
+        self.put(upload_id, content, 0)
+        response = self.finalize(upload_id)
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Upload.objects.get(pk=upload_id).completed)
+        self.assertEqual(self.finalize(upload_id, field='image').status_code, 400)
+
+    def test_removed_partial_file_is_not_recreated(self):
+        content = png_bytes()
+        self.size = len(content)
+        upload_id = self.start(content)
+        self.put(upload_id, content[:10], 0)
+        os.remove(uploads.partial_path(Upload.objects.get(pk=upload_id)))
+
+        self.assertEqual(self.put(upload_id, content[10:], 10).status_code, 410)
+        self.assertFalse(os.listdir(self.partial_dir))
+
+
+class ExplainAuditTests(TestCase):
+    """Every API route and admin changelist reads its tables through indexes"""
+
+    def test_audited_queries_use_indexes(self):
+        out = io.StringIO()
+        call_command('explainaudit', products=5000, stdout=out)
+        self.assertIn("All audited queries use indexes.", out.getvalue())
+
+
+class SuggestIndexTests(TestCase):
+    """The typeahead index follows committed saves and deletes"""
+
+    def setUp(self):
+        self.rings = ProductCategory.objects.create(category="Gold Rings")
+        self.product = Product.objects.create(product_id="GR100", product_name="Solitaire Ring",
+                                              category=self.rings, image1='products/item.jpg')
+        suggest.index.rebuild()
+
+    def labels(self, query):
+        return [label for _, _, label, _ in suggest.index.search(query)]
+
+    def test_prefix_match(self):
+        self.assertEqual(self.labels("ring"), ["Solitaire Ring (GR100)", "Gold Rings"])
+        self.assertEqual(self.labels("sol"), ["Solitaire Ring (GR100)"])
+        self.assertEqual(self.labels("gr1"), ["Solitaire Ring (GR100)"])
+        self.assertEqual(self.labels("go"), ["Gold Rings"])
+        self.assertEqual(self.labels("x"), [])
+
+        response = self.client.get('/api/suggestions/', {'q': 'gold'})
+        self.assertEqual(response.json(), [{'type': 'category', 'id': self.rings.pk, 'label': "Gold Rings", 'slug': 'gold-rings'}])
+
+    def test_update_and_delete_apply_on_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.product_name = "Halo Ring"
+            self.product.save()
+        self.assertEqual(self.labels("sol"), [])
+        self.assertEqual(self.labels("halo"), ["Halo Ring (GR100)"])
+        self.assertEqual(self.labels("ring"), ["Halo Ring (GR100)", "Gold Rings"])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.delete()
+        self.assertEqual(self.labels("halo"), [])
+        self.assertEqual(self.labels("ring"), ["Gold Rings"])
+
+    def test_rolled_back_save_is_not_indexed(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            try:
+                with transaction.atomic():
+                    self.product.product_name = "Halo Ring"
+                    self.product.save()
+                    raise DatabaseError("rolled back")
+            except DatabaseError:
+                pass
+        self.assertEqual(self.labels("halo"), [])
+        self.assertEqual(self.labels("sol"), ["Solitaire Ring (GR100)"])
+
+    def test_inconsistent_index_schedules_a_rebuild(self):
+        keys, entries = suggest.index._snapshot
+        i = keys.index("gr100")
+        suggest.index._snapshot = (keys[:i] + keys[i + 1:], entries[:i] + entries[i + 1:])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.product_name = "Halo Ring"
+            self.product.save()
+        self.assertEqual(self.labels("halo"), ["Halo Ring (GR100)"])
+
+        with mock.patch.object(suggest.threading, 'Thread') as thread:
+            suggest.index.ensure_fresh()
+        thread.assert_called_once()
+        suggest.index._pending = None
+
+
+class BannerScheduleTests(TestCase):
+    """Live banners switch on their schedule and on saves"""
+
+    def setUp(self):
+        self.now = timezone.now().replace(microsecond=0)
+        self.banner = Banner.objects.create(
+            name="Diwali", image='banners/diwali.png',
+            starts_at=self.now + timedelta(hours=1), ends_at=self.now + timedelta(hours=2),
+        )
+
+    def live_at(self, when):
+        live, boundary = banners.compute(when)
+        return [banner.name for banner in live], boundary
+
+    def test_switches_exactly_at_start_and_end(self):
+        starts, ends = self.banner.starts_at, self.banner.ends_at
+        self.assertEqual(self.live_at(starts - timedelta(microseconds=1)), ([], starts))
+        self.assertEqual(self.live_at(starts), (["Diwali"], ends))
+        self.assertEqual(self.live_at(ends - timedelta(microseconds=1)), (["Diwali"], ends))
+        self.assertEqual(self.live_at(ends), ([], None))
+
+    def test_cached_set_expires_at_the_next_boundary(self):
+        cache = banners.ActiveBannerSet()
+        with mock.patch('django.utils.timezone.now', return_value=self.banner.starts_at - timedelta(seconds=1)):
+            self.assertEqual(cache.get(), [])
+        with mock.patch('django.utils.timezone.now', return_value=self.banner.starts_at):
+            self.assertEqual(cache.get(), [self.banner])
+
+    def test_saves_invalidate_every_process_on_commit(self):
+        other = banners.ActiveBannerSet()  # Another process's copy
+        with mock.patch('django.utils.timezone.now', return_value=self.banner.starts_at):
+            self.assertEqual(other.get(), [self.banner])
+
+            with self.captureOnCommitCallbacks() as callbacks:
+                self.banner.active = False
+                self.banner.save()
+            # Nothing changes until the save commits
+            self.assertEqual(other.get(), [self.banner])
+            for callback in callbacks:
+                callback()
+
+            with self.assertNumQueries(1):
+                self.assertEqual(other.get(), [])
+            with self.assertNumQueries(0):
+                self.assertEqual(other.get(), [])
+
+
+class CatalogSnapshotTests(TestCase):
+    """Snapshots are published for committed changes only"""
+
+    def setUp(self):
+        self.root = self.enterContext(tempfile.TemporaryDirectory())
+        self.enterContext(self.settings(CATALOG_SNAPSHOT_ROOT=self.root))
+        snapshots._pending.batch = None
+
+    def create_ring(self):
+        rings = ProductCategory.objects.create(category="Rings")
+        Product.objects.create(product_id="R1", product_name="Band", category=rings, image1='products/item.jpg')
+        return rings
+
+    def publish_jobs(self):
+        return Job.objects.filter(task='adminapp.snapshots.publish_job')
+
+    def read(self, *parts):
+        with open(os.path.join(self.root, 'api', *parts, 'index.json')) as fh:
+            return json.load(fh)
+
+    def test_committed_changes_are_published_by_the_worker(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            rings = self.create_ring()
+        [job] = self.publish_jobs()
+        self.assertEqual(job.payload, {'targets': [['categories'], ['category', 'rings'], ['category-id', rings.pk]]})
+        self.assertFalse(os.path.exists(os.path.join(self.root, 'api')))
+
+        jobs.run(job.task, job.payload)
+        self.assertEqual([category['category'] for category in self.read('categories')], ["Rings"])
+        self.assertEqual([product['product_id'] for product in self.read('products', 'by-category', 'rings')], ["R1"])
+
+    def test_rolled_back_changes_are_forgotten(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            try:
+                with transaction.atomic():
+                    self.create_ring()
+                    raise DatabaseError("rolled back")
+            except DatabaseError:
+                pass
+            ProductCategory.objects.create(category="Chains")
+        [job] = self.publish_jobs()
+        self.assertEqual(job.payload, {'targets': [['categories'], ['category', 'chains']]})
+
+    @override_settings(CATALOG_SNAPSHOT_ASYNC=False)
+    def test_synchronous_publishing(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.create_ring()
+        self.assertFalse(self.publish_jobs().exists())
+        self.assertEqual([product['product_id'] for product in self.read('products', 'by-category', 'rings')], ["R1"])
+
+
+class ScopedMiddlewareTests(TestCase):
+    """The API runs without the admin's session, CSRF and auth middleware"""
+
+    def setUp(self):
+        self.client = Client(enforce_csrf_checks=True)
+
+    def test_api_skips_sessions_and_csrf(self):
+        response = self.client.post('/api/categories/', {'category': "Rings"}, content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(dict(response.cookies), {})
+        self.assertFalse(hasattr(response.wsgi_request, 'session'))
+        self.assertFalse(response.wsgi_request.user.is_authenticated)  # Set by DRF, not AuthenticationMiddleware
+
+    def test_admin_keeps_sessions_and_csrf(self):
+        response = self.client.get('/admin/login/')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('csrftoken', response.cookies)
+        self.assertTrue(hasattr(response.wsgi_request, 'session'))
+        self.assertFalse(response.wsgi_request.user.is_authenticated)
+
+        with self.assertLogs('django.security.csrf', 'WARNING'):
+            response = self.client.post('/admin/login/', {'username': 'admin', 'password': 'admin'})
+        self.assertEqual(response.status_code, 403)
+
+    def test_api_permissions_are_explicit(self):
+        self.assertEqual(api_settings.DEFAULT_PERMISSION_CLASSES, [AllowAny])
+
+
+class StreamingListTests(TestCase):
+    """?stream=1 returns the same bytes as the regular list and is logged in full"""
+
+    def setUp(self):
+        rings = ProductCategory.objects.create(category="Rings")
+        for n, name in enumerate(["Gold band", "Silver ring", "Gold hoop", "Pearl ring", "Gold chain"]):
+            Product.objects.create(product_id=f"ST{n}", product_name=name, category=rings,
+                                   image1='products/item.jpg')
+        self.enterContext(mock.patch('adminapp.views.StreamingListMixin.stream_chunk_size', 2))
+
+    def get(self, params, accept='application/json'):
+        response = self.client.get('/api/products/', params, HTTP_ACCEPT=accept)
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content) if response.streaming else response.content
+
+    def test_streamed_body_matches_the_regular_list(self):
+        for params in ({}, {'search': "gold"}, {'search': "nothing"}, {'ordering': 'product_name'},
+                       {'ordering': '-product_name', 'search': "ring"}):
+            for accept in ('application/json', 'application/json; indent=2'):
+                with self.subTest(params=params, accept=accept):
+                    self.assertEqual(self.get({**params, 'stream': 1}, accept), self.get(params, accept))
+
+    def test_access_log_counts_streamed_bytes_and_queries(self):
+        access_logger = logging.getLogger('store.access')
+        access_logger.disabled = False
+        self.addCleanup(setattr, access_logger, 'disabled', True)
+
+        with self.assertLogs('store.access') as logged:
+            body = self.get({'stream': 1})
+            regular = self.get({})
+        streamed, listed = logged.records
+        self.assertEqual((streamed.response_bytes, listed.response_bytes), (len(body), len(regular)))
+        # The rows are read while streaming, after the view has returned
+        self.assertEqual(streamed.db_queries, listed.db_queries)
+
+    def test_client_going_away_still_logs(self):
+        access_logger = logging.getLogger('store.access')
+        access_logger.disabled = False
+        self.addCleanup(setattr, access_logger, 'disabled', True)
+
+        with self.assertLogs('store.access') as logged:
+            response = self.client.get('/api/products/', {'stream': 1})
+            first = next(iter(response.streaming_content))
+            response.close()
+        self.assertEqual(logged.records[0].response_bytes, len(first))
+
+
+class ApiProfileTests(SimpleTestCase):
+    """store.settings_api boots without the admin, sessions or optional renderer packages"""
+
+    # The profile with this run's databases, so it boots wherever the suite does
+    BOOT_SCRIPT = """
+import json, os, sys
+from django.conf import settings
+from store import settings_api
+settings.configure(**{
+    **{name: getattr(settings_api, name) for name in dir(settings_api) if name.isupper()},
+    'DATABASES': json.loads(os.environ['BOOT_DATABASES']),
+})
+from django.apps import apps
+from django.core.wsgi import get_wsgi_application
+from django.urls import Resolver404, resolve
+get_wsgi_application()
+try:
+    resolve('/admin/')
+    admin_routed = True
+except Resolver404:
+    admin_routed = False
+print(json.dumps({
+    'apps': [app for app in ('django.contrib.admin', 'django.contrib.sessions', 'django.contrib.messages',
+                             'unfold') if apps.is_installed(app)],
+    'modules': [name for name in ('unfold', 'yaml', 'pygments', 'PIL', 'numpy') if sys.modules.get(name)],
+    'admin_routed': admin_routed,
+    'api_routed': resolve('/api/products/').url_name,
+}))
+"""
+
+    def test_boots_without_admin_apps(self):
+        result = subprocess.run(
+            [sys.executable, '-c', self.BOOT_SCRIPT], cwd=settings.BASE_DIR, capture_output=True, text=True,
+            env={**os.environ, 'BOOT_DATABASES': json.dumps(settings.DATABASES, default=str)},
+        )
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertEqual(json.loads(result.stdout), {
+            'apps': [], 'modules': [], 'admin_routed': False, 'api_routed': 'product-list',
+        })
+
+
+def take_tokens(path, key, attempts):
+    """Child process body for the concurrency test"""
+    table = throttling.BucketTable(path, 64)
+    return sum(not table.take(key, 50, 0.001, 1000.0) for _ in range(attempts))
+
+
+class ThrottleTests(TestCase):
+    """Token buckets in the shared table"""
+
+    def setUp(self):
+        directory = self.enterContext(tempfile.TemporaryDirectory())
+        self.path = os.path.join(directory, 'buckets')
+        self.table = throttling.BucketTable(self.path, 64)
+
+    def test_limit_and_refill(self):
+        capacity, refill = throttling.parse_rate('3/s')
+        self.assertEqual([self.table.take('list:1.2.3.4', capacity, refill, 100.0) for _ in range(3)], [0, 0, 0])
+        self.assertAlmostEqual(self.table.take('list:1.2.3.4', capacity, refill, 100.0), 1 / 3)
+        self.assertEqual(self.table.take('list:5.6.7.8', capacity, refill, 100.0), 0)  # Another client
+
+        self.assertAlmostEqual(self.table.take('list:1.2.3.4', capacity, refill, 100.2), 1 / 3 - 0.2)
+        self.assertEqual(self.table.take('list:1.2.3.4', capacity, refill, 100.4), 0)
+        # However long the client was idle, the bucket refills only to its capacity
+        waits = [self.table.take('list:1.2.3.4', capacity, refill, 200.0) for _ in range(4)]
+        self.assertEqual(waits[:3], [0, 0, 0])
+        self.assertAlmostEqual(waits[3], 1 / 3)
+
+    def test_clock_stepping_back_does_not_drain_buckets(self):
+        self.table.take('list:1.2.3.4', 1, 1.0, 100.0)
+        self.assertAlmostEqual(self.table.take('list:1.2.3.4', 1, 1.0, 50.0), 1.0)
+        self.assertEqual(self.table.take('list:1.2.3.4', 1, 1.0, 51.0), 0)
+
+    def test_processes_share_buckets(self):
+        context = multiprocessing.get_context('fork')
+        with context.Pool(4) as pool:
+            allowed = pool.starmap(take_tokens, [(self.path, f"list:10.0.0.{n}", 80) for n in range(4)])
+        self.assertEqual(allowed, [50] * 4)
+        # The buckets are now empty for every process that opens the table
+        self.assertGreater(self.table.take('list:10.0.0.0', 50, 0.001, 1000.0), 0)
+
+    def test_table_file_is_named_per_project(self):
+        with self.settings(THROTTLE_NAMESPACE=None, BASE_DIR='/srv/one'):
+            one = throttling.namespace()
+        with self.settings(THROTTLE_NAMESPACE=None, BASE_DIR='/srv/two'):
+            self.assertNotEqual(throttling.namespace(), one)
+        with self.settings(THROTTLE_NAMESPACE='staging'):
+            self.assertEqual(throttling.namespace(), 'staging')
+
+    def test_api_responds_429_when_empty(self):
+        rates = {**settings.REST_FRAMEWORK, 'DEFAULT_THROTTLE_RATES': {'list': '2/min'}}
+        self.enterContext(self.settings(REST_FRAMEWORK=rates, THROTTLE_SHM_PATH=self.path))
+        self.enterContext(mock.patch.object(throttling, '_table', None))
+        statuses = [self.client.get('/api/banners/').status_code for _ in range(3)]
+        self.assertEqual(statuses, [200, 200, 429])
+        self.assertEqual(throttling.table().rejections(), {'list': 1})
+
+
+class ServeTests(SimpleTestCase):
+    """manage.py serve: worker counters and a full start, request and stop"""
+
+    def test_worker_stats(self):
+        stats = serve.WorkerStats(2)
+        stats.claim(1, 1234)
+        self.assertEqual([stats.increment(1) for _ in range(3)], [1, 2, 3])
+        pid, requests, started = stats.read(1)
+        self.assertEqual((pid, requests), (1234, 3))
+        self.assertEqual(stats.read(0)[:2], (0, 0))
+
+    def test_memory_of_this_process(self):
+        rss, pss = serve.memory(os.getpid())
+        if not os.path.exists('/proc/self/smaps_rollup'):
+            self.skipTest("needs /proc/<pid>/smaps_rollup")
+        self.assertGreater(rss, 0)
+        self.assertGreater(pss, 0)
+
+    def test_serves_requests_and_stops_on_sigterm(self):
+        with socket.socket() as probe:
+            probe.bind(('127.0.0.1', 0))
+            port = probe.getsockname()[1]
+        server = subprocess.Popen(
+            [sys.executable, 'manage.py', 'serve', '--bind', f'127.0.0.1:{port}', '--workers', '2',
+             '--stats-interval', '0'],
+            cwd=settings.BASE_DIR, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True,
+        )
+        self.addCleanup(server.kill)
+        deadline = time.monotonic() + 30
+        while True:
+            try:
+                socket.create_connection(('127.0.0.1', port), timeout=5).close()
+                break
+            except ConnectionRefusedError:
+                self.assertLess(time.monotonic(), deadline, "the server did not start")
+                time.sleep(0.1)
+
+        # An unrouted path answers from Django without touching the database
+        for _ in range(3):
+            with socket.create_connection(('127.0.0.1', port), timeout=5) as client:
+                client.sendall(b"GET /missing/ HTTP/1.1\r\nHost: localhost\r\n\r\n")
+                status_line = client.makefile('rb').readline()
+            self.assertEqual(status_line.split()[:2], [b'HTTP/1.0', b'404'])
+
+        server.send_signal(signal.SIGTERM)
+        stdout, stderr = server.communicate(timeout=60)
+        self.assertEqual(server.returncode, 0, stderr)
+        self.assertIn("Stopping workers", stdout)
+        self.assertIn("WSGI mode uses wsgiref", stderr)
+
+
+class ListHandler(logging.Handler):
+    """Collects formatted records; blocks on `gate` while it is cleared"""
+
+    def __init__(self):
+        super().__init__()
+        self.setFormatter(logs.JSONFormatter())
+        self.lines = []
+        self.gate = threading.Event()
+        self.gate.set()
+
+    def emit(self, record):
+        self.gate.wait(5)
+        self.lines.append(self.format(record))
+
+
+class LogQueueTests(TestCase):
+    """The bounded queue between loggers and their handlers"""
+
+    def setUp(self):
+        self.target = ListHandler()
+        self.queue = queue.Queue(2)
+        self.handler = logs.QueueHandler(self.queue, [self.target])
+        self.logger = logging.getLogger('adminapp.tests.logqueue')
+        self.logger.propagate = False
+        self.logger.addHandler(self.handler)
+        self.addCleanup(self.logger.removeHandler, self.handler)
+        self.listener = logs.QueueListener(self.queue)
+
+    def test_full_queue_drops_and_counts_records(self):
+        for n in range(5):
+            self.logger.warning("record %d", n)
+        self.assertEqual(self.handler.dropped, 3)
+
+        self.listener.start()
+        self.listener.stop()
+        self.assertEqual([json.loads(line)['message'] for line in self.target.lines], ["record 0", "record 1"])
+
+    def test_stop_waits_for_room_in_a_full_queue(self):
+        self.target.gate.clear()
+        self.listener.start()
+        for n in range(3):
+            self.logger.warning("record %d", n)
+            time.sleep(0.05)  # The first is taken off the queue and blocks in the handler
+        threading.Timer(0.2, self.target.gate.set).start()
+
+        self.listener.stop()
+        self.assertEqual((len(self.target.lines), self.listener.discarded), (3, 0))
+
+    def test_stop_makes_room_when_the_handler_is_stuck(self):
+        self.target.gate.clear()
+        self.listener.sentinel_timeout = 0.05
+        self.listener.start()
+        for n in range(3):
+            self.logger.warning("record %d", n)
+            time.sleep(0.05)
+        threading.Timer(0.5, self.target.gate.set).start()
+
+        self.listener.stop()
+        self.assertEqual((len(self.target.lines), self.listener.discarded), (2, 1))
+
+    def test_flush_reports_and_resets_the_drop_count(self):
+        for n in range(5):
+            self.logger.warning("record %d", n)
+        self.listener.start()
+
+        with mock.patch.object(logs, '_listener', self.listener), mock.patch('sys.stderr', new_callable=io.StringIO) as stderr:
+            logs.flush()
+            self.assertEqual(logs.dropped(), 0)
+        self.assertIn("dropped 3 log records", stderr.getvalue())
+        self.assertEqual(len(self.target.lines), 2)
+
+    def test_tracebacks_are_rendered_before_queueing(self):
+        self.listener.start()
+        try:
+            raise ValueError("bad rate")
+        except ValueError:
+            self.logger.exception("failed")
+        self.listener.stop()
+        self.assertIn("ValueError: bad rate", json.loads(self.target.lines[0])['exc_info'])
+
+    def test_error_mail_is_not_queued(self):
+        self.assertFalse(logs._queueable(AdminEmailHandler()))
+        self.assertTrue(logs._queueable(logging.StreamHandler()))
@@ -0,0 +1,176 @@
+"""
+Token-bucket throttling shared by every worker process on a host.
+
+Buckets live in a file-backed shared mapping (on /dev/shm by default), so
+all workers see the same counts without a cache server round trip. The file
+is named after THROTTLE_NAMESPACE (by default a hash of BASE_DIR), so two
+projects or checkouts on one host never share buckets. Bucket times are
+wall-clock seconds, so a table that outlives a reboot (the temporary
+directory fallback) still refills correctly.
+
+The table has a fixed number of slots. Each (scope, client IP) pair hashes to
+two independent candidate slots and takes over the less recently used one when it has no
+bucket yet. Slots are updated without locks: when two processes race on the
+same bucket, a request may occasionally be let through that a locked
+implementation would refuse, which is acceptable for scraper protection and
+keeps allowed requests to a few struct reads and writes.
+
+Rates come from REST_FRAMEWORK['DEFAULT_THROTTLE_RATES'] in DRF's
+"<requests>/<period>" form. A bucket holds up to <requests> tokens and
+refills at <requests>/<period> per second. Views choose their scope with a
+`throttle_scope` attribute; otherwise requests with a search term use
+'search', other collection reads use 'list', and everything else is not
+throttled. Rejections are counted per scope in the same mapping; see the
+throttlestats command. Clients are identified by DRF's get_ident, so
+NUM_PROXIES must match the deployment: with the default of 0 the socket
+address is used and X-Forwarded-For is ignored.
+"""
+import hashlib
+import mmap
+import os
+import struct
+import tempfile
+import time
+
+from django.conf import settings
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.settings import api_settings
+from rest_framework.throttling import BaseThrottle
+
+SLOT = struct.Struct('Qdd')  # key hash, tokens, last update
+COUNTER = struct.Struct('16sQ')  # scope name, rejected requests
+MAX_SCOPES = 16
+HEADER_SIZE = COUNTER.size * MAX_SCOPES
+PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+
+def parse_rate(rate):
+    """'120/min' -> (capacity, tokens per second)"""
+    num, period = rate.split('/')
+    return int(num), int(num) / PERIODS[period[0]]
+
+
+class BucketTable:
+    """Fixed-size table of token buckets in a shared mapping"""
+
+    def __init__(self, path, slots):
+        self.slots = slots
+        size = HEADER_SIZE + SLOT.size * slots
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            if os.fstat(fd).st_size < size:
+                os.ftruncate(fd, size)  # New pages read as zeros, i.e. empty slots
+            self.mem = mmap.mmap(fd, size)
+        finally:
+            os.close(fd)
+
+    def take(self, key, capacity, refill, now):
+        """Take one token from the bucket for `key`; return seconds to wait, or 0 if allowed"""
+        key_hash = int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), 'little') or 1
+        # Candidates come from independent halves of the hash, so keys that collide in
+        # their first slot are spread over the table instead of meeting again next door
+        first_index = (key_hash & 0xFFFFFFFF) % self.slots
+        second_index = (key_hash >> 32) % self.slots
+        if second_index == first_index:
+            second_index = (first_index + 1) % self.slots
+        first = HEADER_SIZE + first_index * SLOT.size
+        second = HEADER_SIZE + second_index * SLOT.size
+        mem = self.mem
+        stored, tokens, updated = SLOT.unpack_from(mem, first)
+        offset = first
+        if stored != key_hash:
+            other = SLOT.unpack_from(mem, second)
+            if other[0] == key_hash:
+                offset, (stored, tokens, updated) = second, other
+            else:
+                # No bucket yet: start a full one in the less recently used slot
+                if other[2] < updated:
+                    offset = second
+                tokens, updated = capacity, now
+
+        # Wall-clock time can step back (NTP); never let that drain a bucket
+        tokens = min(capacity, tokens + max(0.0, now - updated) * refill)
+        if tokens >= 1:
+            SLOT.pack_into(mem, offset, key_hash, tokens - 1, now)
+            return 0
+        SLOT.pack_into(mem, offset, key_hash, tokens, now)
+        return (1 - tokens) / refill
+
+    def count_rejection(self, scope):
+        name = scope.encode()[:16]
+        for index in range(MAX_SCOPES):
+            offset = index * COUNTER.size
+            stored, count = COUNTER.unpack_from(self.mem, offset)
+            stored = stored.rstrip(b'\0')
+            if stored == name or not stored:
+                COUNTER.pack_into(self.mem, offset, name, count + 1)
+                return
+
+    def rejections(self):
+        counts = {}
+        for index in range(MAX_SCOPES):
+            name, count = COUNTER.unpack_from(self.mem, index * COUNTER.size)
+            if name.rstrip(b'\0'):
+                counts[name.rstrip(b'\0').decode()] = count
+        return counts
+
+
+_table = None
+
+
+def table():
+    """The process's view of the shared table, opened on first use"""
+    global _table
+    if _table is None:
+        directory = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+        slots = getattr(settings, 'THROTTLE_SLOTS', 65536)
+        path = getattr(settings, 'THROTTLE_SHM_PATH', None) or os.path.join(
+            directory, f'store-throttle-{namespace()}-{slots}'
+        )
+        _table = BucketTable(path, slots)
+    return _table
+
+
+def namespace():
+    """Name that keeps this project's buckets apart from other projects on the host"""
+    name = getattr(settings, 'THROTTLE_NAMESPACE', None)
+    if name:
+        return name
+    return hashlib.blake2b(str(settings.BASE_DIR).encode(), digest_size=6).hexdigest()
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """Per-IP token bucket per scope, shared across worker processes"""
+    _parsed = {}
+
+    def get_scope(self, request, view):
+        scope = getattr(view, 'throttle_scope', None)
+        if scope:
+            return scope
+        if request.method not in SAFE_METHODS:
+            return None
+        if request.query_params.get(api_settings.SEARCH_PARAM):
+            return 'search'
+        if getattr(view, 'detail', None) is False:
+            return 'list'
+        return None
+
+    def allow_request(self, request, view):
+        self.wait_seconds = None
+        self.scope = self.get_scope(request, view)
+        rate = api_settings.DEFAULT_THROTTLE_RATES.get(self.scope) if self.scope else None
+        if rate is None:
+            return True
+        if rate not in self._parsed:
+            self._parsed[rate] = parse_rate(rate)
+        capacity, refill = self._parsed[rate]
+
+        wait = table().take(f"{self.scope}:{self.get_ident(request)}", capacity, refill, time.time())
+        if not wait:
+            return True
+        self.wait_seconds = wait
+        table().count_rejection(self.scope)
+        return False
+
+    def wait(self):
+        return self.wait_seconds
@@ -0,0 +1,224 @@
+"""
+Resumable chunked uploads for product and banner images.
+
+Protocol:
+  1. POST   /api/uploads/                  {"filename", "size"} -> {"id", "offset": 0, ...}
+  2. PUT    /api/uploads/<id>/             raw bytes, Content-Range: bytes <start>-<end>/<size>
+  3. GET    /api/uploads/<id>/             current offset, to resume after a dropped connection
+  4. POST   /api/uploads/<id>/finalize/    {"target": "banner"|"product", "object_id", "field"}
+
+Chunks are streamed straight into a partial file, so memory per upload stays at
+one read buffer. The partial file's size is the upload offset: a chunk is
+accepted only if it starts there, and after a failure the client resends from
+the offset the server reports. On finalize, only the image header is read
+(Pillow opens files lazily) to check format and dimensions before the file is
+attached to the target model. The stored name is built on the server, with the
+extension of the detected format, so a file that is also valid HTML or script
+is never stored under an extension the media server would serve as such.
+
+Partial files live in CHUNKED_UPLOAD_DIR, outside MEDIA_ROOT so they are never
+served. Uploads that are not finalized within CHUNKED_UPLOAD_EXPIRY seconds are
+removed by the expireuploads command, and new uploads are refused while the
+unfinished ones add up to CHUNKED_UPLOAD_MAX_PENDING bytes.
+"""
+import fcntl
+import os
+import re
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files import File
+from django.db.models import Sum
+from django.utils import timezone
+from django.utils.text import slugify
+
+from .models import Banner, Product, Upload
+
+READ_BUFFER = 64 * 1024
+CONTENT_RANGE = re.compile(r'^bytes (\d+)-(\d+)/(\d+)$')
+
+# Pillow format -> extension of the stored file
+EXTENSIONS = {'JPEG': '.jpg', 'PNG': '.png', 'WEBP': '.webp', 'GIF': '.gif'}
+
+# target -> (model, image fields that may be set)
+TARGETS = {
+    'banner': (Banner, ['image']),
+    'product': (Product, ['image1', 'image2']),
+}
+
+
+class UploadError(Exception):
+    """Raised with an HTTP status when a chunk or finalize request is rejected"""
+
+    def __init__(self, message, status=400, **extra):
+        super().__init__(message)
+        self.status = status
+        self.extra = extra
+
+
+def upload_dir():
+    return str(getattr(settings, 'CHUNKED_UPLOAD_DIR', None) or os.path.join(settings.BASE_DIR, 'partial_uploads'))
+
+
+def max_upload_size():
+    return getattr(settings, 'CHUNKED_UPLOAD_MAX_SIZE', 20 * 1024 * 1024)
+
+
+def max_chunk_size():
+    return getattr(settings, 'CHUNKED_UPLOAD_CHUNK_SIZE', 4 * 1024 * 1024)
+
+
+def max_pending_size():
+    return getattr(settings, 'CHUNKED_UPLOAD_MAX_PENDING', 2 * 1024 * 1024 * 1024)
+
+
+def expiry():
+    return timedelta(seconds=getattr(settings, 'CHUNKED_UPLOAD_EXPIRY', 24 * 3600))
+
+
+def partial_path(upload):
+    return os.path.join(upload_dir(), f"{upload.pk}.part")
+
+
+def offset(upload):
+    """Bytes received so far"""
+    try:
+        return os.path.getsize(partial_path(upload))
+    except FileNotFoundError:
+        return 0
+
+
+def check_capacity(size):
+    """Refuse a new upload while unfinished ones already reserve too much disk"""
+    pending = Upload.objects.filter(completed=False).aggregate(total=Sum('size'))['total'] or 0
+    if pending + size > max_pending_size():
+        raise UploadError("Too many unfinished uploads; try again later.", status=503)
+
+
+def start(upload):
+    """Create the empty partial file for a new upload"""
+    os.makedirs(upload_dir(), exist_ok=True)
+    open(partial_path(upload), 'xb').close()
+
+
+def expire(now=None):
+    """
+    Delete uploads not finalized within the expiry time, finalized uploads older than
+    that, and partial files without an upload row. Returns (rows deleted, files removed)
+    """
+    cutoff = (now or timezone.now()) - expiry()
+    stale = Upload.objects.filter(created_at__lt=cutoff)
+    removed = 0
+    for upload in stale.filter(completed=False):
+        try:
+            os.remove(partial_path(upload))
+            removed += 1
+        except FileNotFoundError:
+            pass
+    deleted, _ = stale.delete()
+
+    directory = upload_dir()
+    if os.path.isdir(directory):
+        known = {str(pk) for pk in Upload.objects.values_list('pk', flat=True)}
+        for name in os.listdir(directory):
+            path = os.path.join(directory, name)
+            # Files younger than the expiry may belong to an upload still being created
+            if (name.endswith('.part') and name[:-len('.part')] not in known
+                    and os.path.getmtime(path) < cutoff.timestamp()):
+                os.remove(path)
+                removed += 1
+    return deleted, removed
+
+
+def write_chunk(upload, stream, content_range, content_length):
+    """Append one chunk read from `stream` and return the new offset"""
+    match = CONTENT_RANGE.match(content_range or '')
+    if not match:
+        raise UploadError("Content-Range header must be 'bytes <start>-<end>/<size>'.")
+    first, last, total = (int(value) for value in match.groups())
+    length = last - first + 1
+    if total != upload.size or last >= upload.size or length <= 0:
+        raise UploadError("Content-Range does not match the upload size.")
+    if length > max_chunk_size():
+        raise UploadError(f"Chunks may be at most {max_chunk_size()} bytes.", status=413)
+    if content_length is not None and content_length != length:
+        raise UploadError("Content-Length does not match Content-Range.")
+
+    try:
+        # Not 'ab': a partial file that was removed must not be recreated mid-upload
+        fh = open(partial_path(upload), 'r+b')
+    except FileNotFoundError:
+        raise UploadError("The received data has expired; start a new upload.", status=410)
+    with fh:
+        try:
+            # One writer per upload; a concurrent retry of the same chunk is told to resume
+            fcntl.flock(fh, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            raise UploadError("Another chunk is being written.", status=409, offset=offset(upload))
+        current = fh.seek(0, os.SEEK_END)
+        if first != current:
+            raise UploadError("Chunk does not start at the upload offset.", status=409, offset=current)
+        remaining = length
+        while remaining:
+            data = stream.read(min(READ_BUFFER, remaining))
+            if not data:
+                break  # Client went away; the bytes received so far are kept
+            fh.write(data)
+            remaining -= len(data)
+        fh.flush()
+        return fh.tell()
+
+
+def inspect_image(path):
+    """Read only the image header and return (format, width, height)"""
+    allowed = getattr(settings, 'CHUNKED_UPLOAD_IMAGE_FORMATS', ['JPEG', 'PNG', 'WEBP', 'GIF'])
+    max_side = getattr(settings, 'CHUNKED_UPLOAD_MAX_DIMENSION', 8000)
+    from PIL import Image  # Imported on first use; most workers never inspect an upload
+
+    try:
+        with Image.open(path) as img:
+            image_format, (width, height) = img.format, img.size
+    except (OSError, Image.DecompressionBombError):
+        raise UploadError("The uploaded file is not a supported image.")
+    if image_format not in allowed:
+        raise UploadError(f"Image format {image_format} is not allowed; use one of {', '.join(allowed)}.")
+    if width > max_side or height > max_side:
+        raise UploadError(f"Images may be at most {max_side}px on each side (got {width}x{height}).")
+    return image_format, width, height
+
+
+def finalize(upload, target, object_id, field):
+    """Validate the complete file and attach it to the target object's image field"""
+    if target not in TARGETS:
+        raise UploadError(f"Target must be one of {', '.join(TARGETS)}.")
+    model, fields = TARGETS[target]
+    if field not in fields:
+        raise UploadError(f"Field must be one of {', '.join(fields)} for {target}.")
+    if upload.completed:
+        raise UploadError("Upload is already finalized.", status=409)
+    received = offset(upload)
+    if received != upload.size:
+        raise UploadError("Upload is not complete.", status=409, offset=received)
+    instance = model.objects.filter(pk=object_id).first()
+    if instance is None:
+        raise UploadError(f"No {target} with id {object_id}.", status=404)
+
+    path = partial_path(upload)
+    image_format, _, _ = inspect_image(path)
+    stem = slugify(os.path.splitext(os.path.basename(upload.filename))[0])[:80] or upload.pk.hex
+    name = stem + EXTENSIONS.get(image_format, f'.{image_format.lower()}')
+    # Claim the upload with a conditional UPDATE so only one of two concurrent finalize
+    # calls attaches the file; the row is not locked while the file is copied
+    claimed = Upload.objects.filter(pk=upload.pk, completed=False).update(completed=True, updated_at=timezone.now())
+    if not claimed:
+        raise UploadError("Upload is already finalized.", status=409)
+    try:
+        with open(path, 'rb') as fh:
+            # Storage copies the file chunk by chunk
+            getattr(instance, field).save(name, File(fh), save=True)
+    except BaseException:
+        Upload.objects.filter(pk=upload.pk).update(completed=False)
+        raise
+    os.remove(path)
+    upload.completed = True
+    return instance
@@ -4,7 +4,10 @@ from .views import (
     BannerViewSet,
     ProductCategoryViewSet,
     ProductViewSet,
-    PriceViewSet
+    PriceViewSet,
+    SuggestionViewSet,
+    SyncViewSet,
+    UploadViewSet
 )
 
 # Create a router and register ViewSets
@@ -13,6 +16,9 @@ router.register(r'banners', BannerViewSet, basename='banner')
 router.register(r'categories', ProductCategoryViewSet, basename='category')
 router.register(r'products', ProductViewSet, basename='product')
 router.register(r'prices', PriceViewSet, basename='price')
+router.register(r'suggestions', SuggestionViewSet, basename='suggestion')
+router.register(r'sync', SyncViewSet, basename='sync')
+router.register(r'uploads', UploadViewSet, basename='upload')
 
 # Define app name for namespacing
 app_name = 'adminapp'
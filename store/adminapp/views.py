@@ -1,16 +1,102 @@
-from rest_framework import viewsets, filters
+from rest_framework import viewsets, filters, status
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
+from django.db import transaction
+from django.http import StreamingHttpResponse
 from django_filters.rest_framework import DjangoFilterBackend
-from .models import Banner, ProductCategory, Product, Price
+from . import banners, batch, jobs, similarity, sync, uploads
+from .suggest import index as suggest_index
+from .models import Banner, ProductCategory, Product, Price, Upload
 from .serializers import (
     BannerSerializer, 
     ProductCategorySerializer, 
     ProductSerializer, 
-    PriceSerializer
+    PriceSerializer,
+    UploadSerializer,
+    UploadFinalizeSerializer
 )
 
 
+def enqueue_image_checks(instance, *fields):
+    """Verify freshly uploaded images in the background once the row is committed"""
+    model = instance._meta.model_name
+    for field in fields:
+        if getattr(instance, field):
+            transaction.on_commit(lambda field=field: jobs.enqueue(
+                'adminapp.tasks.verify_image', {'model': model, 'pk': instance.pk, 'field': field}
+            ))
+
+
+class BatchMixin:
+    """
+    Adds /batch/ to a ViewSet: POST creates, PATCH updates and DELETE deletes a list of items
+    The whole batch is validated first and written in one transaction
+    """
+    batch_create = None
+    batch_update = None
+
+    @action(detail=False, methods=['post', 'patch', 'delete'], url_path='batch')
+    def batch(self, request):
+        model = self.get_queryset().model
+        try:
+            if request.method == 'DELETE':
+                return Response({'deleted': batch.delete_rows(model, request.data)})
+            if request.method == 'POST':
+                objs = self.batch_create(request.data)
+            else:
+                objs = self.batch_update(request.data)
+        except batch.BatchError as exc:
+            return Response({'errors': exc.errors}, status=status.HTTP_400_BAD_REQUEST)
+        serializer = self.get_serializer(objs, many=True)
+        code = status.HTTP_201_CREATED if request.method == 'POST' else status.HTTP_200_OK
+        return Response(serializer.data, status=code)
+
+
+class StreamingListMixin:
+    """
+    Adds opt-in ?stream=1 to list: the JSON array is rendered chunk by chunk from a queryset iterator
+    Output is byte-identical to the regular list, but only one chunk of rows is in memory at a time
+    """
+    stream_chunk_size = 500
+
+    def list(self, request, *args, **kwargs):
+        streaming = request.query_params.get('stream', '').lower() in ('1', 'true', 'yes')
+        if not streaming or self.paginator is not None or not isinstance(request.accepted_renderer, JSONRenderer):
+            return super().list(request, *args, **kwargs)
+        queryset = self.filter_queryset(self.get_queryset())
+        renderer = request.accepted_renderer
+        return StreamingHttpResponse(self._stream(queryset, renderer), content_type=renderer.media_type)
+
+    def _stream(self, queryset, renderer):
+        media_type = self.request.accepted_media_type
+        context = {'view': self, 'request': self.request, 'response': None}
+        # An indented array closes with a newline before its bracket; "; indent=N" in Accept asks for one
+        closing = b'\n]' if renderer.get_indent(media_type, context) is not None else b']'
+        # One serializer for all chunks: serializers reference each other in cycles, so one per
+        # chunk (holding its rows and cached .data) would linger until the garbage collector runs
+        serializer = self.get_serializer(many=True)
+
+        def render(chunk, first):
+            # Rendering a list and dropping its brackets gives the same bytes as the
+            # corresponding slice of the full array, separators included
+            rendered = renderer.render(serializer.to_representation(chunk), media_type, context)
+            return (b'' if first else b',') + rendered[1:-len(closing)]
+
+        yield b'['
+        chunk, first = [], True
+        for obj in queryset.iterator(chunk_size=self.stream_chunk_size):
+            chunk.append(obj)
+            if len(chunk) == self.stream_chunk_size:
+                yield render(chunk, first)
+                chunk, first = [], False
+        if chunk:
+            yield render(chunk, first)
+            first = False
+        yield b']' if first else closing  # An empty array is "[]" even when indented
+
+
 class BannerViewSet(viewsets.ModelViewSet):
     """
     ViewSet for Banner model
@@ -22,31 +108,69 @@ class BannerViewSet(viewsets.ModelViewSet):
     filterset_fields = ['active']
     search_fields = ['name']
 
+    def perform_create(self, serializer):
+        enqueue_image_checks(serializer.save(), 'image')
+
+    def perform_update(self, serializer):
+        instance = serializer.save()
+        if 'image' in serializer.validated_data:
+            enqueue_image_checks(instance, 'image')
+
     @action(detail=False, methods=['get'])
     def active_banners(self, request):
-        """Get only active banners"""
-        active = Banner.objects.filter(active=True)
-        serializer = self.get_serializer(active, many=True)
+        """Get the banners that are active and inside their schedule window"""
+        serializer = self.get_serializer(banners.active_banners.get(), many=True)
         return Response(serializer.data)
 
 
-class ProductCategoryViewSet(viewsets.ModelViewSet):
+class ProductCategoryViewSet(BatchMixin, viewsets.ModelViewSet):
     """
     ViewSet for ProductCategory model
-    Provides CRUD operations for product categories
+    Provides CRUD and batch operations for product categories
     """
+    batch_create = staticmethod(batch.create_categories)
+    batch_update = staticmethod(batch.update_categories)
     queryset = ProductCategory.objects.all()
     serializer_class = ProductCategorySerializer
     lookup_field = 'slug'
     filter_backends = [filters.SearchFilter]
     search_fields = ['category', 'slug']
 
+    @action(detail=False, methods=['get'])
+    def tree(self, request):
+        """Get the whole category hierarchy with product counts"""
+        categories = list(ProductCategory.objects.order_by('path'))
+        nodes, roots = {}, []
+        # Ordered by path, every parent comes before its children
+        for category in categories:
+            node = nodes[category.pk] = {
+                'id': category.pk,
+                'category': category.category,
+                'slug': category.slug,
+                'product_count': category.product_count,
+                'total_product_count': category.product_count,
+                'children': [],
+            }
+            if category.parent_id in nodes:
+                nodes[category.parent_id]['children'].append(node)
+            else:
+                roots.append(node)
+        for category in reversed(categories):
+            if category.parent_id in nodes:
+                nodes[category.parent_id]['total_product_count'] += nodes[category.pk]['total_product_count']
+        for node in nodes.values():
+            node['children'].sort(key=lambda child: child['category'])
+        roots.sort(key=lambda node: node['category'])
+        return Response(roots)
+
 
-class ProductViewSet(viewsets.ModelViewSet):
+class ProductViewSet(StreamingListMixin, BatchMixin, viewsets.ModelViewSet):
     """
     ViewSet for Product model
-    Provides CRUD operations for products
+    Provides CRUD and batch operations for products
     """
+    batch_create = staticmethod(batch.create_products)
+    batch_update = staticmethod(batch.update_products)
     queryset = Product.objects.select_related('category').all()
     serializer_class = ProductSerializer
     filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
@@ -55,21 +179,55 @@ class ProductViewSet(viewsets.ModelViewSet):
     ordering_fields = ['created_at', 'product_name']
     ordering = ['-created_at']
 
+    def perform_create(self, serializer):
+        enqueue_image_checks(serializer.save(), 'image1', 'image2')
+
+    def perform_update(self, serializer):
+        instance = serializer.save()
+        changed = [f for f in ('image1', 'image2') if f in serializer.validated_data]
+        enqueue_image_checks(instance, *changed)
+
     @action(detail=False, methods=['get'], url_path='by-category/(?P<category_slug>[-\\w]+)')
     def by_category(self, request, category_slug=None):
-        """Get products by category slug"""
-        products = self.queryset.filter(category__slug=category_slug)
+        """Get products by category slug, optionally including its subcategories"""
+        if request.query_params.get('descendants', '').lower() in ('1', 'true', 'yes'):
+            # The root's path is read first: a literal prefix lets the subtree filter use
+            # the path index, which a LIKE against a subquery cannot
+            root = ProductCategory.objects.filter(slug=category_slug).values_list('path', flat=True).first()
+            if root is None:
+                products = self.queryset.none()
+            else:
+                products = self.queryset.filter(category__in=ProductCategory.descendants_of(root))
+        else:
+            products = self.queryset.filter(category__slug=category_slug)
         serializer = self.get_serializer(products, many=True)
         return Response(serializer.data)
     
+    @action(detail=True, methods=['get'])
+    def similar(self, request, pk=None):
+        """Get products whose photos look most like this product's"""
+        product = self.get_object()
+        try:
+            limit = max(1, min(int(request.query_params.get('limit', 12)), 50))
+        except ValueError:
+            limit = 12
+        same_category = request.query_params.get('same_category', '').lower() in ('1', 'true', 'yes')
+        ranked = similarity.index.similar(product, limit, same_category)
+        products = self.queryset.in_bulk([pk for pk, _ in ranked])
+        results = []
+        for pk, distance in ranked:
+            if pk in products:
+                results.append({**self.get_serializer(products[pk]).data, 'distance': distance})
+        return Response(results)
+
     @action(detail=False, methods=['get'])
     def latest_featured(self, request):
-        latest_products = Product.objects.all().order_by('-created_at')[:6]  # top 6
+        latest_products = self.queryset.order_by('-created_at')[:6]  # top 6
         serializer = self.get_serializer(latest_products, many=True)
         return Response(serializer.data)
 
 
-class PriceViewSet(viewsets.ModelViewSet):
+class PriceViewSet(StreamingListMixin, viewsets.ModelViewSet):
     """
     ViewSet for Price model
     Provides CRUD operations for gold and silver prices
@@ -86,3 +244,107 @@ class PriceViewSet(viewsets.ModelViewSet):
             serializer = self.get_serializer(latest_price)
             return Response(serializer.data)
         return Response({'message': 'No prices available'}, status=404)
+
+
+class SuggestionViewSet(viewsets.ViewSet):
+    """
+    Typeahead suggestions for the search box
+    Answers prefix queries on product name, product_id and category from an in-memory index
+    """
+    throttle_scope = 'search'
+
+    def list(self, request):
+        suggest_index.ensure_fresh()
+        query = request.query_params.get('q', '').strip()
+        try:
+            limit = min(int(request.query_params.get('limit', 10)), 50)
+        except ValueError:
+            limit = 10
+        if not query:
+            return Response([])
+        results = []
+        for kind, pk, label, slug in suggest_index.search(query, limit):
+            item = {'type': kind, 'id': pk, 'label': label}
+            if slug:
+                item['slug'] = slug
+            results.append(item)
+        return Response(results)
+
+
+class SyncViewSet(viewsets.ViewSet):
+    """
+    Delta-sync feed for catalog mirrors and mobile clients
+    Returns rows changed or deleted since the given sync token
+    """
+
+    def list(self, request):
+        try:
+            limit = max(1, min(int(request.query_params.get('limit', 500)), 1000))
+        except ValueError:
+            limit = 500
+        try:
+            data = sync.changes_since(request.query_params.get('since'), limit, self.get_serializer_context())
+        except sync.InvalidToken as exc:
+            raise ValidationError({'since': str(exc)})
+        return Response(data)
+
+    def get_serializer_context(self):
+        return {'request': self.request, 'view': self}
+
+
+class UploadViewSet(viewsets.GenericViewSet):
+    """
+    Resumable chunked uploads for banner and product images
+    See adminapp.uploads for the protocol
+    """
+    queryset = Upload.objects.all()
+    serializer_class = UploadSerializer
+
+    @property
+    def throttle_scope(self):
+        # Starting uploads reserves disk space; sending chunks and finalizing are not limited
+        return 'uploads' if getattr(self, 'action', None) == 'create' else None
+
+    def create(self, request):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        try:
+            uploads.check_capacity(serializer.validated_data['size'])
+        except uploads.UploadError as exc:
+            return Response({'message': str(exc), **exc.extra}, status=exc.status)
+        upload = serializer.save()
+        uploads.start(upload)
+        data = dict(serializer.data, chunk_size=uploads.max_chunk_size())
+        return Response(data, status=status.HTTP_201_CREATED)
+
+    def retrieve(self, request, pk=None):
+        return Response(self.get_serializer(self.get_object()).data)
+
+    def update(self, request, pk=None):
+        upload = self.get_object()
+        if upload.completed:
+            return Response({'message': 'Upload is already finalized.'}, status=status.HTTP_409_CONFLICT)
+        content_length = request.META.get('CONTENT_LENGTH')
+        try:
+            offset = uploads.write_chunk(
+                upload,
+                request.stream,
+                request.META.get('HTTP_CONTENT_RANGE'),
+                int(content_length) if content_length else None,
+            )
+        except uploads.UploadError as exc:
+            return Response({'message': str(exc), **exc.extra}, status=exc.status)
+        return Response({'id': upload.pk, 'offset': offset, 'size': upload.size})
+
+    @action(detail=True, methods=['post'])
+    def finalize(self, request, pk=None):
+        upload = self.get_object()
+        serializer = UploadFinalizeSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        try:
+            instance = uploads.finalize(upload, **serializer.validated_data)
+        except uploads.UploadError as exc:
+            return Response({'message': str(exc), **exc.extra}, status=exc.status)
+        enqueue_image_checks(instance, serializer.validated_data['field'])
+        target_serializer = BannerSerializer if isinstance(instance, Banner) else ProductSerializer
+        return Response(target_serializer(instance, context=self.get_serializer_context()).data)
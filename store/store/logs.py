@@ -0,0 +1,196 @@
+"""
+Queue-based logging.
+
+Django calls `configure` with LOGGING (see LOGGING_CONFIG in settings). It
+applies the dict config as usual, then puts a bounded queue in front of
+every handler: loggers only enqueue their records, and one background
+listener thread writes them out. A slow stdout or log collector then delays
+the listener instead of the request. If the queue is full, records are
+dropped and counted rather than blocking; the count is reported on stderr
+when the queue is flushed. Handlers that need the live exception and request
+(AdminEmailHandler builds its report from the traceback's frames) stay
+attached directly; they only fire on errors. The queue is drained and the handlers are flushed
+at interpreter exit, and the listener is restarted in processes forked after
+configuration (preloading servers).
+"""
+import atexit
+import copy
+import json
+import logging
+import logging.config
+import logging.handlers
+import os
+import queue
+import sys
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.utils.log import AdminEmailHandler
+
+# Attributes every LogRecord has; anything else was passed with extra=
+_RECORD_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+_plain = logging.Formatter()
+_listener = None
+
+
+class JSONFormatter(logging.Formatter):
+    """One JSON object per line with the record's extra fields at the top level"""
+
+    def format(self, record):
+        data = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS and not key.startswith('_'):
+                data[key] = value
+        if record.exc_info:
+            data['exc_info'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            data['exc_info'] = record.exc_text
+        return json.dumps(data, default=str)
+
+
+class QueueHandler(logging.handlers.QueueHandler):
+    """Enqueues records together with the handlers that should write them"""
+
+    def __init__(self, queue, targets):
+        super().__init__(queue)
+        self.targets = targets
+        self.dropped = 0
+
+    def prepare(self, record):
+        # Merge args and render the traceback now: neither is safe to touch from the
+        # listener thread. Unlike the stdlib version, the traceback stays in exc_text
+        # so formatters can still place it.
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        record.msg, record.args = record.message, None
+        if record.exc_info:
+            record.exc_text = _plain.formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait((self.targets, record))
+        except queue.Full:
+            self.dropped += 1
+
+
+class QueueListener(logging.handlers.QueueListener):
+    """Writes each dequeued record to the handlers it was enqueued for"""
+    sentinel_timeout = 5.0  # Seconds stop() waits for room in a full queue
+
+    def __init__(self, queue):
+        super().__init__(queue, respect_handler_level=True)
+        self.discarded = 0
+
+    def enqueue_sentinel(self):
+        # The queue is full in exactly the overload it exists for. Wait for the thread
+        # to make room; if it is stuck, give up the oldest record rather than fail at exit
+        try:
+            self.queue.put(self._sentinel, timeout=self.sentinel_timeout)
+            return
+        except queue.Full:
+            pass
+        while True:
+            try:
+                self.queue.get_nowait()
+                self.discarded += 1
+            except queue.Empty:
+                pass
+            try:
+                self.queue.put_nowait(self._sentinel)
+                return
+            except queue.Full:
+                continue
+
+    def handle(self, item):
+        targets, record = item
+        for handler in targets:
+            if record.levelno >= handler.level:
+                handler.handle(record)
+
+
+def _queueable(handler):
+    return not isinstance(handler, (QueueHandler, AdminEmailHandler))
+
+
+def _queued_loggers():
+    yield logging.getLogger()
+    for logger in list(logging.Logger.manager.loggerDict.values()):
+        if isinstance(logger, logging.Logger):
+            yield logger
+
+
+def configure(logging_settings):
+    """LOGGING_CONFIG entry point: apply the dict config, then queue every handler"""
+    global _listener
+    if logging_settings:
+        logging.config.dictConfig(logging_settings)
+    if not getattr(settings, 'LOG_QUEUE', True):
+        return
+
+    log_queue = queue.Queue(getattr(settings, 'LOG_QUEUE_SIZE', 10000))
+    for logger in _queued_loggers():
+        queued = [h for h in logger.handlers if isinstance(h, QueueHandler)]
+        for handler in queued:
+            handler.queue = log_queue  # Left over from an earlier configure()
+        targets = [h for h in logger.handlers if _queueable(h)]
+        if targets:
+            logger.handlers = [h for h in logger.handlers if h not in targets]
+            logger.addHandler(QueueHandler(log_queue, targets))
+
+    if _listener is not None:
+        _listener.stop()
+    _listener = QueueListener(log_queue)
+    _listener.start()
+
+
+def dropped():
+    """Records dropped because the queue was full, across all loggers"""
+    return sum(
+        handler.dropped for logger in _queued_loggers()
+        for handler in logger.handlers if isinstance(handler, QueueHandler)
+    ) + (_listener.discarded if _listener is not None else 0)
+
+
+def flush():
+    """Write out everything queued so far and report any dropped records; called at exit"""
+    if _listener is not None and _listener._thread is not None:
+        _listener.stop()
+    count = dropped()
+    if count:
+        # Written directly: the handlers are what could not keep up
+        sys.stderr.write(f"store.logs: dropped {count} log records because the queue was full (pid {os.getpid()})\n")
+        sys.stderr.flush()
+        for logger in _queued_loggers():
+            for handler in logger.handlers:
+                if isinstance(handler, QueueHandler):
+                    handler.dropped = 0
+        if _listener is not None:
+            _listener.discarded = 0
+
+
+def _restart_after_fork():
+    # The listener thread does not survive fork(); records queued in the parent are left to it
+    if _listener is not None and _listener._thread is not None:
+        _listener._thread = None
+        _listener.queue = queue.Queue(_listener.queue.maxsize)
+        _listener.discarded = 0
+        for logger in _queued_loggers():
+            for handler in logger.handlers:
+                if isinstance(handler, QueueHandler):
+                    handler.queue = _listener.queue
+                    handler.dropped = 0  # Counted, and reported, by the parent
+        _listener.start()
+
+
+# Registered after logging's own atexit hook, so it runs first and the handlers
+# are still open while the queue drains
+atexit.register(flush)
+os.register_at_fork(after_in_child=_restart_after_fork)
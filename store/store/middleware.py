@@ -0,0 +1,173 @@
+"""
+Project-level middleware.
+"""
+import logging
+import random
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.handlers.exception import convert_exception_to_response
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.utils.module_loading import import_string
+
+access_logger = logging.getLogger('store.access')
+
+
+class _Chain:
+    """A middleware stack built the same way Django's BaseHandler builds MIDDLEWARE"""
+
+    def __init__(self, middleware_paths, get_response):
+        self.view_middleware = []
+        self.template_response_middleware = []
+        self.exception_middleware = []
+
+        handler = get_response
+        for middleware_path in reversed(middleware_paths):
+            middleware = import_string(middleware_path)
+            try:
+                mw_instance = middleware(handler)
+            except MiddlewareNotUsed:
+                continue
+            if hasattr(mw_instance, 'process_view'):
+                self.view_middleware.insert(0, mw_instance.process_view)
+            if hasattr(mw_instance, 'process_template_response'):
+                self.template_response_middleware.append(mw_instance.process_template_response)
+            if hasattr(mw_instance, 'process_exception'):
+                self.exception_middleware.append(mw_instance.process_exception)
+            handler = convert_exception_to_response(mw_instance)
+        self.handler = handler
+
+
+class PathScopedMiddleware:
+    """
+    Runs a different middleware stack depending on the request path.
+
+    SCOPED_MIDDLEWARE maps URL prefixes to lists of middleware paths; the
+    longest matching prefix wins, and '' acts as the fallback. This lets
+    /api/ skip the session, CSRF, auth and messages middleware that only the
+    admin needs, while middleware listed in MIDDLEWARE (CORS, security
+    headers) still runs for every request.
+    """
+    sync_capable = True
+    async_capable = False
+
+    def __init__(self, get_response):
+        scopes = settings.SCOPED_MIDDLEWARE
+        self.chains = sorted(
+            ((prefix, _Chain(paths, get_response)) for prefix, paths in scopes.items()),
+            key=lambda item: len(item[0]),
+            reverse=True,
+        )
+        self.passthrough = _Chain([], get_response)
+
+    def _chain_for(self, request):
+        path = request.path_info
+        for prefix, chain in self.chains:
+            if path.startswith(prefix):
+                return chain
+        return self.passthrough
+
+    def __call__(self, request):
+        return self._chain_for(request).handler(request)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        for process_view in self._chain_for(request).view_middleware:
+            response = process_view(request, view_func, view_args, view_kwargs)
+            if response is not None:
+                return response
+        return None
+
+    def process_template_response(self, request, response):
+        for process_template_response in self._chain_for(request).template_response_middleware:
+            response = process_template_response(request, response)
+        return response
+
+    def process_exception(self, request, exception):
+        for process_exception in self._chain_for(request).exception_middleware:
+            response = process_exception(request, exception)
+            if response is not None:
+                return response
+        return None
+
+
+class _QueryCounter:
+    """Database execute wrapper that counts the queries run through it"""
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+class AccessLogMiddleware:
+    """
+    Logs one structured record per request to the 'store.access' logger.
+
+    Each record carries the method, path, view name, status, duration, number
+    of database queries and response size. ACCESS_LOG_SAMPLING maps view names
+    to the fraction of their successful requests to log (errors are always
+    logged); the rate is included so totals can be scaled back up. Streaming
+    responses are logged once their body has been sent (or the client went
+    away), so the size, duration and queries include the streamed part.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.sampling = getattr(settings, 'ACCESS_LOG_SAMPLING', {})
+
+    @staticmethod
+    def _counting(counter):
+        stack = ExitStack()
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(counter))
+        return stack
+
+    def __call__(self, request):
+        counter = _QueryCounter()
+        start = time.perf_counter()
+        with self._counting(counter):
+            response = self.get_response(request)
+        if response.streaming:
+            response.streaming_content = self._stream(request, response, response.streaming_content, counter, start)
+        else:
+            self._log(request, response, counter, start, len(response.content))
+        return response
+
+    def _stream(self, request, response, content, counter, start):
+        content = iter(content)
+        sent = 0
+        try:
+            while True:
+                # Streamed lists run their queries here, after the view has returned
+                with self._counting(counter):
+                    chunk = next(content, None)
+                if chunk is None:
+                    break
+                sent += len(chunk)
+                yield chunk
+        finally:
+            self._log(request, response, counter, start, sent)
+
+    def _log(self, request, response, counter, start, response_bytes):
+        duration = time.perf_counter() - start
+        match = request.resolver_match
+        view = match.view_name if match else None
+        rate = self.sampling.get(view, 1.0)
+        if response.status_code < 400 and rate < 1.0 and random.random() >= rate:
+            return
+        access_logger.info(
+            '%s %s %s', request.method, request.get_full_path(), response.status_code,
+            extra={
+                'method': request.method,
+                'path': request.path,
+                'view': view,
+                'status': response.status_code,
+                'duration_ms': round(duration * 1000, 2),
+                'db_queries': counter.count,
+                'response_bytes': response_bytes,
+                'sample_rate': rate,
+            },
+        )
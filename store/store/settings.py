@@ -10,8 +10,8 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
-from django.templatetags.static import static
 from django.urls import reverse_lazy
 from django.utils.translation import gettext_lazy as _
 
@@ -56,15 +56,31 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'store.middleware.AccessLogMiddleware',  # Outermost, so timings cover every other middleware
     'corsheaders.middleware.CorsMiddleware',  # Must be at top
     'django.middleware.security.SecurityMiddleware',
-    'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
+    'store.middleware.PathScopedMiddleware',  # Runs SCOPED_MIDDLEWARE below
+    'django.middleware.clickjacking.XFrameOptionsMiddleware',
+]
+
+# Per-prefix middleware run by PathScopedMiddleware (longest prefix wins,
+# '' is the fallback). The anonymous storefront API skips sessions, CSRF,
+# auth and messages, which only the admin needs.
+ADMIN_MIDDLEWARE = [
+    'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
-    'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
+SCOPED_MIDDLEWARE = {
+    '/admin/': ADMIN_MIDDLEWARE,
+    '/api/': [],
+    '': ADMIN_MIDDLEWARE,
+}
+
+# The admin checks only look at MIDDLEWARE; SCOPED_MIDDLEWARE provides these for /admin/
+SILENCED_SYSTEM_CHECKS = ['admin.E408', 'admin.E409', 'admin.E410']
 
 ROOT_URLCONF = 'store.urls'
 
@@ -140,6 +156,12 @@ STATIC_ROOT = BASE_DIR / 'staticfiles'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Resumable uploads (see adminapp/uploads.py). Partial files stay outside MEDIA_ROOT
+# so they are never served; run `manage.py expireuploads` from cron to drop abandoned ones.
+CHUNKED_UPLOAD_DIR = BASE_DIR / 'partial_uploads'
+CHUNKED_UPLOAD_EXPIRY = 24 * 3600  # Seconds an upload may stay unfinished
+CHUNKED_UPLOAD_MAX_PENDING = 2 * 1024 * 1024 * 1024  # Bytes all unfinished uploads may reserve
+
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
@@ -159,9 +181,51 @@ REST_FRAMEWORK = {
         'rest_framework.filters.SearchFilter',
         'rest_framework.filters.OrderingFilter',
     ],
+    # The storefront API is anonymous: /api/ runs without the session and auth
+    # middleware (see SCOPED_MIDDLEWARE), so there is no logged-in user to check
+    'DEFAULT_PERMISSION_CLASSES': [
+        'rest_framework.permissions.AllowAny',
+    ],
+    # Token buckets in shared memory, per client IP (see adminapp/throttling.py)
+    'DEFAULT_THROTTLE_CLASSES': [
+        'adminapp.throttling.TokenBucketThrottle',
+    ],
+    'DEFAULT_THROTTLE_RATES': {
+        'search': '120/min',  # ?search= queries and typeahead suggestions
+        'list': '600/min',    # Collection reads
+        'uploads': '30/hour', # Starting chunked uploads
+    },
+    # Throttling keys on the client address. 0 uses REMOTE_ADDR and ignores X-Forwarded-For, which
+    # clients can set freely. Behind N trusted reverse proxies, set N: the address the outermost
+    # proxy appended to X-Forwarded-For is used
+    'NUM_PROXIES': int(os.environ.get('NUM_PROXIES', 0)),
     # 'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     # 'PAGE_SIZE': 100,
 }
+THROTTLE_SLOTS = 65536  # Buckets in the shared table; size it above the number of concurrently active clients
+# Names the shared table file; deployments of the same code under different
+# paths get separate tables by default (a hash of BASE_DIR)
+THROTTLE_NAMESPACE = os.environ.get('THROTTLE_NAMESPACE')
+
+
+# Static JSON snapshots of the public catalog (see adminapp/snapshots.py).
+# Point this at a directory the front proxy serves to enable publishing.
+CATALOG_SNAPSHOT_ROOT = None
+CATALOG_SNAPSHOT_PAGE_SIZE = 100
+CATALOG_SNAPSHOT_ASYNC = True  # Publish from the runjobs worker; False renders on the committing request
+
+# Live banners (see adminapp/banners.py). Saves are announced through a version
+# key in this cache; with the default local-memory cache, other processes only
+# notice them once their copy is BANNER_CACHE_MAX_AGE seconds old.
+BANNER_CACHE = 'default'
+BANNER_CACHE_MAX_AGE = 60
+
+# Background jobs (see adminapp/jobs.py)
+JOB_RETENTION = 7 * 86400  # Seconds done and failed jobs are kept before runjobs deletes them
+
+# Delta-sync feed (see adminapp/sync.py)
+# Seconds tombstones are kept before runjobs deletes them; clients whose token is older resync in full
+SYNC_TOMBSTONE_RETENTION = 30 * 86400
 
 
 # CORS Configuration
@@ -195,7 +259,9 @@ UNFOLD = {
     "SITE_URL": "/",
     "SITE_SYMBOL": "💎",  # Appears in browser tab
     
-    # Favicon (Optional - add your logo files to static folder)
+    # Favicon (Optional - add your logo files to static folder and
+    # `from django.templatetags.static import static` above; it is left out by
+    # default because importing it loads the whole template engine at startup)
     # "SITE_FAVICON": lambda request: static("icon.svg"),
     
     # Logo configuration (Optional)
@@ -305,13 +371,42 @@ UNFOLD = {
 }
 
 
-# Logging Configuration (Optional but recommended)
+# Logging Configuration
+# Records are queued on the request thread and written by a background listener
+# (see store/logs.py). Access logs are JSON lines on stdout unless
+# ACCESS_LOG_FILE points at a file, which is then rotated by size.
+LOGGING_CONFIG = 'store.logs.configure'
+LOG_QUEUE_SIZE = 10000  # Records beyond this are dropped instead of blocking requests
+ACCESS_LOG_FILE = os.environ.get('ACCESS_LOG_FILE')
+
+# View name -> fraction of successful requests written to the access log
+ACCESS_LOG_SAMPLING = {
+    'adminapp:price-latest': 0.1,
+}
+
 LOGGING = {
     'version': 1,
     'disable_existing_loggers': False,
+    'formatters': {
+        'json': {
+            '()': 'store.logs.JSONFormatter',
+        },
+    },
     'handlers': {
         'console': {
             'class': 'logging.StreamHandler',
+            'formatter': 'json',
+        },
+        'access': {
+            'class': 'logging.handlers.RotatingFileHandler',
+            'filename': ACCESS_LOG_FILE,
+            'maxBytes': 50 * 1024 * 1024,
+            'backupCount': 5,
+            'formatter': 'json',
+        } if ACCESS_LOG_FILE else {
+            'class': 'logging.StreamHandler',
+            'stream': 'ext://sys.stdout',
+            'formatter': 'json',
         },
     },
     'root': {
@@ -324,5 +419,10 @@ LOGGING = {
             'level': 'INFO',
             'propagate': False,
         },
+        'store.access': {
+            'handlers': ['access'],
+            'level': 'INFO',
+            'propagate': False,
+        },
     },
 }
@@ -0,0 +1,62 @@
+"""
+Slim settings profile for workers that only serve the REST API.
+
+Use with `store.wsgi_api` (or DJANGO_SETTINGS_MODULE=store.settings_api).
+It drops the Unfold admin, sessions, messages and static files, renders JSON
+only and skips DRF's optional pygments and yaml imports, so workers start
+faster and use less memory. (django.contrib.admin is still imported as a
+module, by DRF's schema generator, but it is not installed or routed.) `/admin/` is not
+routed in this profile; run the admin on pods using `store.settings`.
+
+Check startup cost with `python manage.py importreport --settings-module store.settings_api`.
+"""
+
+import sys
+
+from .settings import *  # noqa: F401,F403
+
+# rest_framework.compat imports these when they are installed, for the browsable
+# API's syntax highlighting and YAML schemas. Neither is rendered here, so make
+# the imports fail and fall back the way they do when the packages are absent.
+for _module in ('pygments', 'yaml'):
+    sys.modules.setdefault(_module, None)
+
+INSTALLED_APPS = [
+    'django.contrib.auth',
+    'django.contrib.contenttypes',
+
+    # Third-party apps
+    'corsheaders',
+    'rest_framework',
+    'django_filters',
+
+    # Your app
+    'adminapp',
+]
+
+MIDDLEWARE = [
+    'store.middleware.AccessLogMiddleware',
+    'corsheaders.middleware.CorsMiddleware',  # Must be at top
+    'django.middleware.security.SecurityMiddleware',
+    'django.middleware.common.CommonMiddleware',
+]
+
+ROOT_URLCONF = 'store.urls_api'
+
+WSGI_APPLICATION = 'store.wsgi_api.application'
+
+# No templates are rendered without the browsable API
+TEMPLATES = []
+
+REST_FRAMEWORK = {
+    **REST_FRAMEWORK,
+    'DEFAULT_RENDERER_CLASSES': [
+        'rest_framework.renderers.JSONRenderer',
+    ],
+    # The public API is anonymous; skip session and basic auth lookups
+    'DEFAULT_AUTHENTICATION_CLASSES': [],
+    'UNAUTHENTICATED_USER': None,
+}
+
+# Admin-only configuration
+del UNFOLD
@@ -0,0 +1,6 @@
+from django.urls import path, include
+
+# URLconf for the API-only profile (store.settings_api)
+urlpatterns = [
+    path('api/', include('adminapp.urls', namespace='adminapp')),
+]
@@ -0,0 +1,14 @@
+"""
+WSGI config for API-only workers.
+
+Same as store.wsgi but boots the slim store.settings_api profile, which
+loads only what the REST API needs.
+"""
+
+import os
+
+from django.core.wsgi import get_wsgi_application
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'store.settings_api')
+
+application = get_wsgi_application()